@@ -0,0 +1,223 @@
+# src/activations.py
+
+import json
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.profiler import record_function
+
+from lm import score_tokenized
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def add_activation_args(parser):
+    parser.add_argument(
+        "--activations",
+        nargs="?",
+        const="",
+        default=None,
+        help="Export hidden states of the conditional scoring pass to DIR "
+             "(default: <output stem>.activations/)",
+    )
+    parser.add_argument(
+        "--layers",
+        default="all",
+        help="Hidden-state layers to export: 'all' or comma-separated indices "
+             "(0 = embeddings, negative = from the top), e.g. 8,16,-1",
+    )
+
+
+def activations_dir(args, output):
+    """Export directory, or None without --activations."""
+
+    if args.activations is None:
+        return None
+
+    if args.activations:
+        return Path(args.activations)
+
+    output = Path(output)
+    return output.with_name(output.stem + ".activations")
+
+
+def parse_layers(spec, n_layers):
+    """
+    hidden_states indices for `spec`; index 0 is the embedding output and
+    index i the output of decoder layer i, so there are n_layers + 1.
+    """
+    n_states = n_layers + 1
+
+    if spec == "all":
+        return list(range(n_states))
+
+    layers = []
+
+    for part in spec.split(","):
+
+        layer = int(part)
+
+        if not -n_states <= layer < n_states:
+            raise ValueError(f"Layer {layer} out of range for {n_layers} layers")
+
+        layers.append(layer % n_states)
+
+    return layers
+
+
+# ============================================================
+# Capture
+# ============================================================
+
+def span_start(prompt_ids, full_ids):
+    """First position of the option in prompt + option (tokens shared with the prompt alone come before it)."""
+
+    n = 0
+
+    for a, b in zip(prompt_ids, full_ids):
+        if a != b:
+            break
+        n += 1
+
+    return min(n, len(full_ids) - 1)
+
+
+def score_with_states(model, tokenized, prompt_ids, layers):
+    """
+    score_options() on pre-tokenized choices, also pooling the hidden states
+    of `layers` from the same forward passes.
+
+    Returns:
+        (scores, pred_ix)
+        question: (n_layers, hidden) float16 at the last prompt token
+        options:  (n_options, n_layers, hidden) float16, mean over each option span
+    """
+    scores = []
+    options = []
+    question = None
+
+    for inputs, option_len in tokenized:
+
+        score, hidden = score_tokenized(model, inputs, option_len, layers=layers)
+
+        start = span_start(prompt_ids, inputs["input_ids"][0].tolist())
+
+        with record_function("pool states"):
+
+            # The prompt prefix is identical in every option's pass
+            if question is None:
+                question = hidden[:, start - 1]
+
+            options.append(hidden[:, start:].float().mean(dim=1))
+
+        scores.append(score)
+
+    question = question.to(torch.float16).cpu().numpy()
+    options = torch.stack(options).to(torch.float16).cpu().numpy()
+
+    return (scores, int(np.argmax(scores))), question, options
+
+
+# ============================================================
+# Memory-Mapped Export
+# ============================================================
+
+INDEX_FILE = "index.json"
+QUESTION_FILE = "question.npy"
+OPTIONS_FILE = "options.npy"
+
+
+class ActivationWriter:
+    """
+    Streams pooled hidden states into float16 .npy memmaps:
+
+        question.npy  (n_samples, n_layers, hidden)
+        options.npy   (n_samples, n_options, n_layers, hidden)
+        index.json    row -> idx / EXP_IDX / INDEX / ABILITY / answer, plus layers and model
+
+    Row r holds the r-th sample written (of the input file, or of its --shard);
+    `idx` is the sample index in the whole file.
+    """
+
+    def __init__(self, out_dir, n_samples, n_options, layers, hidden_size, meta=None):
+
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+
+        self.layers = layers
+        self.meta = meta or {}
+        self.rows = []
+
+        self.question = np.lib.format.open_memmap(
+            self.out_dir / QUESTION_FILE,
+            mode="w+",
+            dtype=np.float16,
+            shape=(n_samples, len(layers), hidden_size),
+        )
+        self.options = np.lib.format.open_memmap(
+            self.out_dir / OPTIONS_FILE,
+            mode="w+",
+            dtype=np.float16,
+            shape=(n_samples, n_options, len(layers), hidden_size),
+        )
+
+    def write(self, row, sample, question, options, idx=None):
+
+        self.question[row] = question
+        self.options[row] = options
+
+        self.rows.append({
+            "row": row,
+            "idx": row if idx is None else idx,
+            "EXP_IDX": sample.get("EXP_IDX"),
+            "INDEX": sample.get("INDEX", "UNKNOWN"),
+            "ABILITY": sample.get("ABILITY", "UNKNOWN"),
+            "answer": sample.get("ANSWER"),
+        })
+
+    def close(self):
+
+        self.question.flush()
+        self.options.flush()
+
+        index = {
+            **self.meta,
+            "layers": self.layers,
+            "dtype": "float16",
+            "question_position": "last prompt token",
+            "option_pooling": "mean over option tokens",
+            "rows": self.rows,
+        }
+
+        with open(self.out_dir / INDEX_FILE, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+        del self.question, self.options
+
+
+def load_activations(out_dir):
+    """
+    Read-only, zero-copy view of an export.
+
+    Returns:
+        question: memmap (n_samples, n_layers, hidden)
+        options:  memmap (n_samples, n_options, n_layers, hidden)
+        index:    index.json contents; index["rows"][r] describes row r
+    """
+    out_dir = Path(out_dir)
+
+    with open(out_dir / INDEX_FILE, encoding="utf-8") as f:
+        index = json.load(f)
+
+    question = np.load(out_dir / QUESTION_FILE, mmap_mode="r")
+    options = np.load(out_dir / OPTIONS_FILE, mmap_mode="r")
+
+    return question, options, index
+
+
+def rows_by(index, key="EXP_IDX"):
+    """{key value: row} lookup, e.g. rows_by(index)[exp_idx]."""
+    return {r[key]: r["row"] for r in index["rows"]}
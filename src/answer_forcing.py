@@ -0,0 +1,101 @@
+# src/answer_forcing.py
+
+import torch
+from torch.profiler import record_function
+
+from mc import FORCE_ANSWER_SUFFIX, LETTERS
+
+
+# ============================================================
+# Letter Readout
+# ============================================================
+
+def letter_token_ids(tokenizer, prefix=FORCE_ANSWER_SUFFIX):
+    """Token id of each answer letter when it directly follows `prefix`."""
+
+    base = tokenizer(prefix, add_special_tokens=False).input_ids
+    ids = []
+
+    for letter in LETTERS:
+
+        full = tokenizer(prefix + letter, add_special_tokens=False).input_ids
+
+        if full[:len(base)] != base or len(full) != len(base) + 1:
+            raise ValueError(f"Answer letter {letter!r} is not a single token after {prefix!r}")
+
+        ids.append(full[-1])
+
+    return ids
+
+
+def letter_probs(logits, letter_ids):
+    """
+    Answer distribution from next-token logits (..., vocab).
+
+    Returns:
+        probs: (..., 4) probabilities renormalized over A-D
+        mass:  (...,) total probability the model puts on the four letters
+    """
+    log_probs = torch.log_softmax(logits.float(), dim=-1)
+    letter_log_probs = log_probs[..., letter_ids]
+
+    return torch.softmax(letter_log_probs, dim=-1), letter_log_probs.exp().sum(dim=-1)
+
+
+# ============================================================
+# Answer Forcing
+# ============================================================
+
+def prepare_forcing(tokenizer, suffix=FORCE_ANSWER_SUFFIX):
+    """(suffix token ids, letter token ids), computed once per run."""
+
+    suffix_ids = torch.tensor(tokenizer(suffix, add_special_tokens=False).input_ids)
+
+    return suffix_ids, letter_token_ids(tokenizer, suffix)
+
+
+def is_truncated(sequence, prompt_len, max_new_tokens, eos_token_id):
+    """True if generation used its whole budget without emitting EOS."""
+
+    generated = sequence[prompt_len:]
+
+    if len(generated) < max_new_tokens:
+        return False
+
+    eos = eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id]
+
+    return int(generated[-1]) not in eos
+
+
+def force_answer(model, sequence, forcing, past_key_values=None):
+    """
+    Append the answer suffix to a generated `sequence` and read the A-D
+    probabilities of the next token in a single forward pass.
+
+    With the `past_key_values` returned by generate() only the tokens not yet
+    in the cache (the last sampled token) plus the suffix are run; without
+    it (e.g. a generation-cache hit) the whole sequence is.
+    """
+    suffix_ids, letter_ids = forcing
+
+    n_cached = past_key_values.get_seq_length() if past_key_values is not None else 0
+
+    input_ids = torch.cat([sequence[n_cached:].cpu(), suffix_ids]).unsqueeze(0).to(model.device)
+    attention_mask = torch.ones(1, n_cached + input_ids.shape[1], dtype=torch.long, device=model.device)
+
+    with record_function("force answer"), torch.no_grad():
+        logits = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+        ).logits[0, -1]
+
+    probs, mass = letter_probs(logits, letter_ids)
+    probs = probs.tolist()
+
+    return {
+        "forced": True,
+        "forced_answer": LETTERS[max(range(len(LETTERS)), key=probs.__getitem__)],
+        "letter_probs": dict(zip(LETTERS, probs)),
+        "letter_mass": mass.item(),
+    }
@@ -0,0 +1,174 @@
+# src/assisted.py
+
+import json
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from telemetry import timed_generate
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def add_draft_args(parser):
+    parser.add_argument("--draft_model", default=None, help="Small draft LM for assisted (speculative) decoding; must share the tokenizer")
+    parser.add_argument("--greedy", action="store_true", help="Greedy decoding (outputs are identical with and without --draft_model)")
+    parser.add_argument(
+        "--speedup_baseline",
+        default=None,
+        help="Telemetry JSON of the same run without --draft_model, to report measured instead of estimated speedup",
+    )
+
+
+def load_draft(args, model):
+    """The --draft_model in the main model's dtype, on its device."""
+
+    if not args.draft_model:
+        return None
+
+    print("Loading draft model:", args.draft_model)
+
+    return AutoModelForCausalLM.from_pretrained(
+        args.draft_model,
+        torch_dtype=model.dtype,
+    ).to(model.device).eval()
+
+
+def decoding_kwargs(greedy, top_p):
+    """generate() sampling arguments: nucleus sampling, or greedy decoding."""
+
+    if greedy:
+        return {"do_sample": False}
+
+    return {"do_sample": True, "top_p": top_p}
+
+
+# ============================================================
+# Assisted Generation
+# ============================================================
+
+class ForwardCounter:
+    """Counts forward calls of a module while the context is active."""
+
+    def __init__(self, module):
+        self.module = module
+        self.calls = 0
+
+    def _hook(self, module, args, output):
+        self.calls += 1
+
+    def __enter__(self):
+        self.handle = self.module.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        self.handle.remove()
+
+
+def assisted_generate(model, draft, inputs, **kwargs):
+    """
+    timed_generate() with `draft` proposing tokens that `model` verifies.
+
+    Every main-model forward verifies one block of draft tokens and yields
+    the accepted ones plus one token of its own, so
+        accepted = generated - verify steps
+    and every draft forward proposes one token.
+    """
+    with ForwardCounter(model) as main, ForwardCounter(draft) as small:
+        outputs, stats = timed_generate(model, inputs, assistant_model=draft, **kwargs)
+
+    accepted = max(stats["generated_tokens"] - main.calls, 0)
+
+    stats["verify_steps"] = main.calls
+    stats["draft_proposed"] = small.calls
+    stats["draft_accepted"] = min(accepted, small.calls)
+
+    return outputs, stats
+
+
+def draft_cost(model, draft):
+    """Cost of one draft forward relative to one main-model forward, by parameter count."""
+    return draft.num_parameters() / model.num_parameters()
+
+
+def estimated_speedup(summary, cost):
+    """
+    Speedup over plain decoding from the forward counts: plain decoding
+    runs one main-model forward per generated token, assisted decoding
+    one per verify step plus `cost` per draft forward.
+    """
+    steps = summary["verify_steps"] + cost * summary["draft_proposed"]
+    return summary["generated_tokens"] / steps if steps else None
+
+
+def draft_summary(records):
+    """Acceptance rate and tokens per main-model forward over all sampled runs."""
+
+    steps = sum(r.get("verify_steps", 0) for r in records)
+    proposed = sum(r.get("draft_proposed", 0) for r in records)
+    accepted = sum(r.get("draft_accepted", 0) for r in records)
+    generated = sum(r["generated_tokens"] for r in records if r.get("verify_steps"))
+
+    return {
+        "generated_tokens": generated,
+        "verify_steps": steps,
+        "draft_proposed": proposed,
+        "draft_accepted": accepted,
+        "acceptance_rate": accepted / proposed if proposed else 0.0,
+        "tokens_per_verify_step": generated / steps if steps else 0.0,
+    }
+
+
+def measured_speedup(summary, baseline_path):
+    """Generated tokens/s of this run over those of a baseline telemetry file."""
+
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["summary"]
+
+    if not baseline["generated_tokens_per_sec"]:
+        return None
+
+    return summary["generated_tokens_per_sec"] / baseline["generated_tokens_per_sec"]
+
+
+def update_draft_summary(summary, records, model, draft, speedup_baseline=None):
+    """
+    Add the assisted-decoding numbers to a telemetry summary. "speedup" is
+    estimated from the forward counts, or measured against
+    `speedup_baseline` when given.
+    """
+    assisted = draft_summary(records)
+    assisted["draft_cost"] = draft_cost(model, draft)
+    assisted["estimated_speedup"] = estimated_speedup(assisted, assisted["draft_cost"])
+
+    # Not all of the run's generated tokens: only the assisted ones
+    assisted["assisted_tokens"] = assisted.pop("generated_tokens")
+
+    summary.update(assisted)
+    summary["speedup"] = assisted["estimated_speedup"]
+    summary["speedup_source"] = "estimated"
+
+    if speedup_baseline:
+        summary["speedup"] = measured_speedup(summary, speedup_baseline)
+        summary["speedup_source"] = "measured"
+
+
+def print_draft_summary(summary):
+
+    print("Assisted decoding:")
+    print(
+        f"  acceptance rate: {summary['acceptance_rate']:.3f} "
+        f"({summary['draft_accepted']}/{summary['draft_proposed']} draft tokens)"
+    )
+    print(f"  tokens per main-model forward: {summary['tokens_per_verify_step']:.2f}")
+
+    if summary.get("estimated_speedup") is not None:
+        print(
+            f"  estimated speedup (forward counts, draft forward = {summary['draft_cost']:.3f} main): "
+            f"{summary['estimated_speedup']:.2f}x"
+        )
+
+    if summary.get("speedup_source") == "measured" and summary["speedup"] is not None:
+        print(f"  measured speedup vs baseline: {summary['speedup']:.2f}x")
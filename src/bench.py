@@ -0,0 +1,361 @@
+# src/bench.py
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import torch
+
+from telemetry import peak_memory_mb
+
+
+# ============================================================
+# Synthetic Result Files
+# ============================================================
+
+LETTERS = ["A", "B", "C", "D"]
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def synthetic_results(data, out_dir, try_times, seed=0):
+    """LM / MC / FR result files with the runners' schemas, filled with random predictions."""
+
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+
+    lm, mc, fr = [], [], []
+
+    for i, d in enumerate(data):
+
+        answer_map = {k: d[f"OPTION-{k}"] for k in LETTERS}
+        meta = {"ABILITY": d["ABILITY"], "INDEX": d["INDEX"]}
+
+        raw = [rng.uniform(-30, -10) for _ in LETTERS]
+        norm = [rng.uniform(-15, -1) for _ in LETTERS]
+
+        lm.append({
+            "idx": i,
+            "raw_scores": raw,
+            "normalized_scores": norm,
+            "pred_raw": LETTERS[raw.index(max(raw))],
+            "pred_norm": LETTERS[norm.index(max(norm))],
+            "answer": d["ANSWER"],
+            "map": answer_map,
+            **meta,
+        })
+
+        for run_id in range(try_times):
+            mc.append({
+                "idx": i,
+                "run_id": run_id,
+                "output": f"The answer is [[{rng.choice(LETTERS)}]]",
+                "answer": d["ANSWER"],
+                "map": answer_map,
+                **meta,
+            })
+
+        fr.append({**d, "GENARATED_ANSWER": f"In the {answer_map[rng.choice(LETTERS)].lower()}."})
+
+    paths = {name: out_dir / f"{name}_bench.jsonl" for name in ("lm", "mc", "fr")}
+
+    for name, rows in [("lm", lm), ("mc", mc), ("fr", fr)]:
+        write_jsonl(paths[name], rows)
+
+    return paths
+
+
+# ============================================================
+# Cases
+# ============================================================
+
+def n_tokens(tokenizer, text):
+    return len(tokenizer(text, add_special_tokens=False).input_ids)
+
+
+def bench_lm_score_options(args, data, tokenizer, model):
+
+    from lm import build_lm_prompt, score_options
+
+    samples = tokens = 0
+
+    def step(d):
+        choices = [d[f"OPTION-{k}"] for k in LETTERS]
+        prompt = build_lm_prompt(d["STORY"], d["QUESTION"])
+        score_options(model, tokenizer, prompt, choices)
+        score_options(model, tokenizer, "", choices)
+        return sum(n_tokens(tokenizer, prompt + " " + c) + n_tokens(tokenizer, " " + c) for c in choices)
+
+    step(data[0])  # warmup
+
+    start = time.perf_counter()
+
+    for d in data:
+        tokens += step(d)
+        samples += 1
+
+    return samples, tokens, time.perf_counter() - start
+
+
+def bench_mc_generate(args, data, tokenizer, model):
+
+    from mc import build_mc_prompt
+    from run_mc_model import format_chat, generate_runs
+
+    samples = tokens = 0
+
+    def step(d):
+        choices = [d[f"OPTION-{k}"] for k in LETTERS]
+        prompt = format_chat(*build_mc_prompt(d["STORY"], d["QUESTION"], choices, cot=args.cot))
+        texts, _ = generate_runs(model, tokenizer, prompt, args.try_times, args.max_new_tokens)
+        return sum(n_tokens(tokenizer, t) for t in texts)
+
+    step(data[0])
+
+    start = time.perf_counter()
+
+    for d in data:
+        tokens += step(d)
+        samples += 1
+
+    return samples, tokens, time.perf_counter() - start
+
+
+def bench_fr_generate(args, data, tokenizer, model):
+
+    from fr import build_fr_prompt
+    from run_fr_model import generate_answer
+
+    samples = tokens = 0
+
+    def step(d):
+        prompt = build_fr_prompt(d["STORY"], d["QUESTION"], cot=args.cot)
+        answer, _ = generate_answer(model, tokenizer, prompt, max_length=args.max_new_tokens)
+        return n_tokens(tokenizer, answer)
+
+    step(data[0])
+
+    start = time.perf_counter()
+
+    for d in data:
+        tokens += step(d)
+        samples += 1
+
+    return samples, tokens, time.perf_counter() - start
+
+
+def bench_aggregate_mc_results(args, paths):
+
+    from mc import aggregate_mc_results
+
+    start = time.perf_counter()
+    raw, _ = aggregate_mc_results(paths["mc"], try_times=args.try_times)
+
+    return len(raw), 0, time.perf_counter() - start
+
+
+def bench_eval(module_name, key, pass_try_times=False):
+
+    def run(args, paths):
+
+        module = __import__(module_name)
+
+        argv = [
+            "--inputs", str(paths[key]),
+            "--metrics_dir", str(Path(paths[key]).parent),
+            "--n_resamples", str(args.n_resamples),
+        ]
+
+        if pass_try_times:
+            argv += ["--try_times", str(args.try_times)]
+
+        eval_args = module.build_parser().parse_args(argv)
+
+        start = time.perf_counter()
+        text, _ = module.report_file(Path(paths[key]), eval_args)
+        elapsed = time.perf_counter() - start
+
+        assert text
+
+        with open(paths[key], encoding="utf-8") as f:
+            n = sum(1 for _ in f)
+
+        return n, 0, elapsed
+
+    return run
+
+
+MODEL_CASES = {
+    "lm_score_options": bench_lm_score_options,
+    "mc_generate": bench_mc_generate,
+    "fr_generate": bench_fr_generate,
+}
+
+EVAL_CASES = {
+    "aggregate_mc_results": bench_aggregate_mc_results,
+    "eval_lm": bench_eval("eval_lm", "lm"),
+    "eval_mc": bench_eval("eval_mc", "mc", pass_try_times=True),
+    "eval_fr": bench_eval("eval_fr", "fr"),
+}
+
+CASES = [*MODEL_CASES, *EVAL_CASES]
+
+
+def run_case(name, args):
+    """Run one case in the current process; meant to be called in a fresh worker."""
+
+    from tiny_model import build_tiny, synthetic_data
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    if name in MODEL_CASES:
+        data, tokenizer, model, _ = build_tiny(args.n_samples, seed=args.seed)
+        samples, tokens, seconds = MODEL_CASES[name](args, data, tokenizer, model)
+    else:
+        data = synthetic_data(args.n_eval_samples, seed=args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = synthetic_results(data, tmp, args.try_times, seed=args.seed)
+            samples, tokens, seconds = EVAL_CASES[name](args, paths)
+
+    return {
+        "samples": samples,
+        "tokens": tokens,
+        "seconds": seconds,
+        "samples_per_sec": samples / seconds if seconds else 0.0,
+        "tokens_per_sec": tokens / seconds if seconds else 0.0,
+        "peak_mem_mb": peak_memory_mb(),
+    }
+
+
+# ============================================================
+# Baseline
+# ============================================================
+
+# Committed reference numbers (default sizes, --threads 1); refresh with --save_baseline
+BASELINE_PATH = Path(__file__).resolve().parent.parent / "bench" / "baseline.json"
+
+def compare(results, baseline, tolerance):
+    """Names of cases whose throughput dropped more than `tolerance` below the baseline."""
+
+    regressions = []
+
+    for name, r in results.items():
+
+        base = baseline.get(name)
+
+        if not base or not base["samples_per_sec"]:
+            continue
+
+        ratio = r["samples_per_sec"] / base["samples_per_sec"]
+        r["vs_baseline"] = ratio
+
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def print_table(results):
+
+    print("=" * 60)
+    print("Benchmark")
+    print("=" * 60)
+    print(f"{'case':24s} {'samples/s':>10s} {'tokens/s':>10s} {'peak MB':>9s} {'vs base':>8s}")
+
+    for name, r in results.items():
+        ratio = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else "-"
+        print(
+            f"{name:24s} {r['samples_per_sec']:10.2f} {r['tokens_per_sec']:10.1f} "
+            f"{r['peak_mem_mb']:9.1f} {ratio:>8s}"
+        )
+
+    print("=" * 60)
+
+
+# ============================================================
+# Main
+# ============================================================
+
+def main(args):
+
+    cases = args.cases or CASES
+
+    # Each case runs in a fresh process so peak memory is per case; the
+    # fastest of --repeats runs is kept, so timing noise does not fail the check
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+
+    for name in cases:
+        for _ in range(args.repeats):
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                r = pool.submit(run_case, name, args).result()
+
+            if name not in results or r["samples_per_sec"] > results[name]["samples_per_sec"]:
+                results[name] = r
+
+    regressions = []
+
+    if args.baseline and not args.no_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    print_table(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print("Saved baseline to:", args.save_baseline)
+
+    if regressions:
+        print(f"REGRESSION (> {args.tolerance:.0%} slower than baseline): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark probing hot paths on a tiny local model"
+    )
+
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=None)
+
+    parser.add_argument("--n_samples", type=int, default=16, help="Samples for model cases")
+    parser.add_argument("--n_eval_samples", type=int, default=2000, help="Samples for evaluator cases")
+
+    parser.add_argument("--try_times", type=int, default=2)
+    parser.add_argument("--max_new_tokens", type=int, default=16)
+    parser.add_argument("--cot", action="store_true")
+    parser.add_argument("--n_resamples", type=int, default=1000)
+
+    parser.add_argument("--threads", type=int, default=1, help="torch threads (fixed for stable timings)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Baseline JSON to compare against (default: the committed one)")
+    parser.add_argument("--no_baseline", action="store_true", help="Skip the regression check against --baseline")
+    parser.add_argument("--save_baseline", default=None, help="Write this run as the new baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed throughput drop vs baseline")
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+
+    args = parser.parse_args()
+
+    main(args)
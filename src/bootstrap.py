@@ -0,0 +1,103 @@
+# src/bootstrap.py
+
+import numpy as np
+
+
+# ============================================================
+# Defaults
+# ============================================================
+
+N_RESAMPLES = 10000
+ALPHA = 0.05
+SEED = 0
+
+
+# ============================================================
+# Resampling
+# ============================================================
+
+def resample_indices(n, n_resamples=N_RESAMPLES, seed=SEED):
+    """Draw all bootstrap resamples at once as an (n_resamples, n) index matrix."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n, size=(n_resamples, n), dtype=np.int32)
+
+
+def percentile_ci(stats, alpha=ALPHA):
+    """Percentile interval of a vector of resampled statistics."""
+    lo, hi = np.nanpercentile(stats, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(lo), float(hi)
+
+
+def ci_label(alpha=ALPHA):
+    return f"{round(100 * (1 - alpha))}% CI"
+
+
+def format_ci(ci, alpha=ALPHA):
+    return f"[{ci_label(alpha)}: {ci[0]:.4f}, {ci[1]:.4f}]"
+
+
+# ============================================================
+# Confidence Intervals
+# ============================================================
+
+def bootstrap_ci(values, weights=None, n_resamples=N_RESAMPLES, alpha=ALPHA, seed=SEED):
+    """
+    Bootstrap CI of sum(values) / sum(weights) over resampled units.
+
+    With weights=None this is the CI of the mean (e.g. of 0/1 correctness).
+    Weights allow ratio estimates such as correct runs / parsed runs per item.
+    """
+    values = np.asarray(values, dtype=np.float64)
+
+    if len(values) == 0:
+        return 0.0, 0.0
+
+    idx = resample_indices(len(values), n_resamples, seed)
+
+    num = values[idx].sum(axis=1)
+
+    if weights is None:
+        stats = num / len(values)
+    else:
+        den = np.asarray(weights, dtype=np.float64)[idx].sum(axis=1)
+        stats = np.divide(num, den, out=np.full(len(num), np.nan), where=den > 0)
+
+    return percentile_ci(stats, alpha)
+
+
+# ============================================================
+# Paired Comparisons
+# ============================================================
+
+def paired_test(a, b, n_resamples=N_RESAMPLES, alpha=ALPHA, seed=SEED):
+    """
+    Paired comparison of per-item scores a vs b (e.g. Norm vs Raw, CoT vs base).
+
+    Returns:
+        diff:    mean(a - b)
+        ci:      bootstrap CI of the mean difference
+        p_value: two-sided sign-flip permutation p-value
+    """
+    d = np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)
+
+    if len(d) == 0:
+        return 0.0, (0.0, 0.0), 1.0
+
+    diff = float(d.mean())
+
+    idx = resample_indices(len(d), n_resamples, seed)
+    ci = percentile_ci(d[idx].mean(axis=1), alpha)
+
+    rng = np.random.default_rng(seed + 1)
+    signs = rng.integers(0, 2, size=(n_resamples, len(d)), dtype=np.int8) * 2 - 1
+    perm = (signs * d).mean(axis=1)
+
+    # Small tolerance so exact ties with the observed statistic count as extreme
+    extreme = np.abs(perm) >= abs(diff) - 1e-12
+    p_value = (extreme.sum() + 1) / (n_resamples + 1)
+
+    return diff, ci, float(p_value)
+
+
+def format_paired(diff, ci, p_value, alpha=ALPHA):
+    return f"diff={diff:+.4f}  {format_ci(ci, alpha)}  p={p_value:.4f}"
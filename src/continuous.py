@@ -0,0 +1,543 @@
+# src/continuous.py
+
+import copy
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+from torch.profiler import record_function
+from tqdm import tqdm
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    MinNewTokensLengthLogitsProcessor,
+    MinPLogitsWarper,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+    TypicalLogitsWarper,
+)
+
+from gen_cache import cache_params
+from telemetry import now
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def add_continuous_args(parser):
+    parser.add_argument(
+        "--slots",
+        type=int,
+        default=0,
+        help="Continuous batching: decode up to N sequences at once and refill a slot with the next "
+             "pending run as soon as its sequence ends (0 = one generate() call per run)",
+    )
+
+
+def check_continuous_args(args):
+
+    if not args.slots:
+        return
+
+    for flag in ["draft_model", "static_cache", "permutations"]:
+        if getattr(args, flag, None):
+            raise ValueError(f"--slots cannot be combined with --{flag}")
+
+
+# ============================================================
+# Sampling Config
+# ============================================================
+
+# generate()'s values for sampling options neither the call nor the model's generation_config sets
+SAMPLING_DEFAULTS = {"temperature": 1.0, "top_k": 50, "top_p": 1.0}
+
+# generate() options the batcher does not implement, with the values that leave them off
+UNSUPPORTED = {
+    "num_beams": (None, 1),
+    "guidance_scale": (None, 1.0),
+    "sequence_bias": (None,),
+    "encoder_repetition_penalty": (None, 1.0),
+    "bad_words_ids": (None,),
+    "min_length": (None, 0),
+    "forced_bos_token_id": (None,),
+    "forced_eos_token_id": (None,),
+    "remove_invalid_values": (None, False),
+    "exponential_decay_length_penalty": (None,),
+    "suppress_tokens": (None,),
+    "begin_suppress_tokens": (None,),
+    "top_h": (None,),
+    "epsilon_cutoff": (None, 0.0),
+    "eta_cutoff": (None, 0.0),
+    "watermarking_config": (None,),
+    "renormalize_logits": (None, False),
+}
+
+
+def generation_config(model, generate_kwargs):
+    """The model's GenerationConfig updated with `generate_kwargs`, as generate() resolves it."""
+
+    config = copy.deepcopy(model.generation_config)
+    config.update(**generate_kwargs)
+
+    for name, value in SAMPLING_DEFAULTS.items():
+        if getattr(config, name, None) is None:
+            setattr(config, name, value)
+
+    unsupported = [name for name, off in UNSUPPORTED.items() if getattr(config, name, None) not in off]
+
+    if unsupported:
+        raise ValueError(f"--slots does not support the generation options {unsupported}")
+
+    return config
+
+
+def logits_processors(config, eos, prompt_len, device):
+    """
+    The logits processors generate() applies for `config` (one sequence, no
+    beams), in the same order, built from the public processor classes.
+    """
+    processors = LogitsProcessorList()
+
+    if config.repetition_penalty is not None and config.repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(penalty=config.repetition_penalty))
+
+    if config.no_repeat_ngram_size:
+        processors.append(NoRepeatNGramLogitsProcessor(config.no_repeat_ngram_size))
+
+    if config.min_new_tokens and eos:
+        processors.append(MinNewTokensLengthLogitsProcessor(
+            prompt_len, config.min_new_tokens, torch.tensor(sorted(eos), device=device), device=device,
+        ))
+
+    if not config.do_sample:
+        return processors
+
+    if config.temperature != 1.0:
+        processors.append(TemperatureLogitsWarper(config.temperature))
+
+    if config.top_k:
+        processors.append(TopKLogitsWarper(top_k=config.top_k, min_tokens_to_keep=1))
+
+    if config.top_p < 1.0:
+        processors.append(TopPLogitsWarper(top_p=config.top_p, min_tokens_to_keep=1))
+
+    if config.min_p is not None:
+        processors.append(MinPLogitsWarper(min_p=config.min_p, min_tokens_to_keep=1))
+
+    if config.typical_p is not None and config.typical_p < 1.0:
+        processors.append(TypicalLogitsWarper(mass=config.typical_p, min_tokens_to_keep=1))
+
+    return processors
+
+
+# ============================================================
+# Slots
+# ============================================================
+
+class Slot:
+    """One sequence in flight: its ids, sampling state and timing."""
+
+    def __init__(self, request, prompt_ids, generator, processors):
+
+        self.request = request
+        self.ids = list(prompt_ids)
+        self.prompt_len = len(prompt_ids)
+        self.generator = generator
+        self.processors = processors
+
+        # Tokens in the KV cache; the last id is fed at the next step
+        self.kv_len = self.prompt_len
+        self.logprobs = []
+
+        self.stats = {
+            "prefill_s": 0.0,
+            "decode_s": 0.0,
+            "prompt_tokens": self.prompt_len,
+            "generated_tokens": 0,
+            "cached": 0,
+        }
+
+    @property
+    def generated(self):
+        return len(self.ids) - self.prompt_len
+
+
+class ContinuousBatcher:
+    """
+    Continuous-batching generation loop.
+
+    Every request is prefilled on its own (exactly as generate() would) and
+    then joins a left-padded decode batch of at most `slots` sequences. A
+    sequence leaves the batch as soon as it emits EOS or reaches
+    max_new_tokens, and the freed slot is refilled with the next request.
+
+    Each request samples from its own torch.Generator seeded with its seed,
+    with the logits processors generate() builds for the same kwargs (see
+    logits_processors), so outputs match one seeded generate() call per
+    request. With
+    output_logits=True the generated tokens' raw log-probabilities are
+    returned in stats["token_logprobs"], as cached_generate() does.
+
+    `generate_kwargs` are the generate() options of the unbatched path; they
+    also key the generation `cache`, together with the "continuous" path:
+    batched decode is not bit-identical to it at fp16, so the two paths do
+    not serve each other's entries.
+    """
+
+    def __init__(self, model, slots, generate_kwargs, cache=None):
+
+        self.model = model
+        self.slots = slots
+        self.kwargs = generate_kwargs
+        self.cache = cache
+
+        self.config = generation_config(model, generate_kwargs)
+
+        eos = self.config.eos_token_id
+        self.eos = set(eos if isinstance(eos, (list, tuple)) else [eos] if eos is not None else [])
+        self.max_new_tokens = self.config.max_new_tokens
+        self.do_sample = self.config.do_sample
+        self.output_logits = generate_kwargs.get("output_logits", False)
+
+        self.active = []
+        self.past = None
+
+        self.occupancy = {
+            "slots": slots,
+            "decode_steps": 0,
+            "active_slot_steps": 0,
+            "kv_positions": 0,
+            "kv_padding": 0,
+            "prefills": 0,
+            "cache_hits": 0,
+        }
+
+    # ---------- Sampling ----------
+    def sample(self, slot, logits):
+        """Next token of `slot` from its (vocab,) float32 logits, as generate() picks it."""
+
+        input_ids = torch.tensor([slot.ids], device=logits.device)
+        scores = slot.processors(input_ids, logits[None])
+
+        if self.do_sample:
+            probs = F.softmax(scores, dim=-1)
+            token = torch.multinomial(probs, num_samples=1, generator=slot.generator)[0, 0]
+        else:
+            token = torch.argmax(scores, dim=-1)[0]
+
+        slot.ids.append(int(token))
+
+        if self.output_logits:
+            slot.logprobs.append(torch.log_softmax(logits, dim=-1)[token].item())
+
+    def is_finished(self, slot):
+        return slot.generated >= self.max_new_tokens or slot.ids[-1] in self.eos
+
+    # ---------- KV cache ----------
+    def edit_cache(self, fn):
+        for layer in self.past.layers:
+            layer.keys = fn(layer.keys)
+            layer.values = fn(layer.values)
+
+    def row_cache(self, row):
+        """batch-1 DynamicCache holding only the real tokens of one row (e.g. for answer forcing)."""
+
+        n = self.active[row].kv_len
+
+        return DynamicCache([
+            (layer.keys[row:row + 1, :, -n:], layer.values[row:row + 1, :, -n:])
+            for layer in self.past.layers
+        ])
+
+    def width(self):
+        return self.past.layers[0].keys.shape[-2] if self.active else 0
+
+    def join(self, slot, past):
+        """Add a prefilled slot as the last row of the decode batch."""
+
+        new = [(layer.keys, layer.values) for layer in past.layers]
+
+        if not self.active:
+            self.past = DynamicCache(new)
+            self.active.append(slot)
+            return
+
+        width = max(self.width(), slot.kv_len)
+
+        # Left padding: every row's real tokens end at the last column
+        def pad(x):
+            return F.pad(x, (0, 0, width - x.shape[-2], 0))
+
+        self.edit_cache(pad)
+
+        for layer, (k, v) in zip(self.past.layers, new):
+            layer.keys = torch.cat([layer.keys, pad(k)])
+            layer.values = torch.cat([layer.values, pad(v)])
+
+        self.active.append(slot)
+
+    def leave(self, rows):
+        """Drop finished rows and the padding columns no remaining row needs."""
+
+        keep = [r for r in range(len(self.active)) if r not in rows]
+        self.active = [self.active[r] for r in keep]
+
+        if not self.active:
+            self.past = None
+            return
+
+        index = torch.tensor(keep, device=self.model.device)
+        width = max(s.kv_len for s in self.active)
+
+        self.edit_cache(lambda x: x.index_select(0, index)[:, :, -width:])
+
+    def cache_params(self, seed):
+        return cache_params(self.kwargs, seed, batching="continuous")
+
+    # ---------- Admission ----------
+    def admit(self, request):
+        """
+        Prefill one request. Returns the finished result if it needs no
+        decode steps (cache hit, or done after its first token), else None
+        after adding it to the batch.
+        """
+        prompt_ids = [int(x) for x in request["input_ids"]]
+        params = self.cache_params(request["seed"])
+
+        # Unseeded requests are never cached, as in cached_generate()
+        if self.cache is not None and request["seed"] is not None:
+
+            hit = self.cache.get(prompt_ids, params)
+
+            if hit is not None:
+                new_ids, logprobs = hit
+                self.occupancy["cache_hits"] += 1
+
+                stats = {
+                    "prefill_s": 0.0,
+                    "decode_s": 0.0,
+                    "prompt_tokens": len(prompt_ids),
+                    "generated_tokens": len(new_ids),
+                    "cached": 1,
+                }
+
+                if self.output_logits and logprobs is not None:
+                    stats["token_logprobs"] = logprobs
+
+                return request, torch.tensor(prompt_ids + new_ids), stats, None
+
+        generator = torch.Generator(device=self.model.device)
+
+        if request["seed"] is None:
+            generator.seed()
+        else:
+            generator.manual_seed(request["seed"])
+
+        processors = logits_processors(self.config, self.eos, len(prompt_ids), self.model.device)
+
+        slot = Slot(request, prompt_ids, generator, processors)
+
+        start = now()
+
+        with record_function("prefill"), torch.no_grad():
+            past = DynamicCache()
+            logits = self.model(
+                input_ids=torch.tensor([prompt_ids], device=self.model.device),
+                past_key_values=past,
+                use_cache=True,
+                logits_to_keep=1,
+            ).logits[0, -1].float()
+
+        self.sample(slot, logits)
+
+        slot.stats["prefill_s"] = now() - start
+        self.occupancy["prefills"] += 1
+
+        if self.is_finished(slot):
+            return self.finish(slot, past)
+
+        self.join(slot, past)
+
+        return None
+
+    def finish(self, slot, past):
+        """(request, output ids, stats, KV cache of all but the last token)."""
+
+        slot.stats["generated_tokens"] = slot.generated
+
+        if self.output_logits:
+            slot.stats["token_logprobs"] = slot.logprobs
+
+        if self.cache is not None and slot.request["seed"] is not None:
+            self.cache.put(
+                slot.ids[:slot.prompt_len], self.cache_params(slot.request["seed"]),
+                slot.ids[slot.prompt_len:], slot.stats.get("token_logprobs"),
+            )
+
+        return slot.request, torch.tensor(slot.ids), slot.stats, past
+
+    # ---------- Decode step ----------
+    def step(self):
+        """One decode step over every active slot; returns the results that finished."""
+
+        start = now()
+        width = self.width()
+        device = self.model.device
+
+        lengths = torch.tensor([s.kv_len for s in self.active], device=device)
+        columns = torch.arange(width + 1, device=device)
+
+        # Real tokens end at column `width`; position = number of real tokens before
+        attention_mask = (columns[None] >= width - lengths[:, None]).long()
+
+        with record_function("decode step"), torch.no_grad():
+            logits = self.model(
+                input_ids=torch.tensor([[s.ids[-1]] for s in self.active], device=device),
+                attention_mask=attention_mask,
+                position_ids=lengths[:, None],
+                past_key_values=self.past,
+                use_cache=True,
+            ).logits[:, -1].float()
+
+        rows = []
+
+        with record_function("sample"):
+            for row, slot in enumerate(self.active):
+
+                slot.kv_len += 1
+                self.sample(slot, logits[row])
+
+                if self.is_finished(slot):
+                    rows.append(row)
+
+        # ---------- Occupancy ----------
+        elapsed = now() - start
+        active = len(self.active)
+
+        self.occupancy["decode_steps"] += 1
+        self.occupancy["active_slot_steps"] += active
+        self.occupancy["kv_positions"] += active * (width + 1)
+        self.occupancy["kv_padding"] += int(active * (width + 1) - sum(s.kv_len for s in self.active))
+
+        for slot in self.active:
+            slot.stats["decode_s"] += elapsed / active
+
+        finished = [self.finish(self.active[r], self.row_cache(r)) for r in rows]
+
+        if rows:
+            self.leave(rows)
+
+        return finished
+
+    # ---------- Loop ----------
+    def generate(self, requests):
+        """
+        Yield (request, output ids, stats, past_key_values) for every request
+        in `requests` (dicts with "input_ids" and "seed"), in completion order.
+        past_key_values is None for cache hits.
+        """
+        requests = iter(requests)
+        exhausted = False
+
+        while True:
+
+            while not exhausted and len(self.active) < self.slots:
+
+                request = next(requests, None)
+
+                if request is None:
+                    exhausted = True
+                    break
+
+                done = self.admit(request)
+
+                if done is not None:
+                    yield done
+
+            if not self.active:
+                return
+
+            yield from self.step()
+
+    def summary(self):
+
+        o = self.occupancy
+        steps = o["decode_steps"]
+
+        return {
+            **o,
+            "mean_active_slots": o["active_slot_steps"] / steps if steps else 0.0,
+            "slot_occupancy": o["active_slot_steps"] / (steps * self.slots) if steps else 0.0,
+            "kv_padding_fraction": o["kv_padding"] / o["kv_positions"] if o["kv_positions"] else 0.0,
+        }
+
+
+def print_occupancy(summary):
+
+    print("Continuous batching:")
+    print(
+        f"  slot occupancy: {summary['slot_occupancy']:.3f} "
+        f"({summary['mean_active_slots']:.2f} of {summary['slots']} slots over {summary['decode_steps']} decode steps)"
+    )
+    print(f"  prefills: {summary['prefills']}  cache hits: {summary['cache_hits']}")
+    print(f"  KV padding: {summary['kv_padding_fraction']:.3f} of attended positions")
+
+
+# ============================================================
+# Runner Loop
+# ============================================================
+
+def run_continuous(batcher, jobs, runs_per_job, seed_of, on_run, on_done, write, total, status=None):
+    """
+    Schedule every run of every job through `batcher` and write jobs in input
+    order once all their runs are done.
+
+        seed_of(job, run_id)                                   seed of one run
+        on_run(job, run_id, output_ids, stats, past_key_values)  per finished run
+        on_done(job)                                           after a job's last run
+        write(job)                                             in input order
+
+    Jobs are pulled (e.g. prepared) lazily, only when a slot frees up.
+    `status()` is shown as the progress bar postfix.
+    """
+    bar = tqdm(total=total)
+    order = deque()
+
+    def requests():
+        for job in jobs:
+
+            job["runs_left"] = runs_per_job
+            job["start"] = now()
+            order.append(job)
+
+            for run_id in range(runs_per_job):
+                yield {
+                    "job": job,
+                    "run_id": run_id,
+                    "input_ids": job["inputs"]["input_ids"][0].tolist(),
+                    "seed": seed_of(job, run_id),
+                }
+
+    for request, output_ids, stats, past_key_values in batcher.generate(requests()):
+
+        job = request["job"]
+
+        on_run(job, request["run_id"], output_ids, stats, past_key_values)
+
+        job["runs_left"] -= 1
+
+        if job["runs_left"] == 0:
+            on_done(job)
+            bar.update()
+
+        while order and order[0]["runs_left"] == 0:
+            write(order.popleft())
+
+            if status is not None:
+                bar.set_postfix(status(), refresh=False)
+
+    bar.close()
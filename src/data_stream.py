@@ -0,0 +1,287 @@
+# src/data_stream.py
+
+import gzip
+import json
+import os
+import queue
+import threading
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+PREFETCH = 64
+CHUNK_BYTES = 1 << 20
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+_DONE = object()
+
+
+def add_data_args(parser):
+    parser.add_argument(
+        "--shard",
+        type=int,
+        default=0,
+        help="Run only shard I of --num_shards contiguous byte ranges of --data (0-based)",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Split --data into N shards; outputs keep the sample indices of the whole file",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=PREFETCH,
+        help="Records read and parsed ahead on a background thread (0 = read inline)",
+    )
+
+
+def open_data(args):
+    """The runner's --data as a stream of its --shard."""
+    return JsonlStream(args.data, shard=args.shard, num_shards=args.num_shards, prefetch=args.prefetch)
+
+
+def load_data(path):
+    """Whole JSONL (or .jsonl.gz) file as a list, for inputs that fit in memory."""
+    return list(JsonlStream(path, prefetch=0))
+
+
+# ============================================================
+# Files
+# ============================================================
+
+def is_gzip(path):
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_binary(path):
+    return gzip.open(path, "rb") if is_gzip(path) else open(path, "rb")
+
+
+def count_newlines(f, limit=None):
+    """Newlines in the next `limit` bytes of `f` (all remaining bytes if None), in fixed-size chunks."""
+
+    count = 0
+    last = b""
+
+    while limit is None or limit > 0:
+
+        chunk = f.read(CHUNK_BYTES if limit is None else min(CHUNK_BYTES, limit))
+
+        if not chunk:
+            break
+
+        count += chunk.count(b"\n")
+        last = chunk[-1:]
+
+        if limit is not None:
+            limit -= len(chunk)
+
+    return count, last
+
+
+def line_start(f, offset):
+    """First line start at or after byte `offset`."""
+
+    if offset == 0:
+        return 0
+
+    f.seek(offset - 1)
+    f.readline()
+
+    return f.tell()
+
+
+# ============================================================
+# Prefetch
+# ============================================================
+
+def prefetch(iterable, depth=PREFETCH):
+    """
+    Iterate `iterable` on a background thread, at most `depth` items ahead of
+    the consumer. Exceptions are re-raised in the consumer; closing the
+    generator stops the thread. depth <= 0 iterates inline.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                buffer.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(_DONE)
+
+    reader = threading.Thread(target=produce, name="prefetch", daemon=True)
+    reader.start()
+
+    try:
+        while True:
+
+            item = buffer.get()
+
+            if item is _DONE:
+                break
+
+            yield item
+
+    finally:
+        stop.set()
+        reader.join()
+
+    if errors:
+        raise errors[0]
+
+
+# ============================================================
+# Streaming JSONL
+# ============================================================
+
+class JsonlStream:
+    """
+    Records of one shard of a JSONL file, read lazily so memory stays flat.
+
+    Uncompressed files are split into `num_shards` contiguous byte ranges,
+    each moved to the next line start; gzip files cannot seek, so they are
+    split into contiguous line ranges of the decompressed stream. Either
+    way the shards are disjoint, in file order, and cover every line.
+
+    Iterating yields records; indexed() yields (line index in the whole
+    file, record), so a shard's samples keep the indices (and seeds) they
+    have in an unsharded run. len() counts the shard's records once without
+    parsing them. Blank lines are skipped. The stream can be iterated again.
+    """
+
+    def __init__(self, path, shard=0, num_shards=1, prefetch=PREFETCH):
+
+        if num_shards < 1 or not 0 <= shard < num_shards:
+            raise ValueError(f"--shard must be in [0, {num_shards}), got {shard}")
+
+        self.path = path
+        self.shard = shard
+        self.num_shards = num_shards
+        self.prefetch = prefetch
+        self.compressed = is_gzip(path)
+
+        self._span = None
+        self._len = None
+
+    # ---------- Shard boundaries ----------
+    def span(self):
+        """
+        (first line index, start, stop) of this shard: byte offsets of an
+        uncompressed file, line indices of a gzip one.
+        """
+        if self._span is not None:
+            return self._span
+
+        if self.compressed:
+
+            with open_binary(self.path) as f:
+                newlines, last = count_newlines(f)
+
+            lines = newlines + int(last not in (b"", b"\n"))
+
+            start = lines * self.shard // self.num_shards
+            stop = lines * (self.shard + 1) // self.num_shards
+
+            self._span = (start, start, stop)
+
+        else:
+
+            size = os.path.getsize(self.path)
+
+            with open(self.path, "rb") as f:
+
+                start = line_start(f, size * self.shard // self.num_shards)
+                stop = line_start(f, size * (self.shard + 1) // self.num_shards)
+
+                f.seek(0)
+                first, _ = count_newlines(f, start)
+
+            self._span = (first, start, stop)
+
+        return self._span
+
+    def lines(self):
+        """(line index, raw line) of every line of the shard."""
+
+        first, start, stop = self.span()
+
+        if self.compressed:
+
+            with open_binary(self.path) as f:
+                for i, line in enumerate(f):
+
+                    if i >= stop:
+                        break
+
+                    if i >= start:
+                        yield i, line
+
+            return
+
+        with open(self.path, "rb") as f:
+
+            f.seek(start)
+            pos = start
+            i = first
+
+            while pos < stop:
+
+                line = f.readline()
+
+                if not line:
+                    break
+
+                yield i, line
+
+                pos += len(line)
+                i += 1
+
+    # ---------- Records ----------
+    def parsed(self):
+        for i, line in self.lines():
+            if line.strip():
+                yield i, json.loads(line)
+
+    def indexed(self):
+        """(line index in the whole file, record), parsed ahead on a background thread."""
+        return prefetch(self.parsed(), self.prefetch)
+
+    def __iter__(self):
+        for _, record in self.indexed():
+            yield record
+
+    def __len__(self):
+
+        if self._len is None:
+            self._len = sum(1 for _, line in self.lines() if line.strip())
+
+        return self._len
+
+    def describe(self):
+        shard = f", shard {self.shard}/{self.num_shards}" if self.num_shards > 1 else ""
+        return f"{len(self)} samples from {self.path}{shard}"
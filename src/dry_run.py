@@ -0,0 +1,234 @@
+# src/dry_run.py
+
+import json
+from pathlib import Path
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from telemetry import telemetry_path
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+BATCH_SIZES = (1, 4, 8, 16, 32)
+HIST_BINS = 10
+
+
+def add_dry_run_args(parser):
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Tokenize every prompt without loading model weights and report token counts and estimated time",
+    )
+    parser.add_argument(
+        "--rate_profile",
+        default=None,
+        help="Telemetry JSON of an earlier run, or {prefill,decode}_tokens_per_sec JSON, for the time "
+             "estimate (default: the telemetry of this --output, if present)",
+    )
+
+
+def load_tokenizer(model_name):
+    """Tokenizer only: no weights are downloaded or loaded."""
+
+    print("Loading tokenizer:", model_name)
+
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+# ============================================================
+# Token Plan
+# ============================================================
+
+def token_lengths(tokenizer, texts):
+    return [len(tokenizer(t).input_ids) for t in texts]
+
+
+def histogram(lengths, bins=HIST_BINS):
+    """[(lo, hi, count)] over the observed length range."""
+
+    counts, edges = np.histogram(lengths, bins=min(bins, max(len(set(lengths)), 1)))
+
+    return [(int(edges[i]), int(edges[i + 1]), int(c)) for i, c in enumerate(counts)]
+
+
+def padding_overhead(lengths, batch_size):
+    """Padded / real tokens when length-sorted sequences are batched `batch_size` at a time."""
+
+    lengths = sorted(lengths)
+    padded = sum(
+        max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size])
+        for i in range(0, len(lengths), batch_size)
+    )
+
+    return padded / sum(lengths) if lengths else 1.0
+
+
+def make_plan(method, samples, lengths, runs_per_sample=1, max_new_tokens=0, prompt_tokens=None, meta=None):
+    """
+    Token totals of a run: every sequence in `lengths` is prefilled once per
+    run, and every run of every sample may decode up to `max_new_tokens`.
+    `prompt_tokens` overrides the prefill total when the run shares work
+    between sequences (e.g. a shared prefix).
+    """
+    lengths = [int(n) for n in lengths]
+
+    if prompt_tokens is None:
+        prompt_tokens = sum(lengths) * runs_per_sample
+
+    return {
+        **(meta or {}),
+        "method": method,
+        "samples": samples,
+        "sequences": len(lengths),
+        "runs_per_sample": runs_per_sample,
+        "max_new_tokens": max_new_tokens,
+        "prompt_tokens": prompt_tokens,
+        "decode_budget": samples * runs_per_sample * max_new_tokens,
+        "length": {
+            "min": min(lengths, default=0),
+            "mean": float(np.mean(lengths)) if lengths else 0.0,
+            "p50": float(np.percentile(lengths, 50)) if lengths else 0.0,
+            "p95": float(np.percentile(lengths, 95)) if lengths else 0.0,
+            "max": max(lengths, default=0),
+        },
+        "histogram": histogram(lengths) if lengths else [],
+        "padding_overhead": {b: padding_overhead(lengths, b) for b in BATCH_SIZES},
+    }
+
+
+# ============================================================
+# Rate Profile + Estimate
+# ============================================================
+
+def load_rates(path):
+    """
+    Throughput profile from a telemetry JSON (measured) or a stored
+    {"prefill_tokens_per_sec", "decode_tokens_per_sec"[, "overhead"]} JSON.
+
+    overhead = wall time / model time, i.e. everything outside prefill + decode.
+    """
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+
+    if "samples" not in profile:
+        return {"overhead": 1.0, **profile, "source": str(path)}
+
+    records = [r for r in profile["samples"] if not r.get("cached")]
+    summary = profile["summary"]
+
+    prefill_s = sum(r["prefill_s"] for r in records)
+    decode_s = sum(r["decode_s"] for r in records)
+    generated = sum(r["generated_tokens"] for r in records)
+    runs = len(records) * summary.get("try_times", 1)
+
+    return {
+        "prefill_tokens_per_sec": sum(r["prompt_tokens"] for r in records) / prefill_s if prefill_s else None,
+        "decode_tokens_per_sec": generated / decode_s if decode_s else None,
+        "overhead": max(summary["wall_s"] / (prefill_s + decode_s), 1.0) if prefill_s + decode_s else 1.0,
+        "generated_per_run": generated / runs if runs and decode_s else None,
+        "source": str(path),
+    }
+
+
+def default_profile(args):
+    """--rate_profile, else the telemetry an earlier run of this --output left behind."""
+
+    if args.rate_profile:
+        return args.rate_profile
+
+    path = Path(args.telemetry or telemetry_path(args.output))
+
+    return str(path) if path.exists() else None
+
+
+def estimate(plan, rates):
+    """Expected decode tokens and wall time of `plan` under `rates`."""
+
+    generated_per_run = rates.get("generated_per_run")
+
+    decode_tokens = plan["decode_budget"]
+
+    if generated_per_run is not None and plan["max_new_tokens"]:
+        decode_tokens = min(generated_per_run, plan["max_new_tokens"]) * plan["samples"] * plan["runs_per_sample"]
+
+    prefill_s = plan["prompt_tokens"] / rates["prefill_tokens_per_sec"] if rates.get("prefill_tokens_per_sec") else 0.0
+    decode_s = decode_tokens / rates["decode_tokens_per_sec"] if decode_tokens and rates.get("decode_tokens_per_sec") else 0.0
+
+    return {
+        "decode_tokens": decode_tokens,
+        "prefill_s": prefill_s,
+        "decode_s": decode_s,
+        "wall_s": (prefill_s + decode_s) * rates["overhead"],
+        "profile": rates["source"],
+    }
+
+
+def dry_run(args, plan):
+    """Attach the time estimate (if a profile is available), print and return the plan."""
+
+    profile = default_profile(args)
+
+    if profile:
+        plan["estimate"] = estimate(plan, load_rates(profile))
+
+    print_plan(plan)
+
+    return plan
+
+
+# ============================================================
+# Report
+# ============================================================
+
+def format_duration(seconds):
+
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(rest, 60)
+
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+
+def print_plan(plan):
+
+    length = plan["length"]
+
+    print("=" * 60)
+    print(f"Dry Run ({plan['method']})")
+    print("=" * 60)
+    print(f"Samples           : {plan['samples']}  ({plan['sequences']} sequences, {plan['runs_per_sample']} run(s) each)")
+    print(f"Prompt tokens     : {plan['prompt_tokens']}")
+    print(
+        f"Sequence length   : min {length['min']}  mean {length['mean']:.1f}  "
+        f"p50 {length['p50']:.0f}  p95 {length['p95']:.0f}  max {length['max']}"
+    )
+    print(f"Decode budget     : {plan['decode_budget']} tokens (max_new_tokens {plan['max_new_tokens']})")
+
+    if plan["histogram"]:
+        print("\nLength histogram:")
+        peak = max(c for _, _, c in plan["histogram"]) or 1
+
+        for lo, hi, count in plan["histogram"]:
+            print(f"  {lo:6d}-{hi:<6d} {count:6d} {'#' * round(40 * count / peak)}")
+
+    print("\nPadding overhead (length-sorted batches):")
+    print("  " + "  ".join(f"bs={b}: {x:.2f}x" for b, x in plan["padding_overhead"].items()))
+
+    est = plan.get("estimate")
+
+    print()
+
+    if est is None:
+        print("No rate profile (--rate_profile or an earlier telemetry file): no time estimate")
+    else:
+        print(f"Expected decode   : {est['decode_tokens']:.0f} tokens")
+        print(
+            f"Estimated time    : {format_duration(est['wall_s'])}  "
+            f"(prefill {est['prefill_s']:.1f}s + decode {est['decode_s']:.1f}s, incl. overhead)"
+        )
+        print(f"Rate profile      : {est['profile']}")
+
+    print("=" * 60)
@@ -1,8 +1,11 @@
 # evaluate lm-probing output
-python eval_lm.py --input lm_mistral.jsonl
+python src/eval_lm.py --inputs results --compare auto --logs_dir logs
 
 # evaluate mc-probing output
-python eval_mc.py --input mc_mistral.jsonl
+python src/eval_mc.py --inputs results --compare auto --logs_dir logs
 
 # evaluate fr-probing output
-python eval_fr.py --input fr_mistral.jsonl
\ No newline at end of file
+python src/eval_fr.py --inputs results --compare auto --logs_dir logs
+
+# rebuild summary_final.csv / fr_avg.csv
+python src/parse_all_logs.py
\ No newline at end of file
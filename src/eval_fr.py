@@ -1,13 +1,16 @@
 # src/eval_fr.py
 
 import argparse
-import json
 from collections import defaultdict
+from functools import partial
+from pathlib import Path
 
+import numpy as np
 
-def load_data(path):
-    with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+from bootstrap import N_RESAMPLES, bootstrap_ci, format_ci, format_paired, paired_test
+from data_stream import load_data
+from metrics import add_meta_args, make_record, metrics_path, print_combined, resolve_compare, resolve_meta, write_metrics
+from parallel import add_parallel_args, capture, expand_inputs, map_files, write_log
 
 
 def match_generated_to_option(generated_text, options):
@@ -52,15 +55,62 @@ def accuracy_by_ability(data, pred_key="pred_option"):
     return accs
 
 
-def print_accuracy_group(accs):
+def correct_arrays(data, pred_key="pred_option"):
+    """Per-sample correctness, whether a prediction exists, and ABILITY, as arrays."""
+    has_pred = np.array([d.get(pred_key) is not None for d in data], dtype=bool)
+    correct = np.array(
+        [d.get(pred_key) is not None and exact_match(d[pred_key], d["ANSWER"]) for d in data],
+        dtype=np.float64,
+    )
+    abilities = np.array([d.get("ABILITY", "UNKNOWN") for d in data], dtype=object)
+    return correct, has_pred, abilities
+
+
+def accuracy_ci(data, pred_key="pred_option", n_resamples=N_RESAMPLES):
+    """Bootstrap CI of the exact match accuracy, overall and by ability."""
+    correct, has_pred, abilities = correct_arrays(data, pred_key)
+
+    total = bootstrap_ci(correct[has_pred], n_resamples=n_resamples)
+    groups = {
+        ability: bootstrap_ci(correct[has_pred & (abilities == ability)], n_resamples=n_resamples)
+        for ability in sorted(set(abilities[has_pred]))
+    }
+    return total, groups
+
+
+def paired_accuracy(data, reference, pred_key="pred_option", n_resamples=N_RESAMPLES):
+    """Paired test against a reference run, over samples (matched by EXP_IDX) predicted in both."""
+    ref_by_key = {d.get("EXP_IDX", i): d for i, d in enumerate(reference)}
+    pairs = [
+        (d, ref_by_key[d.get("EXP_IDX", i)])
+        for i, d in enumerate(data)
+        if d.get("EXP_IDX", i) in ref_by_key
+    ]
+    pairs = [(d, r) for d, r in pairs if d.get(pred_key) is not None and r.get(pred_key) is not None]
+
+    correct, _, abilities = correct_arrays([d for d, _ in pairs], pred_key)
+    ref_correct, _, _ = correct_arrays([r for _, r in pairs], pred_key)
+
+    tests = {"Overall": paired_test(correct, ref_correct, n_resamples=n_resamples)}
+    for ability in sorted(set(abilities)):
+        mask = abilities == ability
+        tests[ability] = paired_test(correct[mask], ref_correct[mask], n_resamples=n_resamples)
+    return tests
+
+
+def print_accuracy_group(accs, cis=None):
     for ability, (acc, count) in accs.items():
-        print(f"{ability:50s} (n={count:4d}): {acc:.4f}")
+        ci = f"  {format_ci(cis[ability])}" if cis else ""
+        print(f"{ability:50s} (n={count:4d}): {acc:.4f}{ci}")
 
 
-def main(args):
-    data = load_data(args.input)
+def print_paired_group(tests):
+    for ability, (diff, ci, p_value) in tests.items():
+        print(f"{ability:50s} {format_paired(diff, ci, p_value)}")
+
 
-    # 为每条数据增加pred_option字段
+def add_predictions(data):
+    """为每条数据增加pred_option字段"""
     for d in data:
         options = {
             "A": d.get("OPTION-A", ""),
@@ -70,22 +120,106 @@ def main(args):
         }
         generated = d.get("GENARATED_ANSWER", "")
         d["pred_option"] = match_generated_to_option(generated, options)
+    return data
+
+
+def evaluate(data, reference=None, n_resamples=N_RESAMPLES):
+    """Compute every reported metric once; the text report and metrics records are views of it."""
+    total_ci, ci_group = accuracy_ci(data, n_resamples=n_resamples)
+    results = {
+        "accuracy": accuracy(data),
+        "n": sum(1 for d in data if d.get("pred_option") is not None),
+        "ci": total_ci,
+        "accuracy_group": accuracy_by_ability(data),
+        "ci_group": ci_group,
+        "paired": {},
+    }
+
+    if reference is not None:
+        ref_name, ref_data = reference
+        results["paired"][ref_name] = paired_accuracy(data, ref_data, n_resamples=n_resamples)
 
+    return results
+
+
+def print_report(results):
     print("=" * 60)
     print("Free Response Evaluation")
     print("=" * 60)
 
-    total_acc = accuracy(data)
-    print(f"Total Exact Match Accuracy: {total_acc:.4f}\n")
+    print(f"Total Exact Match Accuracy: {results['accuracy']:.4f}  {format_ci(results['ci'])}\n")
 
     print("Accuracy by Ability:")
-    acc_group = accuracy_by_ability(data)
-    print_accuracy_group(acc_group)
+    print_accuracy_group(results["accuracy_group"], results["ci_group"])
     print()
 
+    for ref, tests in results["paired"].items():
+        print(f"Paired Test (EM vs {ref}):")
+        print_paired_group(tests)
+        print()
 
-if __name__ == "__main__":
+
+def metrics_records(results, meta):
+    def paired(ability):
+        return {ref: tests[ability] for ref, tests in results["paired"].items() if ability in tests}
+
+    records = [make_record(
+        meta, "EM", "Overall", results["accuracy"], results["n"], results["ci"],
+        paired=paired("Overall"),
+    )]
+    for ability, (acc, count) in results["accuracy_group"].items():
+        records.append(make_record(
+            meta, "EM", ability, acc, count, results["ci_group"].get(ability),
+            paired=paired(ability),
+        ))
+    return records
+
+
+def report_file(path, args):
+    """Evaluate one result file, write its metrics (and log), and return (report text, metrics records)."""
+    data = add_predictions(load_data(path))
+
+    reference = None
+    compare = resolve_compare(args.compare, path)
+    if compare:
+        reference = (Path(compare).stem, add_predictions(load_data(compare)))
+
+    results = evaluate(data, reference, args.n_resamples)
+
+    text = capture(print_report, results)
+
+    meta = resolve_meta(args, path, "FR")
+    records = metrics_records(results, meta)
+    write_metrics(metrics_path(args.metrics_dir, path), records)
+    write_log(args.logs_dir, path, text)
+
+    return text, records
+
+
+def main(args):
+    files = expand_inputs(args.inputs, method="FR")
+
+    if not files:
+        print(f"No FR result files found in {args.inputs}")
+        return
+
+    reports = map_files(partial(report_file, args=args), files, args.workers)
+
+    print("".join(text for text, _ in reports), end="")
+
+    print_combined([r for _, records in reports for r in records])
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Evaluate Free Response answers")
-    parser.add_argument("--input", required=True, help="Path to the Free Response results JSONL file")
-    args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    parser.add_argument("--inputs", "--input", nargs="+", required=True, help="Free Response result JSONL files, directories or globs")
+    parser.add_argument("--compare", default=None, help="Reference FR result file for paired tests (matched by EXP_IDX), or 'auto'")
+    parser.add_argument("--n_resamples", type=int, default=N_RESAMPLES, help="Bootstrap / permutation resamples")
+    add_meta_args(parser)
+    add_parallel_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    main(args)
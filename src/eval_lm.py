@@ -2,90 +2,172 @@
 
 
 import argparse
-import json
-from collections import defaultdict
+from functools import partial
+from pathlib import Path
 
+import numpy as np
 
-def load_data(path):
-    with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+from bootstrap import N_RESAMPLES, bootstrap_ci, format_ci, format_paired, paired_test
+from data_stream import load_data
+from metrics import add_meta_args, make_record, metrics_path, print_combined, resolve_compare, resolve_meta, write_metrics
+from parallel import add_parallel_args, capture, expand_inputs, map_files, write_log
 
 
-def accuracy(data, pred_key="pred_raw"):
-    correct = sum(d[pred_key] == d["answer"] for d in data)
-    return correct / len(data) if data else 0.0
+OPTION_KEYS = ["A", "B", "C", "D"]
 
+SCORE_KEYS = ["raw_scores", "normalized_scores"]
 
-def accuracy_by_ability(data, pred_key="pred_raw"):
-    groups = defaultdict(lambda: [0, 0])  # ability -> [correct, total]
 
-    for d in data:
-        ability = d.get("ABILITY", "UNKNOWN")
-        groups[ability][1] += 1
-        groups[ability][0] += int(d[pred_key] == d["answer"])
+# ============================================================
+# Array Loading
+# ============================================================
 
-    accs = {}
-    for ability in sorted(groups):
-        c, t = groups[ability]
-        accs[ability] = (c / t if t > 0 else 0.0, t)
-    return accs
+def load_arrays(data):
+    """
+    Load LM results once into arrays:
+        raw_scores / normalized_scores: (n, 4) float score matrices
+        gold:          (n,) index of the correct option, -1 if not in A-D
+        ability_codes: (n,) index into the sorted `abilities` list
+    """
+    gold = np.array(
+        [OPTION_KEYS.index(d["answer"]) if d["answer"] in OPTION_KEYS else -1 for d in data],
+        dtype=np.int64,
+    )
+
+    abilities, ability_codes = np.unique(
+        np.array([d.get("ABILITY", "UNKNOWN") for d in data], dtype=object),
+        return_inverse=True,
+    )
+
+    arrays = {
+        "idx": np.array([d.get("idx", i) for i, d in enumerate(data)], dtype=np.int64),
+        "gold": gold,
+        "abilities": [str(a) for a in abilities],
+        "ability_codes": ability_codes.reshape(-1),
+    }
+
+    for score_key in SCORE_KEYS:
+        scores = np.array([d[score_key] for d in data], dtype=np.float64)
+        arrays[score_key] = scores.reshape(len(data), -1 if data else len(OPTION_KEYS))
+
+    return arrays
+
+
+# ============================================================
+# Vectorized Metrics
+# ============================================================
+
+def correct_mask(arrays, score_key="raw_scores"):
+    """Whether argmax(scores) hits the gold option, per row."""
+    pred = arrays[score_key].argmax(axis=1)
+    return pred == arrays["gold"]
 
 
-def compute_margin(data, score_key="raw_scores"):
+def margins(arrays, score_key="raw_scores"):
     """
     Margin = score(correct answer) - max(score(other options))
+
+    Returns (margins, valid) where `valid` masks rows whose gold label is in A-D.
     """
-    margins = []
-    for d in data:
-        answer = d["answer"]
-        scores = d[score_key]
-        answer_idx = None
-        # Find index of correct answer in map keys
-        for i, key in enumerate(["A", "B", "C", "D"]):
-            if key == answer:
-                answer_idx = i
-                break
-        if answer_idx is None:
-            # answer label not found, skip margin calculation
-            continue
-        correct_score = scores[answer_idx]
-        other_scores = scores[:answer_idx] + scores[answer_idx + 1:]
-        margin = correct_score - max(other_scores) if other_scores else 0.0
-        margins.append(margin)
-    return sum(margins) / len(margins) if margins else 0.0
-
-
-def margin_by_ability(data, score_key="raw_scores"):
-    groups = defaultdict(list)  # ability -> list of margins
-
-    for d in data:
-        ability = d.get("ABILITY", "UNKNOWN")
-
-        answer = d["answer"]
-        scores = d[score_key]
-        answer_idx = None
-        for i, key in enumerate(["A", "B", "C", "D"]):
-            if key == answer:
-                answer_idx = i
-                break
-        if answer_idx is None:
+    scores = arrays[score_key]
+    gold = arrays["gold"]
+    valid = gold >= 0
+
+    rows = np.arange(len(gold))
+    safe_gold = np.where(valid, gold, 0)
+
+    correct_score = scores[rows, safe_gold]
+
+    others = scores.copy()
+    others[rows, safe_gold] = -np.inf
+    best_other = others.max(axis=1) if scores.shape[1] > 1 else correct_score
+
+    return np.where(valid, correct_score - best_other, 0.0), valid
+
+
+def group_mean(values, arrays, mask=None):
+    """Mean and count of `values` per ability, as {ability: (mean, count)}."""
+    codes = arrays["ability_codes"]
+    n_groups = len(arrays["abilities"])
+
+    if mask is None:
+        mask = np.ones(len(codes), dtype=bool)
+
+    counts = np.bincount(codes[mask], minlength=n_groups)
+    sums = np.bincount(codes[mask], weights=values[mask].astype(np.float64), minlength=n_groups)
+
+    groups = {}
+    for g, ability in enumerate(arrays["abilities"]):
+        if counts[g] == 0:
             continue
-        correct_score = scores[answer_idx]
-        other_scores = scores[:answer_idx] + scores[answer_idx + 1:]
-        margin = correct_score - max(other_scores) if other_scores else 0.0
+        groups[ability] = (float(sums[g] / counts[g]), int(counts[g]))
+    return groups
+
+
+def accuracy(arrays, score_key="raw_scores"):
+    correct = correct_mask(arrays, score_key)
+    return float(correct.mean()) if len(correct) else 0.0
+
+
+def accuracy_by_ability(arrays, score_key="raw_scores"):
+    return group_mean(correct_mask(arrays, score_key), arrays)
+
+
+def compute_margin(arrays, score_key="raw_scores"):
+    ms, valid = margins(arrays, score_key)
+    return float(ms[valid].mean()) if valid.any() else 0.0
+
 
-        groups[ability].append(margin)
+def margin_by_ability(arrays, score_key="raw_scores"):
+    ms, valid = margins(arrays, score_key)
+    return group_mean(ms, arrays, mask=valid)
 
-    margins = {}
-    for ability in sorted(groups):
-        ms = groups[ability]
-        margins[ability] = (sum(ms) / len(ms) if ms else 0.0, len(ms))
-    return margins
 
+# ============================================================
+# Confidence Intervals & Paired Tests
+# ============================================================
 
-def print_accuracy_group(accs):
+def accuracy_ci(arrays, score_key="raw_scores", n_resamples=N_RESAMPLES):
+    """Bootstrap CI of the total accuracy and of each ability's accuracy."""
+    correct = correct_mask(arrays, score_key)
+    codes = arrays["ability_codes"]
+
+    total = bootstrap_ci(correct, n_resamples=n_resamples)
+    by_ability = {
+        ability: bootstrap_ci(correct[codes == g], n_resamples=n_resamples)
+        for g, ability in enumerate(arrays["abilities"])
+        if (codes == g).any()
+    }
+    return total, by_ability
+
+
+def paired_accuracy(a, b, arrays, n_resamples=N_RESAMPLES):
+    """Paired test of per-item correctness a vs b, overall and by ability."""
+    codes = arrays["ability_codes"]
+
+    tests = {"Overall": paired_test(a, b, n_resamples=n_resamples)}
+    for g, ability in enumerate(arrays["abilities"]):
+        mask = codes == g
+        if mask.any():
+            tests[ability] = paired_test(a[mask], b[mask], n_resamples=n_resamples)
+    return tests
+
+
+def align(arrays, other):
+    """Row positions of items (by idx) present in both result files."""
+    _, rows, other_rows = np.intersect1d(arrays["idx"], other["idx"], return_indices=True)
+    return rows, other_rows
+
+
+def print_accuracy_group(accs, cis=None):
     for ability, (acc, count) in accs.items():
-        print(f"{ability:50s} (n={count:4d}): {acc:.4f}")
+        ci = f"  {format_ci(cis[ability])}" if cis else ""
+        print(f"{ability:50s} (n={count:4d}): {acc:.4f}{ci}")
+
+
+def print_paired_group(tests):
+    for ability, (diff, ci, p_value) in tests.items():
+        print(f"{ability:50s} {format_paired(diff, ci, p_value)}")
 
 
 def print_margin_group(margins):
@@ -93,52 +175,167 @@ def print_margin_group(margins):
         print(f"{ability:50s} (n={count:4d}): {margin:.4f}")
 
 
-def main(args):
-    data = load_data(args.input)
+# ============================================================
+# Evaluation
+# ============================================================
+
+SETTINGS = [("Raw", "raw_scores"), ("Norm", "normalized_scores")]
+
+
+def evaluate(arrays, reference=None, n_resamples=N_RESAMPLES):
+    """
+    Compute every reported metric once; the text report and the
+    metrics records are both views of this dict.
+    """
+    results = {}
+
+    for setting, score_key in SETTINGS:
+        total_ci, ci_group = accuracy_ci(arrays, score_key, n_resamples)
+        results[setting] = {
+            "accuracy": accuracy(arrays, score_key),
+            "n": len(arrays["gold"]),
+            "ci": total_ci,
+            "accuracy_group": accuracy_by_ability(arrays, score_key),
+            "ci_group": ci_group,
+            "margin": compute_margin(arrays, score_key),
+            "margin_group": margin_by_ability(arrays, score_key),
+            "paired": {},
+        }
+
+    results["Norm"]["paired"]["Raw"] = paired_accuracy(
+        correct_mask(arrays, "normalized_scores"),
+        correct_mask(arrays, "raw_scores"),
+        arrays,
+        n_resamples,
+    )
+
+    if reference is not None:
+        ref_name, other = reference
+        rows, other_rows = align(arrays, other)
+        sub = {key: value[rows] for key, value in arrays.items() if key != "abilities"}
+        sub["abilities"] = arrays["abilities"]
+
+        for setting, score_key in SETTINGS:
+            results[setting]["paired"][ref_name] = paired_accuracy(
+                correct_mask(arrays, score_key)[rows],
+                correct_mask(other, score_key)[other_rows],
+                sub,
+                n_resamples,
+            )
+
+    return results
+
+
+def print_report(results):
+    raw, norm = results["Raw"], results["Norm"]
 
     print("=" * 60)
     print("LM Probing Evaluation")
     print("=" * 60)
 
     # Accuracy total
-    raw_acc = accuracy(data, "pred_raw")
-    norm_acc = accuracy(data, "pred_norm")
-
-    print(f"Total Accuracy (Raw):       {raw_acc:.4f}")
-    print(f"Total Accuracy (Normalized): {norm_acc:.4f}\n")
+    print(f"Total Accuracy (Raw):       {raw['accuracy']:.4f}  {format_ci(raw['ci'])}")
+    print(f"Total Accuracy (Normalized): {norm['accuracy']:.4f}  {format_ci(norm['ci'])}\n")
 
     # Accuracy by ability
     print("Accuracy by Ability (Raw):")
-    raw_acc_group = accuracy_by_ability(data, "pred_raw")
-    print_accuracy_group(raw_acc_group)
+    print_accuracy_group(raw["accuracy_group"], raw["ci_group"])
     print()
 
     print("Accuracy by Ability (Normalized):")
-    norm_acc_group = accuracy_by_ability(data, "pred_norm")
-    print_accuracy_group(norm_acc_group)
+    print_accuracy_group(norm["accuracy_group"], norm["ci_group"])
     print()
 
     # Margin total
-    raw_margin = compute_margin(data, "raw_scores")
-    norm_margin = compute_margin(data, "normalized_scores")
-
-    print(f"Total Margin (Raw):       {raw_margin:.4f}")
-    print(f"Total Margin (Normalized): {norm_margin:.4f}\n")
+    print(f"Total Margin (Raw):       {raw['margin']:.4f}")
+    print(f"Total Margin (Normalized): {norm['margin']:.4f}\n")
 
     # Margin by ability
     print("Margin by Ability (Raw):")
-    raw_margin_group = margin_by_ability(data, "raw_scores")
-    print_margin_group(raw_margin_group)
+    print_margin_group(raw["margin_group"])
     print()
 
     print("Margin by Ability (Normalized):")
-    norm_margin_group = margin_by_ability(data, "normalized_scores")
-    print_margin_group(norm_margin_group)
+    print_margin_group(norm["margin_group"])
     print()
 
+    # Paired tests
+    for setting, _ in reversed(SETTINGS):
+        for ref, tests in results[setting]["paired"].items():
+            print(f"Paired Test ({setting} vs {ref}):")
+            print_paired_group(tests)
+            print()
 
-if __name__ == "__main__":
+
+def metrics_records(results, meta):
+    records = []
+
+    for setting, _ in SETTINGS:
+        r = results[setting]
+
+        def paired(ability):
+            return {ref: tests[ability] for ref, tests in r["paired"].items() if ability in tests}
+
+        records.append(make_record(
+            meta, setting, "Overall", r["accuracy"], r["n"], r["ci"],
+            setting, r["margin"], paired("Overall"),
+        ))
+
+        for ability, (acc, count) in r["accuracy_group"].items():
+            margin = r["margin_group"].get(ability, (None, 0))[0]
+            records.append(make_record(
+                meta, setting, ability, acc, count, r["ci_group"].get(ability),
+                setting, margin, paired(ability),
+            ))
+
+    return records
+
+
+def report_file(path, args):
+    """Evaluate one result file, write its metrics (and log), and return (report text, metrics records)."""
+    arrays = load_arrays(load_data(path))
+
+    reference = None
+    compare = resolve_compare(args.compare, path)
+    if compare:
+        reference = (Path(compare).stem, load_arrays(load_data(compare)))
+
+    results = evaluate(arrays, reference, args.n_resamples)
+
+    text = capture(print_report, results)
+
+    meta = resolve_meta(args, path, "LM")
+    records = metrics_records(results, meta)
+    write_metrics(metrics_path(args.metrics_dir, path), records)
+    write_log(args.logs_dir, path, text)
+
+    return text, records
+
+
+def main(args):
+    files = expand_inputs(args.inputs, method="LM")
+
+    if not files:
+        print(f"No LM result files found in {args.inputs}")
+        return
+
+    reports = map_files(partial(report_file, args=args), files, args.workers)
+
+    print("".join(text for text, _ in reports), end="")
+
+    print_combined([r for _, records in reports for r in records])
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Evaluate LM probing results with raw and normalized scores")
-    parser.add_argument("--input", required=True, help="Path to the LM probing result JSONL file")
-    args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    parser.add_argument("--inputs", "--input", nargs="+", required=True, help="LM probing result JSONL files, directories or globs")
+    parser.add_argument("--compare", default=None, help="Reference LM result file for paired tests (matched by idx), or 'auto'")
+    parser.add_argument("--n_resamples", type=int, default=N_RESAMPLES, help="Bootstrap / permutation resamples")
+    add_meta_args(parser)
+    add_parallel_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    main(args)
@@ -1,9 +1,24 @@
 # src/eval_mc.py
 
 import argparse
+from functools import partial
 from pathlib import Path
 
-from mc import aggregate_mc_results
+import numpy as np
+
+from bootstrap import N_RESAMPLES, bootstrap_ci, format_ci, format_paired, paired_test
+from metrics import add_meta_args, make_record, metrics_path, print_combined, resolve_compare, resolve_meta, write_metrics
+from parallel import add_parallel_args, capture, expand_inputs, map_files, write_log
+from mc import (
+    aggregate_mc_results,
+    batch_majority_vote,
+    expected_accuracy,
+    load_mc_matrix,
+    load_mc_weights,
+    vote_stability,
+    UNPARSED,
+    WEIGHTINGS,
+)
 
 
 # ============================================================
@@ -53,6 +68,85 @@ def accuracy_by_ability(results):
     return accs
 
 
+# ============================================================
+# Confidence Intervals & Paired Tests
+# ============================================================
+
+def item_arrays(results):
+    """
+    Per-item correct and parsed counts (runs of the same idx are summed),
+    so that resampling is done over items rather than individual runs.
+    """
+    n = max(r["idx"] for r in results) + 1
+
+    correct = np.zeros(n)
+    parsed = np.zeros(n)
+    abilities = np.full(n, "UNKNOWN", dtype=object)
+
+    for r in results:
+
+        i = r["idx"]
+        abilities[i] = r.get("ABILITY") or "UNKNOWN"
+
+        if r.get("parsed", True):
+            parsed[i] += 1
+            correct[i] += int(r["correct"])
+
+    return correct, parsed, abilities
+
+
+def accuracy_ci(results, n_resamples=N_RESAMPLES):
+    """Bootstrap CI of the accuracy over parsed runs, overall and by ABILITY."""
+    correct, parsed, abilities = item_arrays(results)
+
+    total = bootstrap_ci(correct, weights=parsed, n_resamples=n_resamples)
+
+    groups = {}
+
+    for ability in sorted(set(abilities) - {"UNKNOWN"}):
+
+        mask = (abilities == ability) & (parsed > 0)
+
+        if mask.any():
+            groups[ability] = bootstrap_ci(
+                correct[mask], weights=parsed[mask], n_resamples=n_resamples
+            )
+
+    return total, groups
+
+
+def paired_accuracy(results, reference, n_resamples=N_RESAMPLES):
+    """
+    Paired test of per-item accuracy (correct / parsed runs) against a reference,
+    over items parsed in both. Returns {"Overall" | ability: (diff, ci, p_value)}.
+    """
+    correct, parsed, abilities = item_arrays(results)
+    ref_correct, ref_parsed, _ = item_arrays(reference)
+
+    n = min(len(parsed), len(ref_parsed))
+    both = (parsed[:n] > 0) & (ref_parsed[:n] > 0)
+
+    rate = correct[:n][both] / parsed[:n][both]
+    ref_rate = ref_correct[:n][both] / ref_parsed[:n][both]
+    abilities = abilities[:n][both]
+
+    tests = {"Overall": paired_test(rate, ref_rate, n_resamples=n_resamples)}
+
+    for ability in sorted(set(abilities) - {"UNKNOWN"}):
+        mask = abilities == ability
+        tests[ability] = paired_test(rate[mask], ref_rate[mask], n_resamples=n_resamples)
+
+    return tests
+
+
+def print_paired(title, tests):
+
+    print(f"  Paired Test ({title}):")
+
+    for k, (diff, ci, p_value) in tests.items():
+        print(f"    {k:50s} {format_paired(diff, ci, p_value)}")
+
+
 # ============================================================
 # Main Evaluation
 # ============================================================
@@ -73,80 +167,285 @@ def evaluate(path, try_times, seed):
     raw_group = accuracy_by_ability(raw)
     vote_group = accuracy_by_ability(voted)
 
-    return raw_acc, vote_acc, parse_rate, raw_group, vote_group
+    return raw_acc, vote_acc, parse_rate, raw_group, vote_group, raw, voted
+
+
+def evaluate_seeds(path, try_times, seeds, weighting="majority"):
+    """
+    Batch voting over many seeds at once.
+
+    Returns per-seed vote accuracies, mean vote margin, mean agreement,
+    the (n_seeds, try_times) stability curve and, with a score `weighting`,
+    the same curve for weighted votes (else None).
+    """
+    preds, gold, _ = load_mc_matrix(path, try_times=try_times)
+
+    voted, margin, agreement = batch_majority_vote(preds, seeds=seeds)
+
+    parsed = voted != UNPARSED
+    seed_accs = ((voted == gold) & parsed).sum(axis=1) / np.maximum(parsed.sum(axis=1), 1)
+
+    curve = vote_stability(preds, gold, seeds)
+
+    weighted_curve = None
+
+    if weighting != "majority":
+        weights = load_mc_weights(path, try_times=try_times, weighting=weighting)
+        weighted_curve = vote_stability(preds, gold, seeds, weights=weights[:, :preds.shape[1]])
+
+    return seed_accs, margin.mean(), agreement.mean(), curve, weighted_curve
+
+
+def evaluate_weighted(path, args, voted):
+    """Score-weighted vote (args.weighting) next to the majority vote's expected-accuracy estimates."""
+
+    _, weighted = aggregate_mc_results(path, try_times=args.try_times, seed=args.seed, weighting=args.weighting)
+
+    ci, _ = accuracy_ci(weighted, args.n_resamples)
+
+    return {
+        "weighting": args.weighting,
+        "accuracy": accuracy(weighted),
+        "ci": ci,
+        "expected": expected_accuracy(weighted),
+        "majority_expected": expected_accuracy(voted),
+    }
+
+
+def evaluate_file(path, args, reference=None):
+    """
+    Compute every reported metric for one result file; the text report
+    and the metrics records are both views of this dict.
+    """
+
+    (
+        raw_acc,
+        vote_acc,
+        parse_rate,
+        raw_group,
+        vote_group,
+        raw,
+        voted,
+    ) = evaluate(
+        path,
+        args.try_times,
+        args.seed,
+    )
+
+    raw_ci, raw_ci_group = accuracy_ci(raw, args.n_resamples)
+    vote_ci, vote_ci_group = accuracy_ci(voted, args.n_resamples)
+
+    results = {
+        "name": Path(path).stem,
+        "parse_rate": parse_rate,
+        "Raw": {
+            "accuracy": raw_acc,
+            "n": sum(r.get("parsed", True) for r in raw),
+            "ci": raw_ci,
+            "accuracy_group": raw_group,
+            "ci_group": raw_ci_group,
+            "paired": {},
+        },
+        "Vote": {
+            "accuracy": vote_acc,
+            "n": sum(r.get("parsed", True) for r in voted),
+            "ci": vote_ci,
+            "accuracy_group": vote_group,
+            "ci_group": vote_ci_group,
+            "paired": {"Raw": paired_accuracy(voted, raw, args.n_resamples)},
+        },
+        "seeds": None,
+        "weighted": None,
+    }
+
+    if args.weighting != "majority":
+        results["weighted"] = evaluate_weighted(path, args, voted)
+
+    if reference is not None:
+
+        ref_name, (ref_raw, ref_voted) = reference
+
+        results["Raw"]["paired"][ref_name] = paired_accuracy(raw, ref_raw, args.n_resamples)
+        results["Vote"]["paired"][ref_name] = paired_accuracy(voted, ref_voted, args.n_resamples)
+
+    if args.vote_seeds > 1 or args.stability:
+
+        seeds = list(range(args.seed, args.seed + args.vote_seeds))
+
+        results["seeds"] = (seeds, *evaluate_seeds(path, args.try_times, seeds, args.weighting))
+
+    return results
+
+
+def print_report(results, stability=False):
+
+    print(f"[{results['name']}]")
+    print(f"  Raw Acc    : {results['Raw']['accuracy']:.4f}  {format_ci(results['Raw']['ci'])}")
+    print(f"  Vote Acc   : {results['Vote']['accuracy']:.4f}  {format_ci(results['Vote']['ci'])}")
+    print(f"  Parse Rate : {results['parse_rate']:.4f}")
+    print()
+
+    for setting in ["Raw", "Vote"]:
+
+        group = results[setting]["accuracy_group"]
+        ci_group = results[setting]["ci_group"]
+
+        print(f"  Accuracy by ABILITY ({setting}):")
+
+        if not group:
+            print("    (No valid samples)")
+        else:
+            for k in sorted(group):
+
+                acc, n = group[k]
+                print(f"    {k:50s} (n={n:4d}): {acc:.4f}  {format_ci(ci_group[k])}")
+
+        if setting == "Raw":
+            print()
+
+    # ---------- Paired ----------
+    print()
+
+    for setting in ["Vote", "Raw"]:
+        for ref, tests in results[setting]["paired"].items():
+            print_paired(f"{setting} vs {ref}", tests)
+
+    # ---------- Weighted vote ----------
+    w = results["weighted"]
+
+    if w is not None:
+
+        print()
+        print(f"  Weighted Vote ({w['weighting']}):")
+        print(f"    Acc            : {w['accuracy']:.4f}  {format_ci(w['ci'])}")
+        print(f"    Soft Acc       : {w['expected']['soft_accuracy']:.4f}  (majority: {w['majority_expected']['soft_accuracy']:.4f})")
+        print(f"    Confidence     : {w['expected']['confidence']:.4f}  (majority: {w['majority_expected']['confidence']:.4f})")
+
+    # ---------- Seeds / Stability ----------
+    if results["seeds"] is not None:
+
+        seeds, seed_accs, mean_margin, mean_agreement, curve, weighted_curve = results["seeds"]
+
+        print()
+        print(f"  Seeded Vote ({len(seeds)} seeds):")
+        print(f"    Mean Acc       : {seed_accs.mean():.4f}")
+        print(f"    Std Acc        : {seed_accs.std():.4f}")
+        print(f"    Mean Margin    : {mean_margin:.4f}")
+        print(f"    Mean Agreement : {mean_agreement:.4f}")
+
+        if stability:
+
+            print()
+            print("  Stability by try_times (mean over seeds):")
+
+            for k, accs in enumerate(curve.T, 1):
+
+                line = f"    k={k:<3d}: {accs.mean():.4f} (std={accs.std():.4f})"
+
+                if weighted_curve is not None:
+                    line += f"   weighted: {weighted_curve[:, k - 1].mean():.4f} (std={weighted_curve[:, k - 1].std():.4f})"
+
+                print(line)
+
+    print("-" * 60)
+
+
+def metrics_records(results, meta):
+
+    records = []
+
+    for setting in ["Raw", "Vote"]:
+
+        r = results[setting]
+
+        def paired(ability):
+            return {ref: tests[ability] for ref, tests in r["paired"].items() if ability in tests}
+
+        records.append(make_record(
+            meta, setting, "Overall", r["accuracy"], r["n"], r["ci"],
+            paired=paired("Overall"),
+        ))
+
+        for k in sorted(r["accuracy_group"]):
+
+            acc, n = r["accuracy_group"][k]
+
+            records.append(make_record(
+                meta, setting, k, acc, n, r["ci_group"][k],
+                paired=paired(k),
+            ))
+
+    return records
 
 
 # ============================================================
 # CLI
 # ============================================================
 
-def main(args):
-
-    files = [Path(p) for p in args.inputs]
+def print_header(args):
 
     print("=" * 60)
     print("MC Evaluation")
     print("=" * 60)
     print(f"Try times : {args.try_times}")
     print(f"Seed      : {args.seed}")
+
+    if args.weighting != "majority":
+        print(f"Weighting : {args.weighting}")
     print("-" * 60)
 
-    for path in files:
-
-        (
-            raw_acc,
-            vote_acc,
-            parse_rate,
-            raw_group,
-            vote_group,
-        ) = evaluate(
-            path,
-            args.try_times,
-            args.seed,
+
+def report_file(path, args):
+    """Evaluate one result file, write its metrics (and log), and return (report block, metrics records)."""
+
+    reference = None
+    compare = resolve_compare(args.compare, path)
+
+    if compare:
+        reference = (
+            Path(compare).stem,
+            aggregate_mc_results(compare, try_times=args.try_times, seed=args.seed),
         )
 
-        name = path.stem
+    results = evaluate_file(path, args, reference)
 
-        print(f"[{name}]")
-        print(f"  Raw Acc    : {raw_acc:.4f}")
-        print(f"  Vote Acc   : {vote_acc:.4f}")
-        print(f"  Parse Rate : {parse_rate:.4f}")
-        print()
+    text = capture(print_report, results, stability=args.stability)
 
-        # ---------- Raw ----------
-        print("  Accuracy by ABILITY (Raw):")
+    meta = resolve_meta(args, path, "MC")
+    records = metrics_records(results, meta)
+    write_metrics(metrics_path(args.metrics_dir, path), records)
 
-        if not raw_group:
-            print("    (No valid samples)")
-        else:
-            for k in sorted(raw_group):
+    # A per-file log looks like a single-input run
+    header = capture(print_header, args)
+    write_log(args.logs_dir, path, header + text + "=" * 60 + "\n")
 
-                acc, n = raw_group[k]
-                print(f"    {k:50s} (n={n:4d}): {acc:.4f}")
+    return text, records
 
-        print()
 
-        # ---------- Vote ----------
-        print("  Accuracy by ABILITY (Vote):")
+def main(args):
 
-        if not vote_group:
-            print("    (No valid samples)")
-        else:
-            for k in sorted(vote_group):
+    files = expand_inputs(args.inputs, method="MC")
 
-                acc, n = vote_group[k]
-                print(f"    {k:50s} (n={n:4d}): {acc:.4f}")
+    if not files:
+        print(f"No MC result files found in {args.inputs}")
+        return
 
-        print("-" * 60)
+    reports = map_files(partial(report_file, args=args), files, args.workers)
+
+    print_header(args)
+
+    print("".join(text for text, _ in reports), end="")
 
     print("=" * 60)
 
+    print_combined([r for _, records in reports for r in records])
+
 
 # ============================================================
 # Entry
 # ============================================================
 
-if __name__ == "__main__":
+def build_parser():
 
     parser = argparse.ArgumentParser(
         description="Evaluate MC-Probing results"
@@ -156,6 +455,7 @@ if __name__ == "__main__":
         "--inputs",
         nargs="+",
         required=True,
+        help="MC result JSONL files, directories or globs",
     )
 
     parser.add_argument(
@@ -170,6 +470,48 @@ if __name__ == "__main__":
         default=42,
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="Reference MC result file for paired tests (e.g. base when evaluating CoT), or 'auto'",
+    )
+
+    parser.add_argument(
+        "--n_resamples",
+        type=int,
+        default=N_RESAMPLES,
+        help="Bootstrap / permutation resamples",
+    )
+
+    parser.add_argument(
+        "--vote_seeds",
+        type=int,
+        default=1,
+        help="Number of tie-breaking seeds (starting at --seed) for batch voting",
+    )
+
+    parser.add_argument(
+        "--stability",
+        action="store_true",
+        help="Report vote accuracy using only the first k runs, k = 1..try_times",
+    )
+
+    parser.add_argument(
+        "--weighting",
+        default="majority",
+        choices=WEIGHTINGS,
+        help="Also report a vote weighted by each run's recorded probability: answer = p(answer "
+             "letter), sequence = per-token mean; plus expected-accuracy estimates",
+    )
+
+    add_meta_args(parser)
+    add_parallel_args(parser)
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
 
     main(args)
\ No newline at end of file
@@ -0,0 +1,270 @@
+# src/gen_cache.py
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+import torch
+
+from assisted import assisted_generate
+from logprobs import token_logprobs
+from telemetry import timed_generate
+
+
+# ============================================================
+# Seeds
+# ============================================================
+
+def run_seed(seed, idx, run_id=0):
+    """
+    Seed of one generation, derived from (base seed, sample idx, run id).
+
+    Seeding every run separately makes its output independent of which
+    samples ran before it, so single runs can be cached and replayed.
+    Without a base seed the run stays unseeded (None).
+    """
+    if seed is None:
+        return None
+
+    digest = hashlib.sha256(f"{seed}:{idx}:{run_id}".encode()).digest()
+    return int.from_bytes(digest[:4], "little") & 0x7FFFFFFF
+
+
+# ============================================================
+# Generation Cache
+# ============================================================
+
+CACHE_PATH = ".cache/generations.sqlite"
+
+# generate() options that only add to what is returned
+RETURN_ONLY = {"output_logits"}
+
+
+def add_cache_args(parser):
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help=f"SQLite generation cache, e.g. {CACHE_PATH} (default: off); only seeded runs are cached",
+    )
+
+
+# Files whose change means different weights at the same local path
+WEIGHT_FILES = ["config.json", "*.safetensors", "*.safetensors.index.json", "*.bin"]
+
+
+def weights_fingerprint(name):
+    """
+    Size + mtime of a local checkpoint's config and weight files, or None for
+    hub models (their revision is the commit hash). Re-saved or fine-tuned
+    weights at the same path then get new cache keys.
+    """
+    path = Path(name)
+
+    if not path.is_dir():
+        return None
+
+    files = sorted({f for pattern in WEIGHT_FILES for f in path.glob(pattern)})
+    h = hashlib.sha256()
+
+    for f in files:
+        stat = f.stat()
+        h.update(f"{f.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+
+    return h.hexdigest()
+
+
+def model_identity(model, name):
+    """(model id, revision, weights fingerprint, dtype) part of every cache key."""
+
+    config = getattr(model, "config", None)
+    revision = getattr(config, "_commit_hash", None)
+
+    return {
+        "model": name,
+        "revision": revision,
+        "weights": weights_fingerprint(name),
+        "dtype": str(model.dtype),
+    }
+
+
+class GenerationCache:
+    """
+    Generated token ids keyed by (model id/revision/weights, dtype, prompt token ids,
+    sampling parameters, seed).
+
+    Only the newly generated ids are stored; callers decode them exactly as
+    they would decode fresh model output. Runs generated with output_logits
+    also store their token log-probabilities, so a hit can be scored
+    without another forward pass.
+    """
+
+    def __init__(self, path, identity):
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.identity = identity
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "key TEXT PRIMARY KEY, "
+            "output_ids TEXT NOT NULL, "
+            "token_logprobs TEXT, "
+            "created REAL DEFAULT (julianday('now')))"
+        )
+
+        # Caches written before token_logprobs was stored
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(generations)")]
+
+        if "token_logprobs" not in columns:
+            self.conn.execute("ALTER TABLE generations ADD COLUMN token_logprobs TEXT")
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, prompt_ids, params):
+        payload = {**self.identity, "prompt_ids": list(prompt_ids), **params}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, prompt_ids, params):
+        """(new token ids, token log-probabilities or None), or None on a miss."""
+
+        row = self.conn.execute(
+            "SELECT output_ids, token_logprobs FROM generations WHERE key = ?",
+            (self.key(prompt_ids, params),),
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[0]), (json.loads(row[1]) if row[1] is not None else None)
+
+    def put(self, prompt_ids, params, output_ids, token_logprobs=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO generations (key, output_ids, token_logprobs) VALUES (?, ?, ?)",
+            (
+                self.key(prompt_ids, params),
+                json.dumps(list(output_ids)),
+                json.dumps(token_logprobs) if token_logprobs is not None else None,
+            ),
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def open_cache(args, model):
+    """GenerationCache for a runner, or None without --cache."""
+
+    if args.cache is None:
+        return None
+
+    return GenerationCache(args.cache, model_identity(model, args.model))
+
+
+# ============================================================
+# Cached Generation
+# ============================================================
+
+def cache_params(kwargs, seed, draft=None, batching=None):
+    """
+    The generate() options that are part of a cache key, plus the execution
+    path when it is not one generate() call per run (e.g. "continuous").
+    """
+
+    params = {k: v for k, v in kwargs.items() if k not in RETURN_ONLY}
+    params["seed"] = seed
+
+    # Static cache / compiled decode flips fp16 near-ties: keyed by its mode
+    if "compile_config" in params:
+        params["compile_config"] = params["compile_config"].mode
+
+    # Assisted decoding changes outputs: speculative sampling consumes random
+    # numbers differently, and verifying draft tokens in one batched forward
+    # flips fp16 near-ties even for greedy runs
+    if draft is not None:
+        params["draft"] = draft.config._name_or_path
+
+    # Batched decode changes reduction order, which also flips fp16 near-ties
+    if batching is not None:
+        params["batching"] = batching
+
+    return params
+
+
+def cached_generate(model, inputs, cache=None, seed=None, draft=None, return_kv=False, **kwargs):
+    """
+    timed_generate() for a single prompt, seeded with `seed` and served from
+    `cache` when the same generation was run before. With a `draft` model the
+    generation is assisted (speculative).
+
+    Unseeded calls are never cached: their output is not reproducible.
+    All generate() keyword arguments except RETURN_ONLY are part of the key.
+
+    With return_kv=True a third value is returned: the KV cache left by
+    generate(), or None on a cache hit. Adding output_logits=True then also
+    puts the generated tokens' log-probabilities in stats["token_logprobs"]
+    (on a cache hit only if the cached run stored them).
+    """
+    prompt_ids = inputs["input_ids"][0].tolist()
+    params = cache_params(kwargs, seed, draft)
+
+    use_cache = cache is not None and seed is not None
+
+    if use_cache:
+
+        hit = cache.get(prompt_ids, params)
+
+        if hit is not None:
+
+            new_ids, logprobs = hit
+            outputs = torch.tensor([prompt_ids + new_ids], device=inputs["input_ids"].device)
+
+            stats = {
+                "prefill_s": 0.0,
+                "decode_s": 0.0,
+                "prompt_tokens": len(prompt_ids),
+                "generated_tokens": len(new_ids),
+                "cached": 1,
+            }
+
+            if return_kv and kwargs.get("output_logits") and logprobs is not None:
+                stats["token_logprobs"] = logprobs
+
+            return (outputs, stats, None) if return_kv else (outputs, stats)
+
+    if seed is not None:
+        torch.manual_seed(seed)
+
+    if return_kv:
+        kwargs["return_dict_in_generate"] = True
+
+    if draft is None:
+        outputs, stats = timed_generate(model, inputs, **kwargs)
+    else:
+        outputs, stats = assisted_generate(model, draft, inputs, **kwargs)
+
+    past_key_values = None
+
+    if return_kv:
+        past_key_values = outputs.past_key_values
+
+        if kwargs.get("output_logits"):
+            stats["token_logprobs"] = token_logprobs(outputs.logits, outputs.sequences[0, len(prompt_ids):])
+
+        outputs = outputs.sequences
+
+    stats["cached"] = 0
+
+    if use_cache:
+        cache.put(prompt_ids, params, outputs[0, len(prompt_ids):].tolist(), stats.get("token_logprobs"))
+
+    return (outputs, stats, past_key_values) if return_kv else (outputs, stats)
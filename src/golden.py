@@ -0,0 +1,369 @@
+# src/golden.py
+
+import argparse
+import importlib
+import importlib.util
+import json
+import shlex
+import sys
+from pathlib import Path
+
+import torch
+
+from eval_fr import add_predictions
+from mc import aggregate_mc_results, extract_run_answer
+from sweep import RUNNERS, load_model
+from tiny_model import save_tiny
+
+
+# ============================================================
+# Checks
+# ============================================================
+
+GOLDEN_DIR = ".cache/golden"
+
+TRY_TIMES = 3
+
+# Small budgets: the point is equivalence, not accuracy
+COMMON = {
+    "lm": "",
+    "mc": f"--try_times {TRY_TIMES} --max_new_tokens 16",
+    "fr": "--max_length 16",
+}
+
+# reference flags vs candidate flags of one runner; {workdir} / {draft} are filled in.
+# warm: run that side ("candidate" / "reference") twice and compare its second run (e.g. all cache hits).
+# requires: optional packages; the check is skipped where they are missing.
+# Static-cache checks come last: they compile the shared model's decode step.
+CHECKS = {
+    "lm-pipeline": {"method": "lm", "reference": "--pipeline_depth 0", "candidate": "--pipeline_depth 8"},
+    "lm-activations": {"method": "lm", "reference": "", "candidate": "--activations {workdir}/activations"},
+    "lm-batch": {"method": "lm", "reference": "", "candidate": "--batch_options --pad_to 32"},
+    "lm-onnx": {
+        "method": "lm", "reference": "", "candidate": "--backend onnx --onnx_dir {workdir}/onnx",
+        "requires": ["onnx", "onnxruntime"],
+    },
+    "mc-pipeline": {"method": "mc", "reference": "--pipeline_depth 0", "candidate": ""},
+    "mc-cache": {"method": "mc", "reference": "", "candidate": "--cache {workdir}/cache.sqlite", "warm": "candidate"},
+    "mc-draft": {"method": "mc", "reference": "--greedy", "candidate": "--greedy --draft_model {draft}"},
+    "fr-pipeline": {"method": "fr", "reference": "--pipeline_depth 0", "candidate": ""},
+    "fr-cache": {"method": "fr", "reference": "", "candidate": "--cache {workdir}/cache.sqlite", "warm": "candidate"},
+    "fr-draft": {"method": "fr", "reference": "--greedy", "candidate": "--greedy --draft_model {draft}"},
+    # Answer forcing on generate()'s KV cache vs a full forward pass (what a cache hit runs)
+    "mc-force": {
+        "method": "mc", "reference": "--force_answer --cache {workdir}/cache.sqlite", "candidate": "--force_answer",
+        "warm": "reference",
+    },
+    "mc-permutations": {"method": "mc", "reference": "--permutations 6 --no_shared_prefix", "candidate": "--permutations 6"},
+    "mc-continuous": {"method": "mc", "reference": "", "candidate": "--slots 4"},
+    "fr-continuous": {"method": "fr", "reference": "", "candidate": "--slots 4"},
+    "mc-static": {"method": "mc", "reference": "--greedy", "candidate": "--greedy --static_cache"},
+    "fr-static": {"method": "fr", "reference": "--greedy", "candidate": "--greedy --static_cache"},
+}
+
+
+# ============================================================
+# Runs
+# ============================================================
+
+def load_rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def run_path(runner_name, model, tokenizer, flags, output):
+    """Run one runner in-process on the shared model; returns its output rows."""
+
+    runner = importlib.import_module(runner_name)
+    args = runner.build_parser().parse_args(flags + ["--output", str(output)])
+
+    runner.main(args, model=model, tokenizer=tokenizer)
+
+    return load_rows(output)
+
+
+def with_derived(method, rows):
+    """Add the parsed answers the evaluators would compute, so they are diffed too."""
+
+    if method == "mc":
+        for row in rows:
+            row["parsed_answer"] = extract_run_answer(row)
+
+    if method == "fr":
+        add_predictions(rows)
+
+    return rows
+
+
+def row_key(row):
+    return row.get("idx", row.get("EXP_IDX")), row.get("run_id", 0)
+
+
+# ============================================================
+# Diff
+# ============================================================
+
+def new_field():
+    return {"compared": 0, "mismatches": 0, "max_abs_diff": 0.0, "examples": []}
+
+
+def diff_value(ref, cand, field, key, fields, atol, rtol):
+    """Recursive field-by-field diff; floats within atol + rtol * |ref|, everything else exact."""
+
+    if isinstance(ref, dict) and isinstance(cand, dict):
+        for k in sorted(set(ref) | set(cand), key=str):
+            diff_value(ref.get(k), cand.get(k), f"{field}.{k}" if field else k, key, fields, atol, rtol)
+        return
+
+    if isinstance(ref, list) and isinstance(cand, list) and len(ref) == len(cand):
+        for r, c in zip(ref, cand):
+            diff_value(r, c, field, key, fields, atol, rtol)
+        return
+
+    stats = fields.setdefault(field, new_field())
+    stats["compared"] += 1
+
+    numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (ref, cand))
+
+    if numeric and (isinstance(ref, float) or isinstance(cand, float)):
+        delta = abs(ref - cand)
+        stats["max_abs_diff"] = max(stats["max_abs_diff"], delta)
+        same = delta <= atol + rtol * abs(ref)
+    else:
+        same = ref == cand
+
+    if not same:
+        stats["mismatches"] += 1
+
+        if len(stats["examples"]) < 3:
+            stats["examples"].append({"key": list(key), "reference": ref, "candidate": cand})
+
+
+def diff_rows(ref_rows, cand_rows, atol, rtol):
+
+    fields = {}
+
+    ref_by_key = {row_key(r): r for r in ref_rows}
+    cand_by_key = {row_key(r): r for r in cand_rows}
+
+    rows = fields.setdefault("(rows)", new_field())
+
+    for key in sorted(set(ref_by_key) | set(cand_by_key), key=str):
+
+        rows["compared"] += 1
+
+        if key not in ref_by_key or key not in cand_by_key:
+            rows["mismatches"] += 1
+            if len(rows["examples"]) < 3:
+                rows["examples"].append({"key": list(key), "reference": key in ref_by_key, "candidate": key in cand_by_key})
+            continue
+
+        diff_value(ref_by_key[key], cand_by_key[key], "", key, fields, atol, rtol)
+
+    return fields
+
+
+def diff_votes(ref_path, cand_path, try_times, fields):
+    """Majority votes per sample (same tie-break seed on both sides) must match exactly."""
+
+    _, ref_votes = aggregate_mc_results(ref_path, try_times)
+    _, cand_votes = aggregate_mc_results(cand_path, try_times)
+
+    for r, c in zip(ref_votes, cand_votes):
+        diff_value(r["pred"], c["pred"], "(vote)", (r["idx"], None), fields, 0.0, 0.0)
+
+
+def run_check(name, check, model, tokenizer, paths, args):
+
+    missing = [m for m in check.get("requires", []) if importlib.util.find_spec(m) is None]
+
+    if missing:
+        return {
+            "check": name,
+            "method": check["method"],
+            "reference": check["reference"],
+            "candidate": check["candidate"],
+            "rows": 0,
+            "passed": True,
+            "skipped": f"needs {', '.join(missing)}",
+            "fields": {},
+        }
+
+    workdir = Path(args.workdir) / name
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    for stale in workdir.glob("cache.sqlite*"):
+        stale.unlink()
+
+    method = check["method"]
+    base = shlex.split(COMMON[method]) + ["--model", paths["model"], "--data", paths["data"]]
+
+    if method != "lm":
+        base += ["--seed", str(args.seed)]
+
+    def flags(spec):
+        return base + shlex.split(spec.format(workdir=workdir, draft=paths["draft"]))
+
+    ref_path = workdir / f"{method}_reference.jsonl"
+    cand_path = workdir / f"{method}_candidate.jsonl"
+
+    for _ in range(2 if check.get("warm") == "reference" else 1):
+        ref_rows = run_path(RUNNERS[method], model, tokenizer, flags(check["reference"]), ref_path)
+
+    for _ in range(2 if check.get("warm") == "candidate" else 1):
+        cand_rows = run_path(RUNNERS[method], model, tokenizer, flags(check["candidate"]), cand_path)
+
+    fields = diff_rows(with_derived(method, ref_rows), with_derived(method, cand_rows), args.atol, args.rtol)
+
+    if method == "mc":
+        diff_votes(ref_path, cand_path, TRY_TIMES, fields)
+
+    return {
+        "check": name,
+        "method": method,
+        "reference": check["reference"],
+        "candidate": check["candidate"],
+        "rows": len(ref_rows),
+        "passed": all(f["mismatches"] == 0 for f in fields.values()),
+        "fields": fields,
+    }
+
+
+# ============================================================
+# Report
+# ============================================================
+
+def snippet(ref, cand, width=40):
+    """Short views of two values; long strings are cut around their first difference."""
+
+    ref, cand = str(ref), str(cand)
+    start = 0
+
+    for start, (a, b) in enumerate(zip(ref, cand)):
+        if a != b:
+            break
+
+    start = max(start - width // 4, 0)
+
+    return ref[start:start + width], cand[start:start + width]
+
+
+def print_report(results, atol, rtol):
+
+    print("=" * 60)
+    print(f"Golden Equivalence  (floats: atol {atol:g} + rtol {rtol:g}, everything else exact)")
+    print("=" * 60)
+
+    for r in results:
+
+        if r.get("skipped"):
+            print(f"{r['check']:16s} SKIP  ({r['skipped']})")
+            continue
+
+        max_diff = max((f["max_abs_diff"] for f in r["fields"].values()), default=0.0)
+        status = "PASS" if r["passed"] else "FAIL"
+
+        print(f"{r['check']:16s} {status}  rows {r['rows']:4d}  fields {len(r['fields']):3d}  max |diff| {max_diff:.3g}")
+
+        for field, f in r["fields"].items():
+
+            if not f["mismatches"]:
+                continue
+
+            print(f"    {field:28s} {f['mismatches']}/{f['compared']} differ  (max |diff| {f['max_abs_diff']:.3g})")
+
+            for ex in f["examples"]:
+                ref, cand = snippet(ex["reference"], ex["candidate"])
+                print(f"        key={ex['key']}  ref={ref!r}  cand={cand!r}")
+
+    failed = [r["check"] for r in results if not r["passed"]]
+    skipped = [r["check"] for r in results if r.get("skipped")]
+    ran = len(results) - len(skipped)
+
+    print("-" * 60)
+    print(
+        f"{ran - len(failed)}/{ran} checks passed"
+        + (f"; FAILED: {', '.join(failed)}" if failed else "")
+        + (f"; skipped: {', '.join(skipped)}" if skipped else "")
+    )
+    print("=" * 60)
+
+
+# ============================================================
+# Main
+# ============================================================
+
+def main(args):
+
+    tiny = Path(args.tiny_dir)
+
+    if not args.model and not (tiny / "main").exists():
+        print("Building tiny model in", tiny)
+        save_tiny(tiny)
+
+    paths = {
+        "model": args.model or str(tiny / "main"),
+        "draft": args.draft_model or str(tiny / "draft"),
+        "data": args.data or str(tiny / "data.jsonl"),
+    }
+
+    names = args.checks or list(CHECKS)
+    unknown = [n for n in names if n not in CHECKS]
+
+    if unknown:
+        raise ValueError(f"Unknown checks: {unknown}; available: {list(CHECKS)}")
+
+    # Keep the registry order so static-cache checks run last
+    names = [n for n in CHECKS if n in names]
+
+    model, tokenizer = load_model(paths["model"], dtype=getattr(torch, args.dtype))
+
+    results = [run_check(n, CHECKS[n], model, tokenizer, paths, args) for n in names]
+
+    report_path = Path(args.workdir) / "report.json"
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"paths": paths, "atol": args.atol, "rtol": args.rtol, "results": results}, f, indent=2, default=str)
+
+    print_report(results, args.atol, args.rtol)
+    print("Report saved to:", report_path)
+
+    if not all(r["passed"] for r in results):
+        sys.exit(1)
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        description="Check that optimized execution paths reproduce the reference per-sample outputs"
+    )
+
+    parser.add_argument("--checks", nargs="+", default=None, help=f"Checks to run (default: all): {', '.join(CHECKS)}")
+    parser.add_argument("--tiny_dir", default=f"{GOLDEN_DIR}/tiny", help="Tiny local model + data (built offline if missing)")
+    parser.add_argument("--model", default=None, help="Model instead of the tiny one")
+    parser.add_argument("--draft_model", default=None, help="Draft model for the *-draft checks")
+    parser.add_argument("--data", default=None, help="Data instead of the tiny synthetic set")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--dtype",
+        default="float32",
+        choices=["float32", "float16", "bfloat16"],
+        help="Main model precision; float32 keeps rounding near-ties from flipping greedy tokens "
+             "(float16 = production precision)",
+    )
+    parser.add_argument("--atol", type=float, default=1e-4, help="Absolute tolerance for scores / probabilities")
+    parser.add_argument("--rtol", type=float, default=1e-4, help="Relative tolerance for scores / probabilities")
+    parser.add_argument("--workdir", default=GOLDEN_DIR, help="Outputs of both paths + report.json")
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
+
+    main(args)
@@ -2,6 +2,7 @@
 
 import numpy as np
 import torch
+from torch.profiler import record_function
 
 
 # ============================================================
@@ -29,6 +30,90 @@ def build_lm_prompt(story, question):
 # Language Model Prompting and Option Scoring
 # ============================================================
 
+def tokenize_option(tokenizer, prompt, option):
+    """Tokenize prompt + option; returns (inputs, number of option tokens)."""
+
+    full_text = prompt + " " + option
+
+    with record_function("tokenize"):
+        inputs = tokenizer(full_text, return_tensors="pt")
+        option_len = len(tokenizer(option).input_ids)
+
+    return inputs, option_len
+
+
+def tokenize_options(tokenizer, prompt, choices):
+    """tokenize_option() for every choice, e.g. ahead of time on another thread."""
+    return [tokenize_option(tokenizer, prompt, c) for c in choices]
+
+
+def score_tokenized(model, inputs, option_len, layers=None):
+    """
+    Sum log-probability of the last `option_len` tokens of tokenized prompt + option.
+
+    With `layers` (hidden_states indices) also returns their hidden states
+    from the same forward pass, stacked as (n_layers, seq, hidden).
+    """
+    inputs = inputs.to(model.device)
+
+    with record_function("forward"), torch.no_grad():
+        outputs = model(**inputs, output_hidden_states=layers is not None)
+
+    with record_function("log_softmax"):
+        # Shift logits and labels to compute log-probabilities
+        logits = outputs.logits[:, :-1]
+        labels = inputs["input_ids"][:, 1:]
+        log_probs = torch.nn.functional.log_softmax(logits, dim=-1)
+
+        # Gather log-probs of the actual tokens
+        token_logprobs = log_probs.gather(2, labels.unsqueeze(-1)).squeeze(-1)
+
+    # Calculate sum log-prob of the option tokens at the end
+    score = token_logprobs[0, -option_len:].sum().item()
+
+    if layers is not None:
+        return score, torch.stack([outputs.hidden_states[l][0] for l in layers])
+
+    return score
+
+
+def score_tokenized_batch(model, tokenized, pad_to=0):
+    """
+    score_tokenized() for several tokenized prompt + option sequences in one
+    right-padded forward pass. Padding only follows real tokens, so causal
+    attention keeps the scores of the one-by-one path. `pad_to` > 0 rounds
+    the padded length up to a multiple of it (fewer distinct shapes).
+    """
+    ids = [inputs["input_ids"][0] for inputs, _ in tokenized]
+
+    width = max(len(x) for x in ids)
+
+    if pad_to:
+        width = -(-width // pad_to) * pad_to
+
+    input_ids = torch.zeros(len(ids), width, dtype=torch.long)
+    attention_mask = torch.zeros_like(input_ids)
+
+    for row, x in enumerate(ids):
+        input_ids[row, :len(x)] = x
+        attention_mask[row, :len(x)] = 1
+
+    input_ids = input_ids.to(model.device)
+
+    with record_function("forward"), torch.no_grad():
+        logits = model(input_ids=input_ids, attention_mask=attention_mask.to(model.device)).logits
+
+    with record_function("log_softmax"):
+        log_probs = torch.nn.functional.log_softmax(logits[:, :-1], dim=-1)
+        token_logprobs = log_probs.gather(2, input_ids[:, 1:].unsqueeze(-1)).squeeze(-1)
+
+    # Same positions as score_tokenized(): the last `option_len` predicted tokens of each real sequence
+    return [
+        token_logprobs[row, max(len(x) - 1 - option_len, 0):len(x) - 1].sum().item()
+        for row, (x, (_, option_len)) in enumerate(zip(ids, tokenized))
+    ]
+
+
 def score_option(model, tokenizer, prompt, option):
     """
     Compute log-probability score of a given option appended to the prompt.
@@ -42,41 +127,33 @@ def score_option(model, tokenizer, prompt, option):
     Returns:
         sum of token log-probabilities for the option tokens.
     """
-    full_text = prompt + " " + option
-    inputs = tokenizer(full_text, return_tensors="pt").to(model.device)
-
-    with torch.no_grad():
-        outputs = model(**inputs)
-
-    # Shift logits and labels to compute log-probabilities
-    logits = outputs.logits[:, :-1]
-    labels = inputs["input_ids"][:, 1:]
-    log_probs = torch.nn.functional.log_softmax(logits, dim=-1)
+    inputs, option_len = tokenize_option(tokenizer, prompt, option)
+    return score_tokenized(model, inputs, option_len)
 
-    # Gather log-probs of the actual tokens
-    token_logprobs = log_probs.gather(2, labels.unsqueeze(-1)).squeeze(-1)
-
-    # Calculate sum log-prob of the option tokens at the end
-    option_len = len(tokenizer(option).input_ids)
-    score = token_logprobs[0, -option_len:].sum().item()
 
-    return score
-
-
-def score_options(model, tokenizer, prompt, choices):
+def score_options(model, tokenizer, prompt, choices, tokenized=None, batch=False, pad_to=0):
     """
     Score all answer choices and select the one with highest log-probability.
 
     Args:
-        model: Language model.
+        model: Language model (or a model-like backend returning .logits).
         tokenizer: Corresponding tokenizer.
         prompt: The prompt text.
         choices: List of candidate answer strings.
+        tokenized: Optional tokenize_options() output, to skip tokenization.
+        batch: Score all choices in one padded forward pass.
+        pad_to: With batch, round the padded length up to a multiple of this.
 
     Returns:
         scores: list of log-prob scores per choice.
         pred_ix: index of the choice with highest score.
     """
-    scores = [score_option(model, tokenizer, prompt, c) for c in choices]
+    if tokenized is None:
+        tokenized = tokenize_options(tokenizer, prompt, choices)
+
+    if batch:
+        scores = score_tokenized_batch(model, tokenized, pad_to)
+    else:
+        scores = [score_tokenized(model, inputs, option_len) for inputs, option_len in tokenized]
     pred_ix = int(np.argmax(scores))
-    return scores, pred_ix
\ No newline at end of file
+    return scores, pred_ix
@@ -0,0 +1,95 @@
+# src/logprobs.py
+
+import math
+
+import torch
+from torch.profiler import record_function
+
+from mc import bracket_answer_position, extract_bracket_answer, mc_answer_position
+
+
+# ============================================================
+# Token Log-Probabilities
+# ============================================================
+
+def token_logprobs(step_logits, new_ids):
+    """
+    Log-probability of every generated token under the model's raw
+    (unwarped) next-token distribution, from generate(output_logits=True).
+    """
+    return [
+        torch.log_softmax(logits[0].float(), dim=-1)[int(token)].item()
+        for logits, token in zip(step_logits, new_ids)
+    ]
+
+
+def forward_token_logprobs(model, sequence, prompt_len):
+    """The same scores from one forward pass over prompt + generated tokens (e.g. for cache hits)."""
+
+    sequence = torch.as_tensor(sequence).to(model.device)
+
+    if len(sequence) <= prompt_len:
+        return []
+
+    with record_function("score run"), torch.no_grad():
+        logits = model(input_ids=sequence[None]).logits[0, prompt_len - 1:-1]
+
+    log_probs = torch.log_softmax(logits.float(), dim=-1)
+
+    return log_probs.gather(-1, sequence[prompt_len:, None]).squeeze(-1).tolist()
+
+
+# ============================================================
+# Run Scores
+# ============================================================
+
+def char_to_token(tokenizer, ids, pos):
+    """Index of the token in `ids` whose decoded text covers character `pos`."""
+
+    lo, hi = 0, len(ids) - 1
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+
+        if len(tokenizer.decode(ids[:mid + 1], skip_special_tokens=True)) > pos:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return lo
+
+
+def run_logprobs(tokenizer, new_ids, logprobs, forced=None):
+    """
+    Scores of one MC run for weighted voting:
+        sequence_logprob  sum of the generated tokens' log-probabilities
+        mean_logprob      the same per token
+        answer_logprob    log-probability of the token carrying the answer letter
+                          that extract_run_answer() picks; for an answer-forced
+                          run, log p(letter) of the forcing pass
+    """
+    new_ids = [int(x) for x in new_ids]
+    text = tokenizer.decode(new_ids, skip_special_tokens=True)
+
+    # Same priority as extract_run_answer: [[X]], then the forced letter, then the last A-D
+    if extract_bracket_answer(text):
+        pos = bracket_answer_position(text)
+    elif forced and forced.get("forced"):
+        pos = None
+    else:
+        pos = mc_answer_position(text)
+
+    answer_logprob = None
+
+    if pos is not None and logprobs:
+        answer_logprob = logprobs[char_to_token(tokenizer, new_ids, pos)]
+
+    elif forced and forced.get("forced"):
+        p = forced["letter_probs"][forced["forced_answer"]] * forced["letter_mass"]
+        answer_logprob = math.log(p) if p > 0 else None
+
+    return {
+        "sequence_logprob": sum(logprobs),
+        "mean_logprob": sum(logprobs) / len(logprobs) if logprobs else None,
+        "answer_logprob": answer_logprob,
+    }
@@ -1,10 +1,19 @@
 # src/mc.py
 
 import json
+import math
 from collections import Counter
 import random
 import re
 
+import numpy as np
+
+
+LETTERS = ["A", "B", "C", "D"]
+
+# Sentinel for runs whose output could not be parsed into A/B/C/D
+UNPARSED = -1
+
 
 # ============================================================
 # Voting & Parsing
@@ -30,42 +39,292 @@ def majority_vote(preds, rng):
     return rng.choice(top)
 
 
-# ---------- Extract answer option (A/B/C/D) from model output text ----------
-def extract_mc_answer(text):
+# ---------- Weighted Voting ----------
+WEIGHTINGS = ["majority", "answer", "sequence"]
+WEIGHT_KEYS = {"answer": "answer_logprob", "sequence": "mean_logprob"}
+
+
+def run_weight(d, weighting="majority"):
+    """
+    Vote weight of one MC run:
+        majority  1
+        answer    p(answer letter), from the recorded answer_logprob
+        sequence  per-token geometric mean probability of the run, exp(mean_logprob)
+    Runs without the recorded score weigh 0 (votes where every run weighs 0
+    fall back to majority, see weighted_vote).
+    """
+    if weighting == "majority":
+        return 1.0
+
+    logprob = d.get(WEIGHT_KEYS[weighting])
+
+    return math.exp(logprob) if logprob is not None else 0.0
+
+
+def weighted_vote(preds, weights, rng):
+    """
+    Letter with the largest total weight (ties broken by rng, as in majority_vote)
+    and the normalized vote distribution {letter: share}. Falls back to
+    unweighted counts when every weight is 0.
+    """
+    if not any(weights):
+        weights = [1.0] * len(preds)
+
+    totals = {}
+
+    for p, w in zip(preds, weights):
+        totals[p] = totals.get(p, 0.0) + w
+
+    if not totals:
+        return None, {}
+
+    top_weight = max(totals.values())
+    top = [k for k, v in totals.items() if v == top_weight]
+
+    mass = sum(totals.values())
+
+    return rng.choice(top), {k: v / mass for k, v in totals.items()}
+
+
+# ---------- Batch Majority Voting ----------
+def vote_counts(pred_matrix):
+    """
+    Count votes per letter.
+
+    pred_matrix: (..., try_times) int array of letter indices, UNPARSED for missing runs.
+    Returns (..., 4) int counts.
+    """
+    one_hot = pred_matrix[..., None] == np.arange(len(LETTERS))
+    return one_hot.sum(axis=-2)
+
+
+def tie_break_keys(seeds, n_items):
+    """One (n_items, 4) matrix of random tie-break keys per seed, shape (n_seeds, n_items, 4)."""
+    return np.stack([
+        np.random.default_rng(seed).random((n_items, len(LETTERS)))
+        for seed in seeds
+    ])
+
+
+def vote_from_counts(counts, keys):
+    """
+    Pick the most voted letter; ties are broken by the largest random key.
+
+    counts: (..., n_items, 4) vote counts.
+    keys:   tie-break keys broadcastable against counts.
+    Returns voted letter indices, UNPARSED where no run was parsed.
+    """
+    top = counts.max(axis=-1, keepdims=True)
+    candidates = np.where(counts == top, keys, -1.0)
+    voted = candidates.argmax(axis=-1).astype(np.int8)
+    return np.where(top[..., 0] > 0, voted, UNPARSED).astype(np.int8)
+
+
+def batch_majority_vote(pred_matrix, seeds=42):
+    """
+    Majority voting over an (n_items, try_times) int8 letter matrix.
+
+    Tie-breaking is deterministic for a given seed. If `seeds` is a list,
+    votes are computed for every seed at once.
+
+    Returns:
+        voted:     (n_items,) or (n_seeds, n_items) int8 letter indices.
+        margin:    (n_items,) votes of the top letter minus the runner-up.
+        agreement: (n_items,) share of parsed runs agreeing with the top letter.
+    """
+    single = np.isscalar(seeds)
+    seeds = [seeds] if single else list(seeds)
+
+    counts = vote_counts(pred_matrix)
+    voted = vote_from_counts(counts, tie_break_keys(seeds, len(pred_matrix)))
+
+    ordered = np.sort(counts, axis=-1)
+    margin = ordered[:, -1] - ordered[:, -2]
+
+    parsed = counts.sum(axis=-1)
+    agreement = np.divide(
+        ordered[:, -1], parsed,
+        out=np.zeros(len(parsed)), where=parsed > 0,
+    )
+
+    return (voted[0] if single else voted), margin, agreement
+
+
+def vote_stability(pred_matrix, gold, seeds, weights=None):
+    """
+    Vote accuracy when only the first k runs are used, for k = 1..try_times.
+
+    Computed in one pass from cumulative vote counts; with `weights`
+    ((n_items, try_times), see load_mc_weights) the votes are weighted,
+    falling back to plain counts where the first k parsed runs all weigh 0,
+    as weighted_vote does.
+    Returns an (n_seeds, try_times) accuracy matrix over parsed votes.
+    """
+    one_hot = (pred_matrix[..., None] == np.arange(len(LETTERS))).astype(np.int32)
+
+    counts = one_hot.cumsum(axis=1)  # (n_items, try_times, 4)
+
+    if weights is not None:
+        weighted = (one_hot * weights[..., None]).cumsum(axis=1)
+        counts = np.where(weighted.sum(axis=-1, keepdims=True) > 0, weighted, counts)
+
+    counts = counts.transpose(1, 0, 2)  # (try_times, n_items, 4)
+
+    keys = tie_break_keys(seeds, len(pred_matrix))[:, None]  # (n_seeds, 1, n_items, 4)
+    voted = vote_from_counts(counts[None], keys)             # (n_seeds, try_times, n_items)
+
+    parsed = voted != UNPARSED
+    correct = (voted == gold) & parsed
+
+    n_parsed = parsed.sum(axis=-1)
+    return np.divide(
+        correct.sum(axis=-1), n_parsed,
+        out=np.zeros(n_parsed.shape), where=n_parsed > 0,
+    )
+
+
+# ---------- Extract bracketed answer ([[A]] / [A]) from model output text ----------
+BRACKET_PATTERNS = ("[[A]]","[[B]]","[[C]]","[[D]]",
+                    "[A]","[B]","[C]","[D]")
+
+def extract_bracket_answer(text):
     if not text:
         return None
 
     text = text.upper()
 
     # priority patterns
-    for k in ("[[A]]","[[B]]","[[C]]","[[D]]",
-              "[A]","[B]","[C]","[D]"):
+    for k in BRACKET_PATTERNS:
         if k in text:
             return k.strip("[]")
 
+    return None
+
+
+# ---------- Extract answer option (A/B/C/D) from model output text ----------
+def extract_mc_answer(text):
+    if not text:
+        return None
+
+    letter = extract_bracket_answer(text)
+
+    if letter:
+        return letter
+
     # fallback: last valid char
-    return next((c for c in reversed(text) if c in "ABCD"), None)
+    return next((c for c in reversed(text.upper()) if c in "ABCD"), None)
+
+
+# ---------- Position of the extracted letter ----------
+def bracket_answer_position(text):
+    """Index in `text` of the letter extract_bracket_answer() returns, or None."""
+    if not text:
+        return None
+
+    text = text.upper()
+
+    for k in BRACKET_PATTERNS:
+        i = text.find(k)
+        if i >= 0:
+            return i + k.count("[")
+
+    return None
+
+
+def mc_answer_position(text):
+    """Index in `text` of the letter extract_mc_answer() returns, or None."""
+    i = bracket_answer_position(text)
+
+    if i is not None or not text:
+        return i
+
+    return next((i for i in range(len(text) - 1, -1, -1) if text[i].upper() in "ABCD"), None)
+
+
+# ---------- Answer of one result row ----------
+def extract_run_answer(d):
+    """
+    Answer letter of one MC run: an explicit [[X]] / [X] in the output,
+    else the answer-forced letter (two-stage CoT), else the last A-D character.
+    """
+    text = d.get("output")
+
+    return (
+        extract_bracket_answer(text)
+        or d.get("forced_answer")
+        or extract_mc_answer(text)
+    )
 
 
 # ============================================================
 # Aggregation
 # ============================================================
 
-def aggregate_mc_results(path, try_times=5, seed=42):
-
-    rng = random.Random(seed)
-
-    # ---------- Load ----------
+def read_mc_runs(path, try_times=5):
+    """
+    (runs, n_items, width) of an MC result file, runs in file order:
+        runs:    per row {"idx", "run_id", "pred", "gold", "ABILITY", "INDEX", "row"};
+                 "pred" is the parsed answer letter, None if it is not an option
+        n_items: max idx + 1
+        width:   runs per item, at least try_times (more with --permutations)
+    """
     with open(path, encoding="utf-8") as f:
         data = [json.loads(line) for line in f]
 
     if not data:
         raise ValueError("Empty result file!")
 
-    # ---------- Size ----------
     n = max(d["idx"] for d in data) + 1
+    counts = [0] * n
+
+    runs = []
+
+    for d in data:
+
+        i = d["idx"]
+        run_id = d.get("run_id", counts[i])
+        counts[i] += 1
+
+        letter = extract_run_answer(d)
+
+        runs.append({
+            "idx": i,
+            "run_id": run_id,
+            "pred": letter if letter in d.get("map", {}) else None,
+            "gold": d.get("answer"),
+            "ABILITY": d.get("ABILITY", "UNKNOWN"),
+            "INDEX": d.get("INDEX", "UNKNOWN"),
+            "row": d,
+        })
+
+    width = max(try_times, max(r["run_id"] for r in runs) + 1)
+
+    return runs, n, width
+
+
+def aggregate_mc_results(path, try_times=5, seed=42, weighting="majority"):
+    """
+    (per-run results, per-sample voted results) of an MC result file.
+
+    weighting="majority" is the plain self-consistency vote; "answer" and
+    "sequence" weight every run by its recorded probability (see run_weight).
+    Voted results also carry the vote distribution's share of the gold
+    letter ("gold_share") and of the voted one ("confidence"); see
+    expected_accuracy().
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Unknown weighting {weighting!r}; choose from {WEIGHTINGS}")
+
+    rng = random.Random(seed)
+
+    # ---------- Load ----------
+    runs, n, _ = read_mc_runs(path, try_times)
+
+    if weighting != "majority" and not any(WEIGHT_KEYS[weighting] in r["row"] for r in runs):
+        print(f"WARNING: No {WEIGHT_KEYS[weighting]} in {path}; the {weighting} vote falls back to majority!")
 
     preds = [[] for _ in range(n)]
+    weights = [[] for _ in range(n)]
     golds = [None] * n
 
     abilities = {}
@@ -74,25 +333,21 @@ def aggregate_mc_results(path, try_times=5, seed=42):
     raw_results = []
 
     # ---------- Collect ----------
-    for d in data:
+    for r in runs:
 
-        i = d["idx"]
+        i = r["idx"]
 
         # -------- Save meta once --------
         if i not in abilities:
 
-            abilities[i] = d.get("ABILITY", "UNKNOWN")
-            indices[i] = d.get("INDEX", "UNKNOWN")
+            abilities[i] = r["ABILITY"]
+            indices[i] = r["INDEX"]
 
-        # -------- Parse --------
-        letter = extract_mc_answer(d.get("output"))
+        letter = r["pred"]
 
-        if letter in d.get("map", {}):
+        if letter is not None:
             preds[i].append(letter)
-        else:
-            letter = None
-
-        gold = d.get("answer")
+            weights[i].append(run_weight(r["row"], weighting))
 
         raw_results.append({
             "idx": i,
@@ -100,14 +355,14 @@ def aggregate_mc_results(path, try_times=5, seed=42):
             "ABILITY": abilities[i],
             "INDEX": indices[i],
 
-            "gold": gold,
+            "gold": r["gold"],
             "pred": letter,
 
             "parsed": letter is not None,
-            "correct": letter == gold,
+            "correct": letter == r["gold"],
         })
 
-        golds[i] = golds[i] or gold
+        golds[i] = golds[i] or r["gold"]
 
 
     # ---------- Sanity check ----------
@@ -122,7 +377,11 @@ def aggregate_mc_results(path, try_times=5, seed=42):
 
     for i in range(n):
 
-        final = majority_vote(preds[i], rng)
+        if weighting == "majority":
+            final = majority_vote(preds[i], rng)
+            share = {k: v / len(preds[i]) for k, v in Counter(preds[i]).items()}
+        else:
+            final, share = weighted_vote(preds[i], weights[i], rng)
 
         voted_results.append({
 
@@ -136,10 +395,75 @@ def aggregate_mc_results(path, try_times=5, seed=42):
 
             "parsed": final is not None,
             "correct": final == golds[i],
+
+            "confidence": share.get(final, 0.0),
+            "gold_share": share.get(golds[i], 0.0),
         })
     return raw_results, voted_results
 
 
+# ---------- Expected accuracy ----------
+def expected_accuracy(voted_results):
+    """
+    Estimators from the vote distributions of parsed samples:
+        soft_accuracy  mean share of the gold letter: the accuracy of a vote
+                       drawn from the distribution; lower variance than 0/1 votes
+        confidence     mean share of the voted letter: the accuracy the votes
+                       expect of themselves, without gold labels
+    """
+    parsed = [r for r in voted_results if r["parsed"]]
+
+    if not parsed:
+        return {"soft_accuracy": 0.0, "confidence": 0.0, "n": 0}
+
+    return {
+        "soft_accuracy": sum(r["gold_share"] for r in parsed) / len(parsed),
+        "confidence": sum(r["confidence"] for r in parsed) / len(parsed),
+        "n": len(parsed),
+    }
+
+
+def load_mc_matrix(path, try_times=5):
+    """
+    Load MC results into arrays for batch voting:
+        preds:     (n_items, try_times) int8 letter indices, UNPARSED for missing runs
+        gold:      (n_items,) int8 gold letter index, UNPARSED if unknown
+        abilities: per-item ABILITY list
+    """
+    runs, n, width = read_mc_runs(path, try_times)
+
+    preds = np.full((n, width), UNPARSED, dtype=np.int8)
+    gold = np.full(n, UNPARSED, dtype=np.int8)
+    abilities = ["UNKNOWN"] * n
+
+    for r in runs:
+
+        i = r["idx"]
+
+        if r["pred"] is not None:
+            preds[i, r["run_id"]] = LETTERS.index(r["pred"])
+
+        if r["gold"] in LETTERS:
+            gold[i] = LETTERS.index(r["gold"])
+
+        abilities[i] = r["ABILITY"]
+
+    return preds, gold, abilities
+
+
+def load_mc_weights(path, try_times=5, weighting="answer"):
+    """(n_items, try_times) float vote weights aligned with load_mc_matrix(); 0 for missing runs."""
+
+    runs, n, width = read_mc_runs(path, try_times)
+
+    weights = np.zeros((n, width))
+
+    for r in runs:
+        weights[r["idx"], r["run_id"]] = run_weight(r["row"], weighting)
+
+    return weights
+
+
 # ============================================================
 # Prompt Templates
 # ============================================================
@@ -161,6 +485,11 @@ Note:
 (3) Again, you must first output the results of step-by-step reasoning, and finally output the most likely answer index. You should not directly output the answer index."""
 
 
+# -------- Answer Forcing --------
+# Appended to a CoT generation whose token budget ran out; the next token is read as the answer letter
+FORCE_ANSWER_SUFFIX = "\nTherefore the answer is [["
+
+
 # -------- User Prompt --------
 USER_MC_4CHOICES = \
 """[Story]
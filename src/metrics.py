@@ -0,0 +1,213 @@
+# src/metrics.py
+
+import json
+from pathlib import Path
+
+from online_metrics import is_aborted
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+# One record per (setting, ability) of one evaluated result file
+FIELDS = [
+    "method",       # LM / MC / FR
+    "prompt",       # base / cot
+    "model",
+    "setting",      # Raw / Norm / Vote / EM
+    "ability",      # Overall / FirstOrder / SecondOrder
+    "run",
+    "accuracy",
+    "n",
+    "ci_low",
+    "ci_high",
+    "margin_type",
+    "margin",
+    "p_value",      # first paired test of this setting
+    "p_ref",        # what the p-value is compared against
+    "paired",       # all paired tests: [{ref, diff, ci_low, ci_high, p_value}]
+    "ability_label",
+    "source",
+]
+
+METRICS_DIR = "metrics"
+
+
+# ============================================================
+# Metadata
+# ============================================================
+
+def parse_name(path):
+    """Infer (method, prompt, model, run) from a file name like fr_cot_mistral_01."""
+
+    name = Path(path).stem
+    parts = name.split("_")
+
+    method = parts[0].upper()
+
+    prompt = "base"
+    model = "unknown"
+    run = "00"
+
+    if "cot" in parts:
+        prompt = "cot"
+
+    # Model alias: first name part that is not the method, "cot" or a run number
+    for part in parts[1:]:
+        if part != "cot" and not part.isdigit():
+            model = part
+            break
+
+    if parts[-1].isdigit():
+        run = parts[-1]
+
+    return method, prompt, model, run
+
+
+def norm_ability(text):
+
+    if text == "Overall":
+        return "Overall"
+
+    if "Second" in text:
+        return "SecondOrder"
+
+    return "FirstOrder"
+
+
+def reference_for(path):
+    """CoT results are compared against their base counterpart, if present and not early-aborted."""
+
+    path = Path(path)
+    parts = path.stem.split("_")
+
+    if "cot" not in parts:
+        return None
+
+    ref = path.with_name("_".join(p for p in parts if p != "cot") + path.suffix)
+
+    return str(ref) if ref.exists() and not is_aborted(ref) else None
+
+
+def resolve_compare(compare, path):
+    """--compare value for one input: a fixed file, or "auto" for reference_for."""
+
+    if compare == "auto":
+        return reference_for(path)
+
+    return compare
+
+
+def add_meta_args(parser):
+    """CLI flags for explicit metadata; anything left unset is inferred from the file name."""
+    parser.add_argument("--prompt", choices=["base", "cot"], default=None, help="Prompt type recorded in metrics")
+    parser.add_argument("--model", default=None, help="Model name recorded in metrics")
+    parser.add_argument("--run", type=int, default=None, help="Run number recorded in metrics")
+    parser.add_argument("--metrics_dir", default=METRICS_DIR, help="Directory for JSON metrics records")
+
+
+def resolve_meta(args, path, method):
+
+    _, prompt, model, run = parse_name(path)
+
+    return {
+        "method": method,
+        "prompt": args.prompt or prompt,
+        "model": args.model or model,
+        "run": args.run if args.run is not None else int(run),
+        "source": str(path),
+    }
+
+
+# ============================================================
+# Records
+# ============================================================
+
+def make_record(meta, setting, ability, accuracy, n=None, ci=None,
+                margin_type=None, margin=None, paired=None):
+    """Build one flat metrics record; `paired` maps reference -> (diff, ci, p_value)."""
+
+    paired = [
+        {
+            "ref": ref,
+            "diff": diff,
+            "ci_low": p_ci[0],
+            "ci_high": p_ci[1],
+            "p_value": p_value,
+        }
+        for ref, (diff, p_ci, p_value) in (paired or {}).items()
+    ]
+
+    record = {
+        **meta,
+        "setting": setting,
+        "ability": norm_ability(ability),
+        "ability_label": ability,
+        "accuracy": float(accuracy),
+        "n": n,
+        "ci_low": ci[0] if ci else None,
+        "ci_high": ci[1] if ci else None,
+        "margin_type": margin_type,
+        "margin": None if margin is None else float(margin),
+        "p_value": paired[0]["p_value"] if paired else None,
+        "p_ref": paired[0]["ref"] if paired else None,
+        "paired": paired,
+    }
+
+    return {k: record.get(k) for k in FIELDS}
+
+
+def metrics_path(metrics_dir, input_path):
+    return Path(metrics_dir) / f"{Path(input_path).stem}.json"
+
+
+def write_metrics(path, records):
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+
+
+def print_combined(records):
+    """One table over every evaluated file: a row per file x setting (overall accuracy)."""
+
+    rows = [r for r in records if r["ability"] == "Overall"]
+
+    if not rows:
+        return
+
+    width = max(len(Path(r["source"]).stem) for r in rows)
+    n_files = len({r["source"] for r in rows})
+
+    print("=" * 60)
+    print(f"Combined Report ({n_files} file{'s' if n_files != 1 else ''})")
+    print("=" * 60)
+    print(f"{'file':{width}s}  {'setting':8s} {'n':>5s} {'accuracy':>8s}  {'95% CI':17s} {'p':>7s}  vs")
+
+    for r in rows:
+
+        ci = f"[{r['ci_low']:.4f}, {r['ci_high']:.4f}]" if r["ci_low"] is not None else "-"
+        p = f"{r['p_value']:.4f}" if r["p_value"] is not None else "-"
+        n = r["n"] if r["n"] is not None else "-"
+
+        print(
+            f"{Path(r['source']).stem:{width}s}  {r['setting']:8s} {n:>5} {r['accuracy']:8.4f}  "
+            f"{ci:17s} {p:>7s}  {r['p_ref'] or '-'}"
+        )
+
+    print("=" * 60)
+
+
+def load_metrics(paths):
+    """Concatenate the records of several metrics files."""
+
+    records = []
+
+    for p in paths:
+        with open(p, encoding="utf-8") as f:
+            records.extend(json.load(f))
+
+    return records
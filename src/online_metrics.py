@@ -0,0 +1,226 @@
+# src/online_metrics.py
+
+import json
+import math
+import os
+from pathlib import Path
+from statistics import NormalDist
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+ABORT_AFTER = 50
+WRITE_EVERY = 25
+ALPHA = 0.05
+
+
+def add_online_args(parser):
+    parser.add_argument(
+        "--abort_after",
+        type=int,
+        default=ABORT_AFTER,
+        help="Samples seen before the early-abort rules are checked",
+    )
+    parser.add_argument(
+        "--abort_parse_rate",
+        type=float,
+        default=None,
+        help="Abort the run once the upper Wilson bound of the parse rate falls below this value",
+    )
+    parser.add_argument(
+        "--abort_accuracy",
+        type=float,
+        default=None,
+        help="Abort the run once the upper Wilson bound of the accuracy falls below this value (e.g. 0.25 = chance)",
+    )
+
+
+def online_path(output):
+    """Sidecar next to the results file: results/x.jsonl -> results/x.online.json."""
+    output = Path(output)
+    return output.with_name(f"{output.stem}.online.json")
+
+
+def is_aborted(output):
+    """True if the run behind `output` was stopped by an early-abort rule."""
+
+    path = online_path(output)
+
+    if not path.exists():
+        return False
+
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("aborted") is not None
+
+
+# ============================================================
+# Wilson Interval
+# ============================================================
+
+def wilson_ci(successes, n, alpha=ALPHA):
+    """Wilson score interval of a binomial proportion; (0, 1) without observations."""
+
+    if n == 0:
+        return 0.0, 1.0
+
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    p = successes / n
+
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+
+# ============================================================
+# Running Metrics
+# ============================================================
+
+class EarlyAbort(Exception):
+    """Raised by OnlineMetrics when a run trips an early-abort rule."""
+
+
+def new_counts():
+    return {"n": 0, "parsed": 0, "correct": 0}
+
+
+def counts_summary(c):
+    """Parse rate over all predictions, accuracy over parsed ones (as the evaluators count them)."""
+
+    return {
+        **c,
+        "parse_rate": c["parsed"] / c["n"] if c["n"] else 0.0,
+        "parse_ci": wilson_ci(c["parsed"], c["n"]),
+        "accuracy": c["correct"] / c["parsed"] if c["parsed"] else 0.0,
+        "accuracy_ci": wilson_ci(c["correct"], c["parsed"]),
+    }
+
+
+class OnlineMetrics:
+    """
+    Accuracy and parse rate of a run while it is written, overall and by
+    ABILITY, for one or more prediction series (e.g. MC runs and votes).
+
+    The first series drives the progress bar and the early-abort rules;
+    the sidecar JSON is rewritten every WRITE_EVERY samples and at the end.
+    """
+
+    def __init__(self, args, method, series):
+
+        self.method = method
+        self.series = list(series)
+        self.path = online_path(args.output)
+
+        self.abort_after = args.abort_after
+        self.abort_parse_rate = args.abort_parse_rate
+        self.abort_accuracy = args.abort_accuracy
+
+        self.samples = 0
+        self.aborted = None
+
+        self.overall = {s: new_counts() for s in self.series}
+        self.by_ability = {s: {} for s in self.series}
+
+    def add(self, series, ability, pred, correct):
+        """One prediction; pred None = unparsed (never correct)."""
+
+        for c in (self.overall[series], self.by_ability[series].setdefault(ability, new_counts())):
+            c["n"] += 1
+            c["parsed"] += int(pred is not None)
+            c["correct"] += int(pred is not None and bool(correct))
+
+    def sample_done(self):
+        """Call once per sample after its add() calls; may raise EarlyAbort."""
+
+        self.samples += 1
+
+        reason = self.abort_reason()
+
+        if reason is not None:
+            self.aborted = reason
+            self.write()
+            raise EarlyAbort(reason)
+
+        if self.samples % WRITE_EVERY == 0:
+            self.write()
+
+    # ---------- Early abort ----------
+    def abort_reason(self):
+
+        if self.samples < self.abort_after:
+            return None
+
+        s = counts_summary(self.overall[self.series[0]])
+
+        if self.abort_parse_rate is not None and s["parse_ci"][1] < self.abort_parse_rate:
+            return (
+                f"parse rate {s['parse_rate']:.3f} (upper bound {s['parse_ci'][1]:.3f}) "
+                f"< {self.abort_parse_rate} after {self.samples} samples"
+            )
+
+        if self.abort_accuracy is not None and s["accuracy_ci"][1] < self.abort_accuracy:
+            return (
+                f"accuracy {s['accuracy']:.3f} (upper bound {s['accuracy_ci'][1]:.3f}) "
+                f"< {self.abort_accuracy} after {self.samples} samples"
+            )
+
+        return None
+
+    # ---------- Reporting ----------
+    def postfix(self):
+        """Short tqdm postfix of the first series."""
+
+        s = counts_summary(self.overall[self.series[0]])
+        lo, hi = s["accuracy_ci"]
+
+        return {
+            "acc": f"{s['accuracy']:.3f} [{lo:.2f},{hi:.2f}]",
+            "parse": f"{s['parse_rate']:.2f}",
+        }
+
+    def summary(self):
+        return {
+            "method": self.method,
+            "samples": self.samples,
+            "aborted": self.aborted,
+            "alpha": ALPHA,
+            "abort_rule": {
+                "after": self.abort_after,
+                "parse_rate": self.abort_parse_rate,
+                "accuracy": self.abort_accuracy,
+            },
+            "series": {
+                s: {
+                    "overall": counts_summary(self.overall[s]),
+                    "by_ability": {a: counts_summary(c) for a, c in sorted(self.by_ability[s].items())},
+                }
+                for s in self.series
+            },
+        }
+
+    def write(self):
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+        os.replace(tmp, self.path)
+
+
+def print_online(summary):
+
+    print("Online metrics:")
+
+    for name, s in summary["series"].items():
+        o = s["overall"]
+        print(
+            f"  {name:6s} accuracy {o['accuracy']:.4f} [{o['accuracy_ci'][0]:.4f}, {o['accuracy_ci'][1]:.4f}]  "
+            f"parse rate {o['parse_rate']:.4f}  ({o['n']} predictions)"
+        )
+
+    if summary["aborted"]:
+        print(f"  ABORTED: {summary['aborted']}")
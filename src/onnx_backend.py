@@ -0,0 +1,309 @@
+# src/onnx_backend.py
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import transformers
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.modeling_outputs import CausalLMOutput
+
+from gen_cache import weights_fingerprint
+from lm import build_lm_prompt, score_options, tokenize_options
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+ONNX_DIR = ".cache/onnx"
+ONNX_OPSET = 17
+
+
+def add_backend_args(parser):
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Scoring backend (onnx: onnxruntime on CPU)")
+    add_onnx_args(parser)
+
+
+def add_onnx_args(parser):
+    parser.add_argument("--onnx_dir", default=None, help=f"Exported graph directory (default: {ONNX_DIR}/<model>)")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads (default: runtime default)")
+    parser.add_argument("--batch_options", action="store_true", help="Score the four options of a prompt in one padded forward pass")
+    parser.add_argument(
+        "--pad_to",
+        type=int,
+        default=0,
+        help="With --batch_options, pad batches to a multiple of this length (few fixed shapes); 0 = dynamic shapes",
+    )
+
+
+def default_onnx_dir(model_name):
+    return Path(ONNX_DIR) / re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name.strip("/"))
+
+
+# ============================================================
+# Export
+# ============================================================
+
+class LogitsOnly(torch.nn.Module):
+    """(input_ids, attention_mask) -> logits, without the KV cache outputs."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+
+def export_onnx(model_name, out_dir=None, opset=ONNX_OPSET):
+    """
+    Export the causal LM to <out_dir>/model.onnx once (float32, dynamic batch
+    and sequence axes). The export is reused while meta.json still matches
+    the model revision (or, for a local checkpoint, its weight files), opset
+    and library versions.
+    """
+    out_dir = Path(out_dir or default_onnx_dir(model_name))
+    onnx_path = out_dir / "model.onnx"
+    meta_path = out_dir / "meta.json"
+
+    config = transformers.AutoConfig.from_pretrained(model_name)
+
+    meta = {
+        "model": model_name,
+        "revision": getattr(config, "_commit_hash", None),
+        "weights": weights_fingerprint(model_name),
+        "opset": opset,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+    }
+
+    if onnx_path.exists() and meta_path.exists():
+        with open(meta_path, encoding="utf-8") as f:
+            if json.load(f) == meta:
+                return onnx_path
+
+    print("Exporting to ONNX:", onnx_path)
+
+    # Eager attention traces to plain ops; float32 because the graph runs on CPU
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch.float32,
+        attn_implementation="eager",
+    ).eval()
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    dummy = torch.ones(2, 8, dtype=torch.long)
+    axes = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model),
+            (dummy, torch.ones_like(dummy)),
+            str(onnx_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": axes},
+            opset_version=opset,
+            dynamo=False,
+        )
+
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    return onnx_path
+
+
+# ============================================================
+# Model-Like Session
+# ============================================================
+
+class OnnxCausalLM:
+    """
+    onnxruntime session with the slice of the model API that LM scoring uses:
+    `.device` and `model(input_ids=..., attention_mask=...).logits`.
+    """
+
+    def __init__(self, onnx_path, threads=None):
+
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+
+    def __call__(self, input_ids=None, attention_mask=None, output_hidden_states=False, **kwargs):
+
+        if output_hidden_states:
+            raise ValueError("Hidden states are not part of the exported ONNX graph")
+
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+
+        logits = self.session.run(
+            ["logits"],
+            {
+                "input_ids": input_ids.cpu().numpy().astype(np.int64),
+                "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+            },
+        )[0]
+
+        return CausalLMOutput(logits=torch.from_numpy(logits))
+
+
+def load_onnx_model(model_name, out_dir=None, threads=None):
+    """Export (once) and open the ONNX scoring backend."""
+
+    # Optional dependencies: only this backend needs them
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The ONNX backend needs onnx and onnxruntime (pip install onnx onnxruntime)") from e
+
+    return OnnxCausalLM(export_onnx(model_name, out_dir), threads)
+
+
+# ============================================================
+# Backend Comparison
+# ============================================================
+
+def score_sample(model, tokenizer, sample, batch=False, pad_to=0):
+    """(raw scores, unconditional scores, tokens run) of one sample, as run_lm_model scores it."""
+
+    choices = [sample[f"OPTION-{k}"] for k in ["A", "B", "C", "D"]]
+    prompt = build_lm_prompt(sample["STORY"], sample["QUESTION"])
+
+    tokenized = tokenize_options(tokenizer, prompt, choices)
+    uncond = tokenize_options(tokenizer, "", choices)
+
+    raw, _ = score_options(model, tokenizer, prompt, choices, tokenized, batch, pad_to)
+    base, _ = score_options(model, tokenizer, "", choices, uncond, batch, pad_to)
+
+    return raw, base, sum(inputs.input_ids.shape[1] for inputs, _ in tokenized + uncond)
+
+
+def run_backend(model, tokenizer, data, batch, pad_to):
+
+    # One untimed sample: session / allocator warmup
+    score_sample(model, tokenizer, data[0], batch, pad_to)
+
+    start = time.perf_counter()
+    scores = [score_sample(model, tokenizer, d, batch, pad_to) for d in data]
+    wall_s = time.perf_counter() - start
+
+    return scores, {
+        "wall_s": wall_s,
+        "samples_per_sec": len(data) / wall_s,
+        "tokens_per_sec": sum(s[2] for s in scores) / wall_s,
+    }
+
+
+def compare_backends(args):
+    """PyTorch (float32, CPU) vs onnxruntime on the same samples: throughput and score agreement."""
+
+    with open(args.data, encoding="utf-8") as f:
+        data = [json.loads(line) for line in f][:args.n]
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+
+    torch_model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32).eval()
+    onnx_model = load_onnx_model(args.model, args.onnx_dir, args.threads)
+
+    torch_scores, torch_speed = run_backend(torch_model, tokenizer, data, args.batch_options, args.pad_to)
+    onnx_scores, onnx_speed = run_backend(onnx_model, tokenizer, data, args.batch_options, args.pad_to)
+
+    diffs = []
+    raw_agree = 0
+    norm_agree = 0
+
+    for (t_raw, t_base, _), (o_raw, o_base, _) in zip(torch_scores, onnx_scores):
+
+        diffs.extend(abs(a - b) for a, b in zip(t_raw + t_base, o_raw + o_base))
+
+        raw_agree += int(np.argmax(t_raw) == np.argmax(o_raw))
+        norm_agree += int(
+            np.argmax(np.subtract(t_raw, t_base)) == np.argmax(np.subtract(o_raw, o_base))
+        )
+
+    return {
+        "model": args.model,
+        "samples": len(data),
+        "batch_options": args.batch_options,
+        "pad_to": args.pad_to,
+        "threads": args.threads,
+        "torch": torch_speed,
+        "onnx": onnx_speed,
+        "speedup": onnx_speed["samples_per_sec"] / torch_speed["samples_per_sec"],
+        "max_abs_diff": max(diffs),
+        "mean_abs_diff": float(np.mean(diffs)),
+        "pred_raw_agreement": raw_agree / len(data),
+        "pred_norm_agreement": norm_agree / len(data),
+    }
+
+
+def print_comparison(report):
+
+    print("=" * 60)
+    print(f"PyTorch vs ONNX Runtime (CPU, {report['samples']} samples)")
+    print("=" * 60)
+    print(f"{'Backend':10s} {'Wall (s)':>10s} {'Samples/s':>12s} {'Tokens/s':>12s}")
+
+    for name in ["torch", "onnx"]:
+        r = report[name]
+        print(f"{name:10s} {r['wall_s']:10.2f} {r['samples_per_sec']:12.2f} {r['tokens_per_sec']:12.1f}")
+
+    print(f"\nSpeedup (onnx / torch) : {report['speedup']:.2f}x")
+    print(f"Score |diff|           : max {report['max_abs_diff']:.2e}  mean {report['mean_abs_diff']:.2e}")
+    print(f"Prediction agreement   : raw {report['pred_raw_agreement']:.4f}  norm {report['pred_norm_agreement']:.4f}")
+    print("=" * 60)
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        description="Export a causal LM to ONNX and compare onnxruntime with PyTorch for LM option scoring on CPU"
+    )
+
+    parser.add_argument("--model", required=True, help="Model name or path")
+    parser.add_argument("--data", required=True, help="Input JSONL data path")
+    parser.add_argument("--n", type=int, default=50, help="Samples to compare")
+    parser.add_argument("--report", default=None, help="Report JSON (default: <onnx_dir>/report.json)")
+
+    add_onnx_args(parser)
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
+
+    report = compare_backends(args)
+
+    report_path = Path(args.report or Path(args.onnx_dir or default_onnx_dir(args.model)) / "report.json")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print_comparison(report)
+    print("Report saved to:", report_path)
@@ -0,0 +1,103 @@
+# src/parallel.py
+
+import contextlib
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from metrics import parse_name
+from online_metrics import is_aborted
+
+
+# ============================================================
+# Inputs
+# ============================================================
+
+def expand_inputs(patterns, method=None, suffix=".jsonl", skip_aborted=True):
+    """
+    Expand files, directories and glob patterns into a sorted, de-duplicated list.
+
+    Files found through a directory or glob are kept only if their name
+    matches `method` (e.g. "LM" keeps lm_*.jsonl), so a whole results/
+    tree can be handed to every evaluator. Explicit file paths are kept as is.
+    Partial outputs of early-aborted runs (see online_metrics.is_aborted)
+    are left out unless skip_aborted=False.
+    """
+    paths = []
+
+    for pattern in patterns:
+
+        p = Path(pattern)
+
+        if p.is_file():
+            paths.append(p)
+            continue
+
+        if p.is_dir():
+            found = p.rglob(f"*{suffix}")
+        else:
+            found = (Path(f) for f in glob.glob(pattern, recursive=True))
+
+        paths.extend(
+            f for f in found
+            if f.is_file() and (method is None or parse_name(f)[0] == method)
+        )
+
+    paths = sorted(set(paths))
+
+    if not skip_aborted:
+        return paths
+
+    for p in paths:
+        if is_aborted(p):
+            print(f"Skipping early-aborted run: {p}")
+
+    return [p for p in paths if not is_aborted(p)]
+
+
+# ============================================================
+# Process Pool
+# ============================================================
+
+def add_parallel_args(parser):
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--logs_dir", default=None, help="Also write each file's report to <logs_dir>/<stem>.txt")
+
+
+def map_files(fn, paths, workers=None):
+    """Apply fn to every path on a process pool; results keep the input order."""
+
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+
+    if workers <= 1:
+        return [fn(p) for p in paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, paths))
+
+
+# ============================================================
+# Reports
+# ============================================================
+
+def capture(print_fn, *args, **kwargs):
+    """Run a print-based report function and return what it printed."""
+
+    buf = io.StringIO()
+
+    with contextlib.redirect_stdout(buf):
+        print_fn(*args, **kwargs)
+
+    return buf.getvalue()
+
+
+def write_log(logs_dir, path, text):
+
+    if not logs_dir:
+        return
+
+    log_file = Path(logs_dir) / f"{Path(path).stem}.txt"
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    log_file.write_text(text, encoding="utf-8")
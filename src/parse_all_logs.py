@@ -1,54 +1,84 @@
+import os
 import re
 import csv
 import glob
+import json
+import hashlib
+import argparse
+import contextlib
 import pandas as pd
 from pathlib import Path
 
+import eval_fr
+import eval_lm
+import eval_mc
+from metrics import METRICS_DIR, load_metrics, norm_ability, parse_name, reference_for
+from online_metrics import is_aborted
+
 
 OUT = "summary_final.csv"
 FR_AVG_OUT = "fr_avg.csv"
+MANIFEST = ".cache/summary_manifest.json"
 
 
 # =========================
-# Parse filename
+# CI / paired test parser
 # =========================
 
-def parse_name(path):
+# Optional "[95% CI: lo, hi]" suffix printed after each accuracy
+CI = r"(?:\s+\[\d+% CI:\s*([-0-9.]+),\s*([-0-9.]+)\])?"
 
-    name = Path(path).stem
-    parts = name.split("_")
 
-    method = parts[0].upper()
+def parse_ci(m, first):
 
-    prompt = "base"
-    model = "unknown"
-    run = "00"
+    if m.group(first) is None:
+        return None, None
 
-    if "cot" in parts:
-        prompt = "cot"
+    return float(m.group(first)), float(m.group(first + 1))
 
-    if "mistral" in parts:
-        model = "mistral"
 
-    if parts[-1].isdigit():
-        run = parts[-1]
+def parse_paired(text):
+    """
+    Map (setting, ability) -> (reference, p-value) from "Paired Test (X vs Y):" blocks.
+    The first block mentioning a setting wins.
+    """
 
-    return method, prompt, model, run
+    tests = {}
 
+    for block in re.finditer(r"Paired Test \((\w+) vs ([^)]+)\):\n((?:(?![ \t]*Paired Test)[ \t]*\S.*\n?)*)", text):
 
-# =========================
-# Normalize ability
-# =========================
+        setting, ref = block.group(1), block.group(2)
+
+        for line in block.group(3).splitlines():
+
+            m = re.search(r"(Overall|Belief:.*?)\s+diff=[-+0-9.]+.*p=([0-9.]+)", line)
+
+            if not m:
+                continue
+
+            key = (setting, norm_ability(m.group(1)))
+
+            if key not in tests:
+                tests[key] = (ref, float(m.group(2)))
+
+    return tests
+
+
+def attach_paired(rows, text):
+
+    tests = parse_paired(text)
+
+    final = []
 
-def norm_ability(text):
+    for setting, ability, acc, mtype, margin, ci_low, ci_high in rows:
 
-    if text == "Overall":
-        return "Overall"
+        ref, p = tests.get((setting, ability), (None, None))
 
-    if "Second" in text:
-        return "SecondOrder"
+        final.append(
+            (setting, ability, acc, mtype, margin, ci_low, ci_high, p, ref)
+        )
 
-    return "FirstOrder"
+    return final
 
 
 # =========================
@@ -59,15 +89,15 @@ def parse_fr(text):
 
     rows = []
 
-    total = re.search(r"Total Exact Match Accuracy:\s+([0-9.]+)", text)
+    total = re.search(r"Total Exact Match Accuracy:\s+([0-9.]+)" + CI, text)
 
     if total:
-        rows.append(("EM", "Overall", float(total.group(1)), None, None))
+        rows.append(("EM", "Overall", float(total.group(1)), None, None, *parse_ci(total, 2)))
 
 
     for line in text.splitlines():
 
-        m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)", line)
+        m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)" + CI, line)
 
         if not m:
             continue
@@ -75,10 +105,10 @@ def parse_fr(text):
         ab = norm_ability(m.group(1))
         acc = float(m.group(2))
 
-        rows.append(("EM", ab, acc, None, None))
+        rows.append(("EM", ab, acc, None, None, *parse_ci(m, 3)))
 
 
-    return rows
+    return attach_paired(rows, text)
 
 
 # =========================
@@ -89,14 +119,14 @@ def parse_mc(text):
 
     rows = []
 
-    raw = re.search(r"Raw Acc\s+:\s+([0-9.]+)", text)
-    vote = re.search(r"Vote Acc\s+:\s+([0-9.]+)", text)
+    raw = re.search(r"Raw Acc\s+:\s+([0-9.]+)" + CI, text)
+    vote = re.search(r"Vote Acc\s+:\s+([0-9.]+)" + CI, text)
 
     if raw:
-        rows.append(("Raw", "Overall", float(raw.group(1)), None, None))
+        rows.append(("Raw", "Overall", float(raw.group(1)), None, None, *parse_ci(raw, 2)))
 
     if vote:
-        rows.append(("Vote", "Overall", float(vote.group(1)), None, None))
+        rows.append(("Vote", "Overall", float(vote.group(1)), None, None, *parse_ci(vote, 2)))
 
 
     for setting, pattern in [
@@ -116,7 +146,7 @@ def parse_mc(text):
 
         for line in block[0].splitlines():
 
-            m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)", line)
+            m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)" + CI, line)
 
             if not m:
                 continue
@@ -124,10 +154,10 @@ def parse_mc(text):
             ab = norm_ability(m.group(1))
             acc = float(m.group(2))
 
-            rows.append((setting, ab, acc, None, None))
+            rows.append((setting, ab, acc, None, None, *parse_ci(m, 3)))
 
 
-    return rows
+    return attach_paired(rows, text)
 
 
 # =========================
@@ -141,14 +171,14 @@ def parse_lm(text):
 
     # ---- Accuracy (Overall) ----
 
-    raw = re.search(r"Total Accuracy \(Raw\):\s+([0-9.]+)", text)
-    norm = re.search(r"Total Accuracy \(Normalized\):\s+([0-9.]+)", text)
+    raw = re.search(r"Total Accuracy \(Raw\):\s+([0-9.]+)" + CI, text)
+    norm = re.search(r"Total Accuracy \(Normalized\):\s+([0-9.]+)" + CI, text)
 
     if raw:
-        rows.append(("Raw", "Overall", float(raw.group(1)), "Raw", None))
+        rows.append(("Raw", "Overall", float(raw.group(1)), "Raw", None, *parse_ci(raw, 2)))
 
     if norm:
-        rows.append(("Norm", "Overall", float(norm.group(1)), "Norm", None))
+        rows.append(("Norm", "Overall", float(norm.group(1)), "Norm", None, *parse_ci(norm, 2)))
 
 
     # ---- Accuracy by Ability ----
@@ -170,7 +200,7 @@ def parse_lm(text):
 
         for line in block[0].splitlines():
 
-            m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)", line)
+            m = re.search(r"(Belief:.*)\(n=.*?\):\s+([0-9.]+)" + CI, line)
 
             if not m:
                 continue
@@ -178,7 +208,7 @@ def parse_lm(text):
             ab = norm_ability(m.group(1))
             acc = float(m.group(2))
 
-            rows.append((setting, ab, acc, setting, None))
+            rows.append((setting, ab, acc, setting, None, *parse_ci(m, 3)))
 
 
     # ---- Margins ----
@@ -201,7 +231,7 @@ def parse_lm(text):
          r"Margin by Ability \(Raw\):([\s\S]*?)Margin by Ability"),
 
         ("Norm",
-         r"Margin by Ability \(Normalized\):([\s\S]*)$")
+         r"Margin by Ability \(Normalized\):([\s\S]*?)(?:Paired Test|$)")
     ]:
 
         block = re.findall(pattern, text)
@@ -225,85 +255,313 @@ def parse_lm(text):
 
     final = []
 
-    for setting, ability, acc, mtype, _ in rows:
+    for setting, ability, acc, mtype, _, ci_low, ci_high in rows:
 
         key = f"{setting}_{ability}"
 
         margin = margin_map.get(key)
 
         final.append(
-            (setting, ability, acc, mtype, margin)
+            (setting, ability, acc, mtype, margin, ci_low, ci_high)
         )
 
 
-    return final
+    return attach_paired(final, text)
+
+
+# =========================
+# Row sources
+# =========================
+
+COLUMNS = [
+    "Method",
+    "Prompt",
+    "Model",
+    "Setting",
+    "Ability",
+    "Accuracy",
+    "Run",
+    "MarginType",
+    "Margin",
+    "CI_Low",
+    "CI_High",
+    "PValue",
+    "PRef"
+]
+
+# Summary column -> metrics record field
+RECORD_FIELDS = {
+    "Method": "method",
+    "Prompt": "prompt",
+    "Model": "model",
+    "Setting": "setting",
+    "Ability": "ability",
+    "Accuracy": "accuracy",
+    "Run": "run",
+    "MarginType": "margin_type",
+    "Margin": "margin",
+    "CI_Low": "ci_low",
+    "CI_High": "ci_high",
+    "PValue": "p_value",
+    "PRef": "p_ref",
+}
+
+
+def rows_from_metrics(files):
+    """Summary rows straight from the evaluators' JSON metrics records."""
+
+    return [
+        [r[RECORD_FIELDS[c]] for c in COLUMNS]
+        for r in load_metrics(files)
+    ]
+
+
+def live_metrics(files):
+    """
+    Metrics files whose results file still exists and was not early-aborted.
+    Records of deleted, renamed or aborted results are left out of the
+    summary, as results_index.ingest() drops them from the index.
+    """
+
+    live = []
+
+    for f in files:
+
+        sources = {r.get("source") for r in load_metrics([f])}
+
+        if any(s and (not Path(s).exists() or is_aborted(s)) for s in sources):
+            print(f"Skipping metrics of a missing or aborted results file: {f}")
+            continue
+
+        live.append(f)
+
+    return live
+
+
+def parse_log(f):
+    """Legacy: summary rows scraped from one human-readable log."""
+
+    text = Path(f).read_text(encoding="utf-8")
+
+    method, prompt, model, run = parse_name(f)
+
+
+    if "Free Response" in text:
+        data = parse_fr(text)
+
+    elif "MC Evaluation" in text:
+        data = parse_mc(text)
+
+    elif "LM Probing" in text:
+        data = parse_lm(text)
+
+    else:
+        print(f"Unknown format: {f}")
+        return []
+
+
+    return [
+        [method, prompt, model, setting, ability, acc, run, mtype, margin, ci_low, ci_high, p, ref]
+        for setting, ability, acc, mtype, margin, ci_low, ci_high, p, ref in data
+    ]
+
+
+def rows_from_logs(files):
+
+    rows = []
+
+    for f in files:
+        rows.extend(parse_log(f))
+
+    return rows
+
+
+# =========================
+# Incremental cache
+# =========================
+
+def file_hash(path):
+
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def load_manifest(path):
+
+    if not Path(path).exists():
+        return {"results": {}, "metrics": {}, "logs": {}}
+
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def cached_rows(files, manifest, section, parse):
+    """
+    Summary rows per source file, re-parsing only files whose content hash
+    changed since the last build. Entries of deleted files are dropped.
+    """
+
+    cache = manifest.get(section, {})
+    sources = {}
+    rows = []
+    n_parsed = 0
+
+    for f in sorted(files):
+
+        h = file_hash(f)
+        entry = cache.get(f)
+
+        if entry is None or entry["hash"] != h:
+            entry = {"hash": h, "rows": parse(f)}
+            n_parsed += 1
+
+        sources[f] = entry
+        rows.extend(entry["rows"])
+
+    manifest[section] = sources
+
+    return rows, n_parsed
+
+
+def evaluate_results(results_dir, manifest, metrics_dir, logs_dir, workers=None):
+    """
+    Re-run the evaluators on new or changed result files only, refreshing
+    their metrics records and text logs. A file is keyed by its own hash and
+    that of its paired-test reference. Changed files of one method are
+    evaluated together on a process pool. Partial outputs of early-aborted
+    runs are left out.
+    """
+
+    evaluators = {
+        "LM": eval_lm,
+        "MC": eval_mc,
+        "FR": eval_fr,
+    }
+
+    keys = {}
+    changed = {method: [] for method in evaluators}
+
+    for path in sorted(glob.glob(f"{results_dir}/*.jsonl")):
+
+        method = parse_name(path)[0]
+
+        if method not in evaluators or is_aborted(path):
+            continue
+
+        ref = reference_for(path)
+        key = file_hash(path) + (file_hash(ref) if ref else "")
+        keys[path] = key
+
+        metrics_file = Path(metrics_dir) / f"{Path(path).stem}.json"
+
+        if manifest.get("results", {}).get(path) == key and metrics_file.exists():
+            continue
+
+        changed[method].append(path)
+
+    for method, paths in changed.items():
+
+        if not paths:
+            continue
+
+        module = evaluators[method]
+
+        argv = [
+            "--inputs", *paths,
+            "--compare", "auto",
+            "--metrics_dir", metrics_dir,
+            "--logs_dir", logs_dir,
+        ]
+
+        if workers:
+            argv += ["--workers", str(workers)]
+
+        with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
+            module.main(module.build_parser().parse_args(argv))
+
+    manifest["results"] = keys
+
+    return sum(len(paths) for paths in changed.values())
 
 
 # =========================
 # Main
 # =========================
 
-def main():
+def main(args):
+
+    if args.incremental:
+        return main_incremental(args)
 
-    files = glob.glob("logs/*.txt")
+    if args.from_logs:
+        files = glob.glob(f"{args.logs_dir}/*.txt")
+    else:
+        files = live_metrics(glob.glob(f"{args.metrics_dir}/*.json"))
 
     if not files:
-        print("No files found in logs/")
+        print(f"No files found in {args.logs_dir if args.from_logs else args.metrics_dir}/")
         return
 
 
-    rows = []
+    rows = rows_from_logs(files) if args.from_logs else rows_from_metrics(files)
 
 
-    for f in files:
+    build_summary(rows)
 
-        text = Path(f).read_text(encoding="utf-8")
 
-        method, prompt, model, run = parse_name(f)
+def main_incremental(args):
 
+    manifest = load_manifest(args.manifest)
 
-        if "Free Response" in text:
-            data = parse_fr(text)
+    n_evaluated = 0
 
-        elif "MC Evaluation" in text:
-            data = parse_mc(text)
+    if not args.from_logs and Path(args.results_dir).exists():
+        n_evaluated = evaluate_results(
+            args.results_dir, manifest, args.metrics_dir, args.logs_dir, args.workers
+        )
 
-        elif "LM Probing" in text:
-            data = parse_lm(text)
+    if args.from_logs:
+        files = glob.glob(f"{args.logs_dir}/*.txt")
+        rows, n_parsed = cached_rows(files, manifest, "logs", parse_log)
+    else:
+        files = live_metrics(glob.glob(f"{args.metrics_dir}/*.json"))
+        rows, n_parsed = cached_rows(files, manifest, "metrics", lambda f: rows_from_metrics([f]))
 
-        else:
-            print(f"Unknown format: {f}")
-            continue
+    print(f"Evaluated {n_evaluated} result files, parsed {n_parsed}/{len(files)} sources (rest cached)")
 
+    save_manifest(args.manifest, manifest)
 
-        for setting, ability, acc, mtype, margin in data:
+    if not rows:
+        print("No rows to summarize")
+        return
+
+    build_summary(rows)
 
-            rows.append([
-                method,
-                prompt,
-                model,
-                setting,
-                ability,
-                acc,
-                run,
-                mtype,
-                margin
-            ])
 
+def build_summary(rows):
 
     # ---- Build DataFrame ----
 
-    df = pd.DataFrame(rows, columns=[
-        "Method",
-        "Prompt",
-        "Model",
-        "Setting",
-        "Ability",
-        "Accuracy",
-        "Run",
-        "MarginType",
-        "Margin"
-    ])
+    df = pd.DataFrame(rows, columns=COLUMNS)
+
+
+    # Logs print 4 decimals; metrics records keep full precision
+
+    for c in ["Accuracy", "Margin", "CI_Low", "CI_High", "PValue"]:
+        df[c] = pd.to_numeric(df[c]).map(lambda x: float(f"{x:.4f}"), na_action="ignore")
 
 
     # ---- Sorting rules ----
@@ -342,7 +600,7 @@ def main():
 
 
     df = df.sort_values(
-        ["Method", "Prompt", "Setting", "Ability", "Run"]
+        ["Method", "Prompt", "Model", "Setting", "Ability", "Run"]
     )
 
 
@@ -398,4 +656,30 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+
+    parser = argparse.ArgumentParser(
+        description="Build summary_final.csv and fr_avg.csv from evaluation metrics"
+    )
+
+    parser.add_argument("--metrics_dir", default=METRICS_DIR)
+    parser.add_argument("--logs_dir", default="logs")
+
+    parser.add_argument(
+        "--from_logs",
+        action="store_true",
+        help="Legacy: scrape the text logs instead of reading JSON metrics",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-evaluate / re-parse inputs whose content hash changed",
+    )
+
+    parser.add_argument("--results_dir", default="results")
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--workers", type=int, default=None, help="Processes for re-evaluating results")
+
+    args = parser.parse_args()
+
+    main(args)
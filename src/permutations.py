@@ -0,0 +1,209 @@
+# src/permutations.py
+
+import itertools
+from pathlib import Path
+
+import torch
+from torch.profiler import record_function
+
+from answer_forcing import letter_probs, letter_token_ids
+from mc import LETTERS
+
+
+# ============================================================
+# Option Orders
+# ============================================================
+
+# Appended after the assistant marker; the next token is read as the answer letter
+READOUT_SUFFIX = "[["
+
+ALL_ORDERS = list(itertools.permutations(range(len(LETTERS))))
+
+
+def option_orders(n_orders, rng):
+    """
+    Option orderings to evaluate: all 24, or the original order plus a
+    random subset of the others. order[j] is the original option shown at
+    position j.
+    """
+    if n_orders >= len(ALL_ORDERS):
+        return list(ALL_ORDERS)
+
+    return [ALL_ORDERS[0]] + rng.sample(ALL_ORDERS[1:], n_orders - 1)
+
+
+# ============================================================
+# Shared-Prefix Batched Readout
+# ============================================================
+
+def common_prefix_len(seqs):
+
+    n = 0
+
+    for column in zip(*seqs):
+        if any(t != column[0] for t in column[1:]):
+            break
+        n += 1
+
+    return n
+
+
+def readout_letter_ids(tokenizer):
+    return letter_token_ids(tokenizer, READOUT_SUFFIX)
+
+
+def score_prompts(model, tokenizer, prompts, letter_ids, share_prefix=True):
+    """
+    A-D probabilities of the token after each prompt, for prompts that only
+    differ near the end (e.g. the same story with reordered options).
+
+    The shared token prefix runs once; its KV cache is repeated across the
+    batch and only the differing suffixes run, as one right-padded batch.
+    share_prefix=False runs every prompt on its own instead (reference path).
+
+    Returns:
+        probs: (n_prompts, 4) probabilities over the displayed letters
+        mass:  (n_prompts,) total probability on the four letters
+        stats: {prefix_tokens, prompt_tokens (run through the model), naive_tokens (without sharing)}
+    """
+    with record_function("tokenize"):
+        ids = [tokenizer(p).input_ids for p in prompts]
+
+    if not share_prefix:
+        return score_each(model, ids, letter_ids)
+
+    # Every prompt keeps at least one token of its own to read logits from
+    n_prefix = min(common_prefix_len(ids), min(len(x) for x in ids) - 1)
+
+    past_key_values = None
+
+    with record_function("forward"), torch.no_grad():
+
+        if n_prefix > 0:
+            prefix = torch.tensor([ids[0][:n_prefix]], device=model.device)
+            past_key_values = model(input_ids=prefix, use_cache=True).past_key_values
+            past_key_values.batch_repeat_interleave(len(prompts))
+
+        suffixes = [x[n_prefix:] for x in ids]
+        width = max(len(s) for s in suffixes)
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        # Right padding: causal attention keeps pads invisible to the real tokens before them
+        input_ids = torch.tensor(
+            [s + [pad_id] * (width - len(s)) for s in suffixes],
+            device=model.device,
+        )
+        attention_mask = torch.ones(len(prompts), n_prefix + width, dtype=torch.long, device=model.device)
+
+        logits = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+        ).logits
+
+    last = torch.tensor([len(s) - 1 for s in suffixes], device=logits.device)
+
+    with record_function("log_softmax"):
+        probs, mass = letter_probs(logits[torch.arange(len(prompts), device=logits.device), last], letter_ids)
+
+    stats = {
+        "prefix_tokens": n_prefix,
+        "prompt_tokens": n_prefix + len(prompts) * width,
+        "naive_tokens": sum(len(x) for x in ids),
+    }
+
+    return probs.cpu(), mass.cpu(), stats
+
+
+def score_each(model, ids, letter_ids):
+    """score_prompts() with one full forward pass per prompt."""
+
+    logits = []
+
+    with record_function("forward"), torch.no_grad():
+        for x in ids:
+            logits.append(model(input_ids=torch.tensor([x], device=model.device)).logits[0, -1])
+
+    with record_function("log_softmax"):
+        probs, mass = letter_probs(torch.stack(logits), letter_ids)
+
+    n_tokens = sum(len(x) for x in ids)
+    stats = {"prefix_tokens": 0, "prompt_tokens": n_tokens, "naive_tokens": n_tokens}
+
+    return probs.cpu(), mass.cpu(), stats
+
+
+# ============================================================
+# Position Bias
+# ============================================================
+
+def position_bias(rows):
+    """
+    Summary of permutation rows (one per sample x option order) with fields
+    idx, forced_answer and answer (original letters), display_pred and
+    display_answer (displayed positions).
+
+    Returns:
+        accuracy:    permutation-averaged accuracy
+        consistency: mean share of orders agreeing with the sample's most common answer
+        pick_rate:   share of answers given at each displayed position (0.25 = no bias)
+        gold_rate:   share of rows whose gold answer is shown at each position
+        accuracy_by_gold_position: accuracy when the gold answer is shown at each position
+    """
+    if not rows:
+        return {}
+
+    by_sample = {}
+
+    for r in rows:
+        by_sample.setdefault(r["idx"], []).append(r["forced_answer"])
+
+    consistency = sum(
+        max(answers.count(a) for a in set(answers)) / len(answers)
+        for answers in by_sample.values()
+    ) / len(by_sample)
+
+    acc_by_position = {}
+
+    for letter in LETTERS:
+        shown = [r for r in rows if r["display_answer"] == letter]
+        acc_by_position[letter] = (
+            sum(r["forced_answer"] == r["answer"] for r in shown) / len(shown) if shown else None
+        )
+
+    n = len(rows)
+
+    return {
+        "samples": len(by_sample),
+        "rows": n,
+        "accuracy": sum(r["forced_answer"] == r["answer"] for r in rows) / n,
+        "consistency": consistency,
+        "pick_rate": {k: sum(r["display_pred"] == k for r in rows) / n for k in LETTERS},
+        "gold_rate": {k: sum(r["display_answer"] == k for r in rows) / n for k in LETTERS},
+        "accuracy_by_gold_position": acc_by_position,
+    }
+
+
+def print_position_bias(bias):
+
+    print("=" * 60)
+    print("Option Permutations")
+    print("=" * 60)
+    print(f"Samples           : {bias['samples']} ({bias['rows']} orders)")
+    print(f"Perm-avg Accuracy : {bias['accuracy']:.4f}")
+    print(f"Consistency       : {bias['consistency']:.4f}")
+    print()
+    print(f"{'Position':10s}{'Pick Rate':>12s}{'Gold Rate':>12s}{'Acc (gold here)':>18s}")
+
+    for k in LETTERS:
+        acc = bias["accuracy_by_gold_position"][k]
+        acc = f"{acc:.4f}" if acc is not None else "-"
+        print(f"{k:10s}{bias['pick_rate'][k]:12.4f}{bias['gold_rate'][k]:12.4f}{acc:>18s}")
+
+    print("=" * 60)
+
+
+def position_bias_path(output):
+    """<output stem>.position_bias.json next to the generations file."""
+    output = Path(output)
+    return output.with_name(output.stem + ".position_bias.json")
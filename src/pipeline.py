@@ -0,0 +1,148 @@
+# src/pipeline.py
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from tqdm import tqdm
+
+
+# ============================================================
+# Three-Stage Pipeline
+# ============================================================
+
+PIPELINE_DEPTH = 8
+
+_DONE = object()
+
+
+def add_pipeline_args(parser):
+    parser.add_argument(
+        "--pipeline_depth",
+        type=int,
+        default=PIPELINE_DEPTH,
+        help="Samples buffered between stages (0 = run prepare / model / write serially)",
+    )
+
+
+@contextmanager
+def open_output(path):
+    """
+    Results file written as <path>.partial and renamed to `path` only once
+    the block completes, so a crashed run never leaves a truncated results
+    file for the evaluators (the partial file is kept for inspection).
+    """
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+
+    with open(partial, "w", encoding="utf-8") as f:
+        yield f
+
+    os.replace(partial, path)
+
+
+def run_pipeline(items, prepare, infer, write, depth=PIPELINE_DEPTH, total=None, status=None):
+    """
+    Run prepare -> infer -> write over `items`, overlapping the CPU-side stages
+    with the model.
+
+        prepare(item)  background thread   (prompt building, tokenization)
+        infer(job)     calling thread      (model calls)
+        write(job)     background thread   (decoding, json.dumps, file writes)
+
+    Items flow through FIFO queues of at most `depth` entries, so the writer
+    sees results in input order and memory stays bounded. The first exception
+    raised in any stage is re-raised here. depth <= 0 runs the stages serially.
+    `status()` (e.g. running metrics) is shown as the progress bar postfix.
+    """
+    bar = tqdm(total=total if total is not None else len(items))
+
+    def advance():
+        bar.update()
+        if status is not None:
+            bar.set_postfix(status(), refresh=False)
+
+    if depth <= 0:
+        for item in items:
+            write(infer(prepare(item)))
+            advance()
+        bar.close()
+        return
+
+    prepared = queue.Queue(maxsize=depth)
+    finished = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, value):
+        # Give up instead of blocking forever once another stage has failed
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def prepare_stage():
+        try:
+            for item in items:
+                if not put(prepared, prepare(item)):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(prepared, _DONE)
+
+    def write_stage():
+        try:
+            while True:
+                try:
+                    job = finished.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        return
+                    continue
+                if job is _DONE:
+                    return
+                write(job)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    preparer = threading.Thread(target=prepare_stage, name="prepare", daemon=True)
+    writer = threading.Thread(target=write_stage, name="write", daemon=True)
+
+    preparer.start()
+    writer.start()
+
+    try:
+        while not stop.is_set():
+
+            try:
+                job = prepared.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if job is _DONE:
+                break
+
+            if not put(finished, infer(job)):
+                break
+
+            advance()
+
+    except BaseException:
+        stop.set()
+        raise
+
+    finally:
+        put(finished, _DONE)
+        writer.join()
+        bar.close()
+
+    if errors:
+        raise errors[0]
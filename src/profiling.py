@@ -0,0 +1,95 @@
+# src/profiling.py
+
+from functools import partial
+from pathlib import Path
+
+import torch
+from torch.profiler import ProfilerActivity, schedule
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+PROFILE_DIR = "profiles"
+
+
+def add_profile_args(parser):
+    parser.add_argument("--profile", type=int, default=0, help="Profile N samples (after --profile_warmup) and export a trace")
+    parser.add_argument("--profile_warmup", type=int, default=1, help="Samples run under the profiler but not recorded")
+    parser.add_argument("--profile_dir", default=PROFILE_DIR, help="Directory for <output stem>.trace.json / .ops.txt")
+    parser.add_argument("--profile_top", type=int, default=25, help="Operators shown in the top-ops table")
+
+
+# ============================================================
+# Profiler
+# ============================================================
+
+def sort_key():
+    return "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+
+
+def export_profile(prof, out_dir, name, top):
+    """Write the Chrome trace and the top-operators table, and print the table."""
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    trace_path = out_dir / f"{name}.trace.json"
+    ops_path = out_dir / f"{name}.ops.txt"
+
+    prof.export_chrome_trace(str(trace_path))
+
+    table = prof.key_averages().table(sort_by=sort_key(), row_limit=top)
+    ops_path.write_text(table + "\n", encoding="utf-8")
+
+    print("=" * 60)
+    print("Profile")
+    print("=" * 60)
+    print(table)
+    print("Chrome trace saved to:", trace_path)
+    print("Top ops saved to:", ops_path)
+
+
+def start_profiler(args, output):
+    """
+    Profiler over the first samples of a run, or None when --profile is 0.
+
+    Call step_profiler() once after every sample: the first --profile_warmup
+    samples are traced but discarded, the next --profile samples are recorded
+    and exported when the window closes (or at stop_profiler()).
+    """
+    if not args.profile:
+        return None
+
+    activities = [ProfilerActivity.CPU]
+
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+
+    prof = torch.profiler.profile(
+        activities=activities,
+        schedule=schedule(wait=0, warmup=args.profile_warmup, active=args.profile, repeat=1),
+        on_trace_ready=partial(
+            export_profile,
+            out_dir=args.profile_dir,
+            name=Path(output).stem,
+            top=args.profile_top,
+        ),
+        record_shapes=True,
+    )
+
+    prof.start()
+
+    return prof
+
+
+def step_profiler(prof):
+    if prof is not None:
+        prof.step()
+
+
+def stop_profiler(prof):
+    if prof is not None:
+        prof.stop()
+
@@ -0,0 +1,399 @@
+# src/results_index.py
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from data_stream import JsonlStream
+from eval_fr import exact_match, match_generated_to_option
+from mc import aggregate_mc_results, extract_run_answer
+from metrics import norm_ability, parse_name
+from online_metrics import is_aborted
+from parallel import expand_inputs
+from parse_all_logs import file_hash
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+INDEX_DB = ".cache/results_index.sqlite"
+
+METHODS = ["LM", "MC", "FR"]
+
+# One row per prediction: an LM setting, an MC run or vote, an FR answer
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id     INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    method      TEXT,
+    prompt      TEXT,
+    model       TEXT,
+    run         INTEGER,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    hash        TEXT,
+    rows        INTEGER,
+    aborted     INTEGER,
+    ingested    REAL DEFAULT (julianday('now'))
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    file_id       INTEGER NOT NULL REFERENCES files(file_id),
+    method        TEXT,      -- LM / MC / FR
+    prompt        TEXT,      -- base / cot
+    model         TEXT,
+    run           INTEGER,   -- run number of the file (fr_cot_mistral_03 -> 3)
+    run_id        INTEGER,   -- MC run within the file; NULL for votes, 0 for LM / FR
+    setting       TEXT,      -- Raw / Norm (LM), Raw / Vote (MC), EM (FR)
+    idx           INTEGER,   -- sample position in the input data: the cross-method key
+    exp_idx       INTEGER,   -- EXP_IDX, where the result row carries it
+    ability       TEXT,      -- FirstOrder / SecondOrder
+    ability_label TEXT,      -- ABILITY as written in the data
+    pred          TEXT,      -- A-D, NULL if unparsed
+    gold          TEXT,
+    correct       INTEGER,
+    scores        TEXT,      -- JSON: LM option scores, MC run / vote scores
+    line          INTEGER    -- line of the row in the source file
+);
+
+CREATE INDEX IF NOT EXISTS results_idx ON results (idx);
+CREATE INDEX IF NOT EXISTS results_ability ON results (ability, idx);
+CREATE INDEX IF NOT EXISTS results_file ON results (file_id);
+
+-- Covering indexes: per-item comparisons across runs, and accuracy tables
+CREATE INDEX IF NOT EXISTS results_item ON results (method, ability, model, idx, prompt, correct, exp_idx);
+CREATE INDEX IF NOT EXISTS results_group ON results (method, prompt, model, setting, ability, pred, correct);
+"""
+
+COLUMNS = [
+    "file_id", "method", "prompt", "model", "run", "run_id", "setting", "idx", "exp_idx",
+    "ability", "ability_label", "pred", "gold", "correct", "scores", "line",
+]
+
+# MC run fields kept in `scores`
+MC_SCORE_KEYS = ["sequence_logprob", "mean_logprob", "answer_logprob", "forced", "letter_probs", "letter_mass"]
+
+
+# ============================================================
+# Rows per Schema
+# ============================================================
+
+def result_row(meta, run_id, setting, idx, exp_idx, ability, pred, gold, correct, scores, line):
+
+    return (
+        meta["file_id"], meta["method"], meta["prompt"], meta["model"], meta["run"],
+        run_id, setting, idx, exp_idx,
+        norm_ability(ability), ability, pred, gold,
+        int(pred is not None and bool(correct)),
+        json.dumps(scores) if scores is not None else None,
+        line,
+    )
+
+
+def lm_rows(meta, path):
+
+    for line, d in JsonlStream(path, prefetch=0).indexed():
+
+        ability = d.get("ABILITY", "UNKNOWN")
+
+        for setting, scores, pred in [
+            ("Raw", d.get("raw_scores"), d.get("pred_raw")),
+            ("Norm", d.get("normalized_scores"), d.get("pred_norm")),
+        ]:
+            yield result_row(
+                meta, 0, setting, d.get("idx", line), d.get("EXP_IDX"), ability,
+                pred, d["answer"], pred == d["answer"], scores, line,
+            )
+
+
+def mc_rows(meta, path, seed):
+
+    runs = {}
+    exp_idx = {}
+
+    for line, d in JsonlStream(path, prefetch=0).indexed():
+
+        i = d["idx"]
+        letter = extract_run_answer(d)
+        letter = letter if letter in d.get("map", {}) else None
+
+        runs[i] = runs.get(i, 0) + 1
+        exp_idx[i] = (d.get("data") or {}).get("EXP_IDX")
+
+        scores = {k: d[k] for k in MC_SCORE_KEYS if d.get(k) is not None}
+
+        yield result_row(
+            meta, d.get("run_id", 0), "Raw", i, exp_idx[i], d.get("ABILITY", "UNKNOWN"),
+            letter, d.get("answer"), letter == d.get("answer"), scores or None, line,
+        )
+
+    if not runs:
+        return
+
+    # Votes with eval_mc's tie-break seed
+    _, voted = aggregate_mc_results(path, try_times=max(runs.values()), seed=seed)
+
+    for v in voted:
+        yield result_row(
+            meta, None, "Vote", v["idx"], exp_idx.get(v["idx"]), v["ABILITY"], v["pred"], v["gold"], v["correct"],
+            {"confidence": v["confidence"], "gold_share": v["gold_share"]}, None,
+        )
+
+
+def fr_rows(meta, path):
+
+    # FR rows carry their whole-file idx (also under --shard); older files are in input order
+    for line, d in JsonlStream(path, prefetch=0).indexed():
+
+        options = {k: d.get(f"OPTION-{k}", "") for k in ["A", "B", "C", "D"]}
+        pred = match_generated_to_option(d.get("GENARATED_ANSWER", ""), options)
+
+        yield result_row(
+            meta, 0, "EM", d.get("idx", line), d.get("EXP_IDX"), d.get("ABILITY", "UNKNOWN"),
+            pred, d["ANSWER"], pred is not None and exact_match(pred, d["ANSWER"]), None, line,
+        )
+
+
+def file_rows(meta, path, seed):
+
+    if meta["method"] == "LM":
+        return lm_rows(meta, path)
+
+    if meta["method"] == "MC":
+        return mc_rows(meta, path, seed)
+
+    return fr_rows(meta, path)
+
+
+# ============================================================
+# Incremental Ingestion
+# ============================================================
+
+def open_index(path):
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    return conn
+
+
+def ingest(conn, paths, seed=42):
+    """
+    Bring the index up to date with `paths`. A file is re-read only if its
+    size / mtime changed and then its content hash too; its old rows are
+    replaced in one transaction. Abort flags are re-read for every file;
+    indexed files that no longer exist are dropped. Returns {"added", "updated", "unchanged", "removed", "rows"}.
+    """
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "rows": 0}
+
+    known = {
+        path: (file_id, size, mtime_ns, h)
+        for file_id, path, size, mtime_ns, h in conn.execute("SELECT file_id, path, size, mtime_ns, hash FROM files")
+    }
+
+    for path in paths:
+
+        key = str(path)
+        stat = os.stat(path)
+        entry = known.get(key)
+
+        if entry is not None and entry[1:3] == (stat.st_size, stat.st_mtime_ns):
+            counts["unchanged"] += 1
+            continue
+
+        h = file_hash(path)
+
+        with conn:
+
+            if entry is not None and entry[3] == h:
+                conn.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE file_id = ?", (stat.st_size, stat.st_mtime_ns, entry[0]))
+                counts["unchanged"] += 1
+                continue
+
+            if entry is not None:
+                conn.execute("DELETE FROM results WHERE file_id = ?", (entry[0],))
+                conn.execute("DELETE FROM files WHERE file_id = ?", (entry[0],))
+
+            method, prompt, model, run = parse_name(path)
+
+            file_id = conn.execute(
+                "INSERT INTO files (path, method, prompt, model, run, size, mtime_ns, hash, aborted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, method, prompt, model, int(run), stat.st_size, stat.st_mtime_ns, h, int(is_aborted(path))),
+            ).lastrowid
+
+            meta = {"file_id": file_id, "method": method, "prompt": prompt, "model": model, "run": int(run)}
+
+            n = conn.executemany(
+                f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                file_rows(meta, path, seed),
+            ).rowcount
+
+            conn.execute("UPDATE files SET rows = ? WHERE file_id = ?", (n, file_id))
+
+        counts["updated" if entry is not None else "added"] += 1
+        counts["rows"] += n
+
+    # ---------- Abort flags: kept in the .online.json sidecar, which can change on its own ----------
+    with conn:
+        conn.executemany(
+            "UPDATE files SET aborted = ? WHERE path = ?",
+            [(int(is_aborted(path)), str(path)) for path in paths],
+        )
+
+    # ---------- Deleted result files ----------
+    with conn:
+        for key, (file_id, *_) in known.items():
+            if not Path(key).exists():
+                conn.execute("DELETE FROM results WHERE file_id = ?", (file_id,))
+                conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+                counts["removed"] += 1
+
+    # Refresh the planner's statistics once the row counts changed
+    if counts["added"] or counts["updated"] or counts["removed"]:
+        conn.execute("ANALYZE")
+
+    return counts
+
+
+def result_files(patterns):
+    """LM / MC / FR result files (by name) among the expanded inputs, aborted runs included (files.aborted)."""
+    return [p for p in expand_inputs(patterns, skip_aborted=False) if parse_name(p)[0] in METHODS]
+
+
+# ============================================================
+# Queries
+# ============================================================
+
+# Named queries leave early-aborted runs out, as the evaluators do
+LIVE = "file_id NOT IN (SELECT file_id FROM files WHERE aborted)"
+
+QUERIES = {
+    # Accuracy over parsed predictions, as the evaluators count it
+    "accuracy": f"""
+        SELECT method, prompt, model, setting, ability,
+               COUNT(pred) AS n, ROUND(AVG(CASE WHEN pred IS NOT NULL THEN correct END), 4) AS accuracy
+        FROM results
+        WHERE {LIVE}
+        GROUP BY method, prompt, model, setting, ability
+        ORDER BY method, model, setting, ability, prompt
+    """,
+    # Second-order items CoT gets right in every FR run while base FR misses them in at least one
+    "cot_flips": f"""
+        SELECT model, idx, MAX(exp_idx) AS exp_idx,
+               SUM(prompt = 'base' AND correct) AS base_correct, SUM(prompt = 'base') AS base_runs,
+               SUM(prompt = 'cot' AND correct) AS cot_correct, SUM(prompt = 'cot') AS cot_runs
+        FROM results
+        WHERE method = 'FR' AND ability = 'SecondOrder' AND {LIVE}
+        GROUP BY model, idx
+        HAVING cot_runs > 0 AND cot_correct = cot_runs AND base_correct < base_runs
+        ORDER BY model, base_correct, idx
+    """,
+    # Per sample: how each method / prompt / setting does on it, runs pooled
+    "by_item": f"""
+        SELECT idx, ability, method, prompt, setting, COUNT(*) AS runs, SUM(correct) AS correct
+        FROM results
+        WHERE {LIVE}
+        GROUP BY idx, ability, method, prompt, setting
+        ORDER BY idx, method, prompt, setting
+    """,
+}
+
+
+def run_query(conn, query):
+    """(column names, rows, milliseconds) of a named query or SQL text."""
+
+    sql = QUERIES.get(query, query)
+
+    start = time.perf_counter()
+    cursor = conn.execute(sql)
+    rows = cursor.fetchall()
+    ms = (time.perf_counter() - start) * 1000
+
+    return [c[0] for c in cursor.description or []], rows, ms
+
+
+def print_table(columns, rows, limit):
+
+    shown = rows[:limit] if limit else rows
+    cells = [[("" if v is None else str(v)) for v in row] for row in shown]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+    if len(shown) < len(rows):
+        print(f"... {len(rows) - len(shown)} more rows")
+
+
+# ============================================================
+# Main
+# ============================================================
+
+def main(args):
+
+    conn = open_index(args.db)
+
+    if not args.no_update:
+
+        start = time.perf_counter()
+        counts = ingest(conn, result_files(args.inputs), seed=args.seed)
+
+        print(
+            f"Index {args.db}: {counts['added']} added, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged, {counts['removed']} removed "
+            f"({counts['rows']} rows written, {time.perf_counter() - start:.2f}s)"
+        )
+
+    for query in args.query or []:
+
+        columns, rows, ms = run_query(conn, query)
+
+        print()
+        print_table(columns, rows, args.limit)
+        print(f"({len(rows)} rows, {ms:.1f} ms)")
+
+    conn.close()
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        description="Index LM / MC / FR result files into SQLite and query predictions across runs and methods"
+    )
+
+    parser.add_argument("--inputs", nargs="+", default=["results"], help="Result files, directories or glob patterns")
+    parser.add_argument("--db", default=INDEX_DB, help="SQLite index path")
+    parser.add_argument("--seed", type=int, default=42, help="Tie-break seed of the MC votes (as eval_mc)")
+    parser.add_argument("--no_update", action="store_true", help="Query the index as is, without ingesting")
+    parser.add_argument(
+        "--query",
+        nargs="+",
+        default=None,
+        help=f"Named queries ({', '.join(QUERIES)}) or SQL over the results / files tables",
+    )
+    parser.add_argument("--limit", type=int, default=50, help="Rows printed per query (0 = all)")
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
+
+    main(args)
@@ -1,81 +1,257 @@
 # src/run_fr_model.py
 
 import json
+import sys
 import argparse
+import time
 from pathlib import Path
 
 import torch
-from tqdm import tqdm
+from torch.profiler import record_function
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
+from assisted import (
+    add_draft_args, decoding_kwargs, load_draft, print_draft_summary, update_draft_summary,
+)
+from continuous import (
+    ContinuousBatcher, add_continuous_args, check_continuous_args, print_occupancy, run_continuous,
+)
+from data_stream import add_data_args, open_data
+from dry_run import add_dry_run_args, dry_run, load_tokenizer, make_plan, token_lengths
+from eval_fr import exact_match, match_generated_to_option
 from fr import build_fr_prompt
+from gen_cache import add_cache_args, cached_generate, open_cache, run_seed
+from online_metrics import EarlyAbort, OnlineMetrics, add_online_args, print_online
+from pipeline import add_pipeline_args, open_output, run_pipeline
+from profiling import add_profile_args, start_profiler, step_profiler, stop_profiler
+from static_decode import add_static_args, setup_static_decode, static_generate_kwargs
+from telemetry import (
+    now, print_summary, print_warmup, reset_peak_memory, sample_record,
+    summarize, telemetry_path, warmup_summary, write_telemetry,
+)
 
 
 # ============================================================
 # Utils
 # ============================================================
 
-# ---------- Generate Answer ----------
-def generate_answer(model, tokenizer, prompt, max_length=128, top_p=0.9):
-    """ Generate answer from model given prompt. """
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_length=inputs.input_ids.shape[1] + max_length,
-            do_sample=True,
+# ---------- Generate Ids ----------
+def generate_ids(model, tokenizer, inputs, max_length=128, top_p=0.9, seed=None, cache=None,
+                 draft=None, greedy=False, generate_kwargs=None):
+    """ Sample one completion of tokenized `inputs`; returns (output ids, timing stats).
+
+    A seeded call can be served from the generation cache. A `draft` model
+    turns on assisted decoding; `greedy` replaces nucleus sampling.
+    `generate_kwargs` are extra generate() options (e.g. the static cache).
+    """
+    with record_function("generate"), torch.no_grad():
+        outputs, stats = cached_generate(
+            model,
+            inputs,
+            cache=cache,
+            seed=seed,
+            draft=draft,
+            max_new_tokens=max_length,
+            **decoding_kwargs(greedy, top_p),
+            **(generate_kwargs or {}),
             pad_token_id=tokenizer.eos_token_id,
             eos_token_id=tokenizer.eos_token_id,
-            top_p=top_p,
         )
-    generated = tokenizer.decode(outputs[0][inputs.input_ids.shape[1]:], skip_special_tokens=True)
+    return outputs[0], stats
+
+# ---------- Decode Answer ----------
+def decode_answer(tokenizer, output_ids, prompt_len):
+    """ Decode the generated part of `output_ids`. """
+    with record_function("decode"):
+        generated = tokenizer.decode(output_ids[prompt_len:], skip_special_tokens=True)
     return generated.strip()
 
-# ---------- Load Data ----------
-def load_data(path):
-    with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+# ---------- Generate Answer ----------
+def generate_answer(model, tokenizer, prompt, max_length=128, top_p=0.9, seed=None, cache=None):
+    """ Generate answer from model given prompt; also returns timing stats. """
+    with record_function("tokenize"):
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    output_ids, stats = generate_ids(model, tokenizer, inputs, max_length, top_p, seed, cache)
+    return decode_answer(tokenizer, output_ids, inputs.input_ids.shape[1]), stats
+
+
+# ============================================================
+# Dry Run
+# ============================================================
+
+def plan_run(args, tokenizer, data):
+    """Token plan of this run: one prompt and up to --max_length new tokens per sample."""
+    prompts = [build_fr_prompt(d["STORY"], d["QUESTION"], cot=args.cot) for d in data]
+    return make_plan(
+        "FR",
+        len(data),
+        token_lengths(tokenizer, prompts),
+        max_new_tokens=args.max_length,
+        meta={"model": args.model, "cot": args.cot, "output": args.output},
+    )
 
 
 # ============================================================
 # Main
 # ============================================================
 
-def main(args):
-    print("Loading model:", args.model)
-    tokenizer = AutoTokenizer.from_pretrained(args.model)
-    model = AutoModelForCausalLM.from_pretrained(
-        args.model,
-        torch_dtype=torch.float16,
-        device_map="auto",
-    ).eval()
+def main(args, model=None, tokenizer=None):
+    """Run FR generation; `model` / `tokenizer` may be passed in preloaded (e.g. by a sweep)."""
+    if args.dry_run:
+        return dry_run(args, plan_run(args, load_tokenizer(args.model), open_data(args)))
+
+    if model is None:
+        print("Loading model:", args.model)
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model,
+            torch_dtype=torch.float16,
+            device_map="auto",
+        ).eval()
+    check_continuous_args(args)
+    draft = load_draft(args, model)
 
-    data = load_data(args.data)
+    data = open_data(args)
 
     out_path = Path(args.output)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with out_path.open("w", encoding="utf-8") as fout:
-        for i, sample in enumerate(tqdm(data)):
-            story = sample["STORY"]
-            question = sample["QUESTION"]
-            # Build prompt with or without CoT (chain-of-thought)
-            prompt = build_fr_prompt(story, question, cot=args.cot)
-            generated_answer = generate_answer(
-                model, tokenizer, prompt, max_length=args.max_length
-            )
-            result = dict(sample)
-            result["GENARATED_ANSWER"] = generated_answer
+    cache = open_cache(args, model)
+
+    # Static KV cache + compiled decode step, sized per prompt
+    setup_static_decode(args, model)
+
+    online = OnlineMetrics(args, "FR", ["answer"])
+
+    records = []
+    prof = start_profiler(args, out_path)
+    start = time.perf_counter()
+
+    # Stage 1 (background thread): build prompt with or without CoT (chain-of-thought) + tokenize
+    def prepare(item):
+        i, sample = item
+        prompt = build_fr_prompt(sample["STORY"], sample["QUESTION"], cot=args.cot)
+        with record_function("tokenize"):
+            inputs = tokenizer(prompt, return_tensors="pt")
+        static_kwargs = static_generate_kwargs(args, model, inputs.input_ids.shape[1], args.max_length)
+        return {"idx": i, "sample": sample, "inputs": inputs, "static_kwargs": static_kwargs}
+
+    # Stage 2: model
+    def infer(job):
+        reset_peak_memory()
+        sample_start = now()
+        job["output_ids"], stats = generate_ids(
+            model, tokenizer, job["inputs"].to(model.device),
+            max_length=args.max_length, top_p=args.top_p,
+            seed=run_seed(args.seed, job["idx"]), cache=cache,
+            draft=draft, greedy=args.greedy, generate_kwargs=job["static_kwargs"],
+        )
+        records.append(sample_record(job["idx"], now() - sample_start, stats))
+        step_profiler(prof)
+        if cache is not None:
+            cache.commit()
+        return job
+
+    # Stage 3 (background thread): decode + write in order
+    def write(job):
+        result = {"idx": job["idx"], **job["sample"]}
+        result["GENARATED_ANSWER"] = decode_answer(
+            tokenizer, job["output_ids"], job["inputs"].input_ids.shape[1]
+        )
+        with record_function("json write"):
             fout.write(json.dumps(result, ensure_ascii=False) + "\n")
 
-    print("Done.")
+        # Running metrics, matched to an option as eval_fr does
+        options = {k: result.get(f"OPTION-{k}", "") for k in ["A", "B", "C", "D"]}
+        pred = match_generated_to_option(result["GENARATED_ANSWER"], options)
+        online.add(
+            "answer", result.get("ABILITY", "UNKNOWN"), pred,
+            pred is not None and exact_match(pred, result["ANSWER"]),
+        )
+        online.sample_done()
+
+    # Continuous batching: one run per sample, slots refilled with the next sample
+    batcher = None
+    if args.slots:
+        batcher = ContinuousBatcher(
+            model, args.slots,
+            {
+                "max_new_tokens": args.max_length, **decoding_kwargs(args.greedy, args.top_p),
+                "pad_token_id": tokenizer.eos_token_id, "eos_token_id": tokenizer.eos_token_id,
+            },
+            cache=cache,
+        )
+
+    def on_run(job, run_id, output_ids, stats, past_key_values):
+        job["output_ids"], job["stats"] = output_ids, stats
+
+    def on_done(job):
+        records.append(sample_record(job["idx"], now() - job["start"], job["stats"]))
+        step_profiler(prof)
+        if cache is not None:
+            cache.commit()
+
+    # An early abort still finishes the sidecars below, then is re-raised
+    aborted = None
+    with open_output(out_path) as fout:
+        try:
+            if batcher is not None:
+                run_continuous(
+                    batcher, map(prepare, data.indexed()), 1,
+                    lambda job, run_id: run_seed(args.seed, job["idx"]),
+                    on_run, on_done, write, total=len(data), status=online.postfix,
+                )
+            else:
+                run_pipeline(
+                    data.indexed(), prepare, infer, write,
+                    depth=args.pipeline_depth, total=len(data), status=online.postfix,
+                )
+        except EarlyAbort as e:
+            aborted = e
+    online.write()
+
+    stop_profiler(prof)
+    if cache is not None:
+        cache.close()
+
+    wall_s = time.perf_counter() - start
+    summary = summarize(
+        records,
+        wall_s,
+        meta={
+            "model": args.model, "draft_model": args.draft_model, "greedy": args.greedy,
+            "cot": args.cot, "static_cache": args.static_cache, "slots": args.slots,
+        },
+    )
+    if batcher is not None:
+        summary["continuous"] = batcher.summary()
+    if args.static_cache:
+        summary["warmup"] = warmup_summary(records, wall_s)
+    if draft is not None:
+        update_draft_summary(summary, records, model, draft, args.speedup_baseline)
+    tel_path = args.telemetry or telemetry_path(out_path)
+    write_telemetry(tel_path, records, summary)
+    print_summary(summary)
+    if draft is not None:
+        print_draft_summary(summary)
+    if args.static_cache:
+        print_warmup(summary["warmup"])
+    if batcher is not None:
+        print_occupancy(summary["continuous"])
+    print_online(online.summary())
+
+    print(f"Aborted early: {aborted}" if aborted is not None else "Done.")
+    print("Telemetry saved to:", tel_path)
+    print("Online metrics saved to:", online.path)
+    if aborted is not None:
+        raise aborted
 
 
 # ============================================================
 # Entry
 # ============================================================
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(description="Run Free Response model generation")
     parser.add_argument("--model", required=True, help="Model name or path")
     parser.add_argument("--data", required=True, help="Input JSONL data path")
@@ -83,6 +259,29 @@ if __name__ == "__main__":
     parser.add_argument("--cot", action="store_true", help="Use chain-of-thought prompting")
     parser.add_argument("--max_length", type=int, default=128, help="Max generation length")
     parser.add_argument("--top_p", type=float, default=0.9, help="Nucleus sampling top_p value")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Base seed; each sample is seeded from (seed, idx) (default: unseeded, so repeated runs are "
+             "independent samples and never cached)",
+    )
+    parser.add_argument("--telemetry", default=None, help="Per-sample timing JSON (default: <output stem>.telemetry.json)")
+    add_data_args(parser)
+    add_profile_args(parser)
+    add_cache_args(parser)
+    add_pipeline_args(parser)
+    add_draft_args(parser)
+    add_static_args(parser)
+    add_continuous_args(parser)
+    add_online_args(parser)
+    add_dry_run_args(parser)
+    return parser
+
 
-    args = parser.parse_args()
-    main(args)
\ No newline at end of file
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    try:
+        main(args)
+    except EarlyAbort:
+        sys.exit(1)
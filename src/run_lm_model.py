@@ -2,42 +2,81 @@
 
 
 import json
+import sys
 import argparse
+import time
 from pathlib import Path
 
 import torch
-from tqdm import tqdm
+from torch.profiler import record_function
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import numpy as np
 
-from lm import build_lm_prompt, score_options
+from activations import (
+    ActivationWriter, activations_dir, add_activation_args, parse_layers, score_with_states,
+)
+from data_stream import add_data_args, open_data
+from dry_run import add_dry_run_args, dry_run, load_tokenizer, make_plan
+from lm import build_lm_prompt, score_options, tokenize_options
+from onnx_backend import add_backend_args, load_onnx_model
+from online_metrics import EarlyAbort, OnlineMetrics, add_online_args, print_online
+from pipeline import add_pipeline_args, open_output, run_pipeline
+from profiling import add_profile_args, start_profiler, step_profiler, stop_profiler
+from telemetry import (
+    now, print_summary, reset_peak_memory, sample_record,
+    summarize, telemetry_path, write_telemetry,
+)
 
 
 # ============================================================
-# Utils
+# Dry Run
 # ============================================================
 
-# ---------- Load Data ----------
-def load_data(path):
-    with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+def plan_run(args, tokenizer, data):
+    """Token plan of this run: prompt + option and option-only scoring passes, no generation."""
+
+    lengths = []
+
+    for sample in data:
+        choices = [sample[f"OPTION-{k}"] for k in ["A", "B", "C", "D"]]
+        prompt = build_lm_prompt(sample["STORY"], sample["QUESTION"])
+
+        for inputs, _ in tokenize_options(tokenizer, prompt, choices) + tokenize_options(tokenizer, "", choices):
+            lengths.append(inputs.input_ids.shape[1])
+
+    return make_plan("LM", len(data), lengths, meta={"model": args.model, "output": args.output})
 
 
 # ============================================================
 # Main
 # ============================================================
 
-def main(args):
-    print("Loading model:", args.model)
+def main(args, model=None, tokenizer=None):
+    """Run LM probing; `model` / `tokenizer` may be passed in preloaded (e.g. by a sweep)."""
+
+    if args.dry_run:
+        return dry_run(args, plan_run(args, load_tokenizer(args.model), open_data(args)))
+
+    if args.backend == "onnx" and args.activations is not None:
+        raise ValueError("--activations needs --backend torch (hidden states are not exported to ONNX)")
+
+    if args.backend == "onnx":
+        print("Loading ONNX backend:", args.model)
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        model = load_onnx_model(args.model, args.onnx_dir, args.threads)
 
-    tokenizer = AutoTokenizer.from_pretrained(args.model)
-    model = AutoModelForCausalLM.from_pretrained(
-        args.model,
-        torch_dtype=torch.float16,
-        device_map="auto",
-    ).eval()
+    elif model is None:
+        print("Loading model:", args.model)
 
-    data = load_data(args.data)
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model,
+            torch_dtype=torch.float16,
+            device_map="auto",
+        ).eval()
+
+    data = open_data(args)
 
     out_path = Path(args.output)
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -45,66 +84,191 @@ def main(args):
     # Use empty string for unconditional prompt to get baseline scores
     uncond_prompt = ""
 
-    with out_path.open("w", encoding="utf-8") as fout:
+    # ---------- Hidden-state export ----------
+    act_dir = activations_dir(args, out_path)
+    layers = None
+    act_writer = None
+
+    if act_dir is not None:
+        layers = parse_layers(args.layers, model.config.num_hidden_layers)
+        act_writer = ActivationWriter(
+            act_dir,
+            n_samples=len(data),
+            n_options=4,
+            layers=layers,
+            hidden_size=model.config.hidden_size,
+            meta={"model": args.model, "data": args.data},
+        )
+        print(f"Exporting hidden states of {len(layers)} layers to: {act_dir}")
+
+    records = []
+    prof = start_profiler(args, out_path)
+    start = time.perf_counter()
+
+    # ---------- Stage 1: prompts + tokenization (background thread) ----------
+    def prepare(item):
+
+        i, sample = item
+
+        choices = [
+            sample["OPTION-A"],
+            sample["OPTION-B"],
+            sample["OPTION-C"],
+            sample["OPTION-D"],
+        ]
+
+        prompt = build_lm_prompt(sample["STORY"], sample["QUESTION"])
+
+        return {
+            "idx": i,
+            "sample": sample,
+            "choices": choices,
+            "prompt": prompt,
+            "tokenized": tokenize_options(tokenizer, prompt, choices),
+            "uncond_tokenized": tokenize_options(tokenizer, uncond_prompt, choices),
+            "prompt_ids": tokenizer(prompt).input_ids if layers is not None else None,
+        }
 
-        for i, sample in enumerate(tqdm(data)):
+    # ---------- Stage 2: model ----------
+    def infer(job):
 
-            story = sample["STORY"]
-            question = sample["QUESTION"]
+        reset_peak_memory()
+        sample_start = now()
 
-            choices = [
-                sample["OPTION-A"],
-                sample["OPTION-B"],
-                sample["OPTION-C"],
-                sample["OPTION-D"],
-            ]
+        # Raw scores under conditional prompt (+ hidden states from the same passes)
+        if layers is not None:
+            job["raw"], job["question_states"], job["option_states"] = score_with_states(
+                model, job["tokenized"], job["prompt_ids"], layers,
+            )
+        else:
+            job["raw"] = score_options(
+                model, tokenizer, job["prompt"], job["choices"], job["tokenized"],
+                batch=args.batch_options, pad_to=args.pad_to,
+            )
 
-            gold = sample["ANSWER"]
-            ability = sample.get("ABILITY", "UNKNOWN")
-            index = sample.get("INDEX", "UNKNOWN")
+        # Unconditional baseline scores for normalization
+        job["uncond"] = score_options(
+            model, tokenizer, uncond_prompt, job["choices"], job["uncond_tokenized"],
+            batch=args.batch_options, pad_to=args.pad_to,
+        )
 
-            prompt = build_lm_prompt(story, question)
+        # Scoring is prompt-only: every forward pass counts as prefill
+        latency_s = now() - sample_start
+        stats = {
+            "prefill_s": latency_s,
+            "decode_s": 0.0,
+            "prompt_tokens": sum(
+                inputs.input_ids.shape[1]
+                for inputs, _ in job["tokenized"] + job["uncond_tokenized"]
+            ),
+            "generated_tokens": 0,
+        }
+        records.append(sample_record(job["idx"], latency_s, stats))
+        step_profiler(prof)
 
-            # Raw scores under conditional prompt
-            raw_scores, pred_raw_ix = score_options(model, tokenizer, prompt, choices)
+        return job
 
-            # Unconditional baseline scores for normalization
-            uncond_scores, _ = score_options(model, tokenizer, uncond_prompt, choices)
+    # ---------- Stage 3: results + writing (background thread) ----------
+    def write(job):
 
-            # Normalized scores by subtracting unconditional scores
-            normalized_scores = [r - u for r, u in zip(raw_scores, uncond_scores)]
-            pred_norm_ix = int(np.argmax(normalized_scores))
+        sample = job["sample"]
+        raw_scores, pred_raw_ix = job["raw"]
+        uncond_scores, _ = job["uncond"]
 
-            answer_map = dict(zip(["A", "B", "C", "D"], choices))
+        # Normalized scores by subtracting unconditional scores
+        normalized_scores = [r - u for r, u in zip(raw_scores, uncond_scores)]
+        pred_norm_ix = int(np.argmax(normalized_scores))
 
-            result = {
-                "idx": i,
-                "raw_scores": raw_scores,
-                "normalized_scores": normalized_scores,
-                "pred_raw": ["A", "B", "C", "D"][pred_raw_ix],
-                "pred_norm": ["A", "B", "C", "D"][pred_norm_ix],
-                "answer": gold,
-                "map": answer_map,
-                "ABILITY": ability,
-                "INDEX": index,
-                "prompt": prompt,
-                "uncond_prompt": uncond_prompt,
-            }
+        answer_map = dict(zip(["A", "B", "C", "D"], job["choices"]))
 
+        result = {
+            "idx": job["idx"],
+            "raw_scores": raw_scores,
+            "normalized_scores": normalized_scores,
+            "pred_raw": ["A", "B", "C", "D"][pred_raw_ix],
+            "pred_norm": ["A", "B", "C", "D"][pred_norm_ix],
+            "answer": sample["ANSWER"],
+            "map": answer_map,
+            "ABILITY": sample.get("ABILITY", "UNKNOWN"),
+            "INDEX": sample.get("INDEX", "UNKNOWN"),
+            "prompt": job["prompt"],
+            "uncond_prompt": uncond_prompt,
+        }
+
+        with record_function("json write"):
             fout.write(json.dumps(result, ensure_ascii=False) + "\n")
 
-    print("Done.")
+        # Running metrics: the argmax option always parses
+        for series in ["raw", "norm"]:
+            online.add(series, result["ABILITY"], result[f"pred_{series}"], result[f"pred_{series}"] == result["answer"])
+        online.sample_done()
+
+        if act_writer is not None:
+            with record_function("activation write"):
+                act_writer.write(len(act_writer.rows), sample, job["question_states"], job["option_states"], idx=job["idx"])
+
+    online = OnlineMetrics(args, "LM", ["raw", "norm"])
+
+    # An early abort still finishes the sidecars below, then is re-raised
+    aborted = None
+
+    with open_output(out_path) as fout:
+        try:
+            run_pipeline(
+                data.indexed(), prepare, infer, write,
+                depth=args.pipeline_depth, total=len(data), status=online.postfix,
+            )
+        except EarlyAbort as e:
+            aborted = e
+
+    online.write()
+
+    stop_profiler(prof)
+
+    if act_writer is not None:
+        act_writer.close()
+
+    summary = summarize(records, time.perf_counter() - start, meta={"model": args.model, "backend": args.backend})
+    tel_path = args.telemetry or telemetry_path(out_path)
+    write_telemetry(tel_path, records, summary)
+    print_summary(summary)
+    print_online(online.summary())
+
+    print(f"Aborted early: {aborted}" if aborted is not None else "Done.")
+    print("Telemetry saved to:", tel_path)
+    print("Online metrics saved to:", online.path)
+
+    if act_dir is not None:
+        print("Activations saved to:", act_dir)
+
+    if aborted is not None:
+        raise aborted
 
 
 # ============================================================
 # Entry
 # ============================================================
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(description="Run LM probing with raw and normalized scores")
     parser.add_argument("--model", required=True, help="Model name or path")
     parser.add_argument("--data", required=True, help="Input JSONL data path")
     parser.add_argument("--output", required=True, help="Output JSONL file path")
-    args = parser.parse_args()
+    parser.add_argument("--telemetry", default=None, help="Per-sample timing JSON (default: <output stem>.telemetry.json)")
+    add_data_args(parser)
+    add_profile_args(parser)
+    add_pipeline_args(parser)
+    add_activation_args(parser)
+    add_backend_args(parser)
+    add_online_args(parser)
+    add_dry_run_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
 
-    main(args)
\ No newline at end of file
+    try:
+        main(args)
+    except EarlyAbort:
+        sys.exit(1)
@@ -1,27 +1,46 @@
 # src/run_mc_model.py
 
 import json
+import sys
 import argparse
 import random
+import time
 from pathlib import Path
 
 import torch
-from tqdm import tqdm
+from torch.profiler import record_function
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
-from mc import build_mc_prompt
+from answer_forcing import force_answer, is_truncated, prepare_forcing
+from assisted import (
+    add_draft_args, decoding_kwargs, load_draft, print_draft_summary, update_draft_summary,
+)
+from continuous import (
+    ContinuousBatcher, add_continuous_args, check_continuous_args, print_occupancy, run_continuous,
+)
+from data_stream import add_data_args, open_data
+from dry_run import add_dry_run_args, dry_run, load_tokenizer, make_plan, token_lengths
+from gen_cache import add_cache_args, cached_generate, open_cache, run_seed
+from logprobs import forward_token_logprobs, run_logprobs
+from mc import LETTERS, build_mc_prompt, extract_bracket_answer, extract_run_answer, majority_vote
+from online_metrics import EarlyAbort, OnlineMetrics, add_online_args, print_online
+from permutations import (
+    READOUT_SUFFIX, common_prefix_len, option_orders, position_bias, position_bias_path, print_position_bias,
+    readout_letter_ids, score_prompts,
+)
+from pipeline import add_pipeline_args, open_output, run_pipeline
+from profiling import add_profile_args, start_profiler, step_profiler, stop_profiler
+from static_decode import add_static_args, setup_static_decode, static_generate_kwargs
+from telemetry import (
+    merge_stats, now, print_summary, print_warmup, reset_peak_memory, sample_record,
+    summarize, telemetry_path, warmup_summary, write_telemetry,
+)
 
 
 # ============================================================
 # Utils
 # ============================================================
 
-# ---------- Load Data ----------
-def load_data(path):
-    """Load jsonl file."""
-    with open(path, encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
-
 # ---------- Format Chat ----------
 def format_chat(system, user):
     """Format Chat"""
@@ -30,37 +49,350 @@ def format_chat(system, user):
 {user}<|end_of_text|><|assistant|>
 """
 
+# ---------- Sample Runs ----------
+def sample_runs(model, tokenizer, inputs, try_times=5, max_new_tokens=32, top_p=0.9,
+                seeds=None, cache=None, draft=None, greedy=False, generate_kwargs=None,
+                forcing=None):
+    """
+    Sample `try_times` independent completions of tokenized `inputs`.
+
+    With `seeds` (one per run) every run is seeded on its own and can be
+    served from the generation `cache`. A `draft` model turns on assisted
+    decoding; `greedy` replaces nucleus sampling with greedy decoding.
+    `generate_kwargs` are extra generate() options (e.g. the static cache).
+    With `forcing` (from prepare_forcing) every run without an explicit [[X]]
+    answer (typically CoT cut off by the budget) gets an answer-forcing pass
+    on its KV cache.
+
+    Returns:
+        outputs: output token ids per run
+        stats:   timing stats per run
+        forced:  per run {"forced", "truncated"} plus the force_answer() result
+        scores:  per run log-probabilities for weighted voting (see score_run)
+    """
+    outputs = []
+    stats = []
+    forced = []
+    scores = []
+
+    prompt_len = inputs["input_ids"].shape[1]
+    eos_token_id = model.generation_config.eos_token_id or tokenizer.eos_token_id
+
+    for run_id in range(try_times):
+
+        with record_function("generate"), torch.no_grad():
+
+            output_ids, run_stats, past_key_values = cached_generate(
+                model,
+                inputs,
+                cache=cache,
+                seed=seeds[run_id] if seeds else None,
+                draft=draft,
+                return_kv=True,
+                output_logits=True,
+                max_new_tokens=max_new_tokens,
+                **decoding_kwargs(greedy, top_p),
+                **(generate_kwargs or {}),
+                pad_token_id=tokenizer.eos_token_id,
+            )
+
+        run_forced = force_run(
+            model, tokenizer, output_ids[0], prompt_len, max_new_tokens, eos_token_id,
+            forcing, past_key_values, run_stats,
+        )
+
+        del past_key_values
+
+        outputs.append(output_ids[0])
+        stats.append(run_stats)
+        forced.append(run_forced)
+        scores.append(score_run(model, tokenizer, output_ids[0], prompt_len, run_stats, run_forced))
+
+    return outputs, stats, forced, scores
+
+# ---------- Force Run ----------
+def force_run(model, tokenizer, output_ids, prompt_len, max_new_tokens, eos_token_id,
+              forcing, past_key_values, run_stats):
+    """Answer forcing of one finished run (see sample_runs); returns its {"forced", "truncated", ...}."""
+
+    run_forced = {"forced": False}
+
+    if forcing is None:
+        return run_forced
+
+    run_forced["truncated"] = is_truncated(output_ids, prompt_len, max_new_tokens, eos_token_id)
+
+    # Runs that already state [[X]] keep their answer
+    answered = extract_bracket_answer(tokenizer.decode(output_ids[prompt_len:], skip_special_tokens=True))
+
+    if not answered:
+        force_start = now()
+        run_forced.update(force_answer(model, output_ids, forcing, past_key_values))
+        run_stats["force_s"] = now() - force_start
+
+    return run_forced
+
+# ---------- Score Run ----------
+def score_run(model, tokenizer, output_ids, prompt_len, run_stats, forced):
+    """
+    Sequence and answer-letter log-probabilities of one run (see run_logprobs).
+    Token scores come from generate() or the cache; cache entries written
+    without them are rescored in one forward pass.
+    """
+    logprobs = run_stats.pop("token_logprobs", None)
+
+    if logprobs is None:
+        logprobs = forward_token_logprobs(model, output_ids, prompt_len)
+
+    return run_logprobs(tokenizer, output_ids[prompt_len:], logprobs, forced)
+
+# ---------- Decode Run ----------
+def decode_run(tokenizer, output_ids):
+    """Decode one run and keep the assistant part only."""
+
+    with record_function("decode"):
+        text = tokenizer.decode(
+            output_ids,
+            skip_special_tokens=True,
+        )
+
+    # Keep assistant part only
+    if "<|assistant|>" in text:
+        text = text.split("<|assistant|>")[-1].strip()
+
+    return text
+
+# ---------- Generate Runs ----------
+def generate_runs(model, tokenizer, prompt, try_times=5, max_new_tokens=32, top_p=0.9,
+                  seeds=None, cache=None):
+    """Tokenize, sample and decode `try_times` answers for one prompt; also returns per-run timing stats."""
+
+    # ---------- Tokenize ----------
+    with record_function("tokenize"):
+        inputs = tokenizer(
+            prompt,
+            return_tensors="pt",
+        ).to(model.device)
+
+    outputs, stats, _, _ = sample_runs(
+        model, tokenizer, inputs, try_times, max_new_tokens, top_p, seeds, cache,
+    )
+
+    return [decode_run(tokenizer, o) for o in outputs], stats
+
+
+# ============================================================
+# Option Permutations
+# ============================================================
+
+def run_permutations(args, model, tokenizer, data, fout, records, prof):
+    """
+    Score every sample under `args.permutations` option orders, all orders of
+    a sample in one shared-prefix batch, and write one row per (sample, order).
+
+    Rows carry the answer in original letters (`forced_answer`), so eval_mc
+    reports the permutation-averaged accuracy as Raw and the consensus over
+    orders as Vote. Returns the rows for position_bias().
+    """
+    letter_ids = readout_letter_ids(tokenizer)
+    rows = []
+
+
+    # ---------- Stage 1: reordered prompts (background thread) ----------
+    def prepare(item):
+
+        i, sample = item
+
+        choices = [sample[f"OPTION-{k}"] for k in LETTERS]
+        orders = option_orders(args.permutations, random.Random(run_seed(args.seed, i)))
+
+        prompts = [
+            format_chat(*build_mc_prompt(
+                sample["STORY"],
+                sample["QUESTION"],
+                [choices[k] for k in order],
+                cot=args.cot,
+            )) + READOUT_SUFFIX
+            for order in orders
+        ]
+
+        return {
+            "idx": i,
+            "sample": sample,
+            "choices": choices,
+            "orders": orders,
+            "prompts": prompts,
+        }
+
+
+    # ---------- Stage 2: one batched readout per sample ----------
+    def infer(job):
+
+        reset_peak_memory()
+        sample_start = now()
+
+        job["probs"], job["mass"], stats = score_prompts(
+            model, tokenizer, job["prompts"], letter_ids, share_prefix=not args.no_shared_prefix,
+        )
+
+        latency = now() - sample_start
+
+        records.append(sample_record(
+            job["idx"],
+            latency,
+            {"prefill_s": latency, "decode_s": 0.0, "prompt_tokens": stats["prompt_tokens"], "generated_tokens": 0},
+        ))
+
+        step_profiler(prof)
+
+        return job
+
+
+    # ---------- Stage 3: map back to original letters + save ----------
+    def write(job):
+
+        sample = job["sample"]
+        answer_map = dict(zip(LETTERS, job["choices"]))
+
+        for perm_id, (order, probs, mass) in enumerate(zip(job["orders"], job["probs"].tolist(), job["mass"].tolist())):
+
+            shown = max(range(len(LETTERS)), key=probs.__getitem__)
+
+            result = {
+
+                "idx": job["idx"],
+                "run_id": perm_id,
+
+                "output": "",
+                "answer": sample["ANSWER"],
+                "map": answer_map,
+
+                # ===== Permutation readout =====
+                "perm": [LETTERS[k] for k in order],
+                "forced_answer": LETTERS[order[shown]],
+                "display_pred": LETTERS[shown],
+                "display_answer": LETTERS[order.index(LETTERS.index(sample["ANSWER"]))],
+                "letter_probs": {LETTERS[k]: probs[j] for j, k in enumerate(order)},
+                "letter_mass": mass,
+
+                # ===== META =====
+                "ABILITY": sample.get("ABILITY", "UNKNOWN"),
+                "INDEX": sample.get("INDEX", "UNKNOWN"),
+            }
+
+            rows.append(result)
+
+            with record_function("json write"):
+                fout.write(
+                    json.dumps(result, ensure_ascii=False) + "\n"
+                )
+
+
+    run_pipeline(data.indexed(), prepare, infer, write, depth=args.pipeline_depth, total=len(data))
+
+    return rows
+
+
+# ============================================================
+# Dry Run
+# ============================================================
+
+def plan_run(args, tokenizer, data):
+    """
+    Token plan of this run, from the exact prompts it would send. Orders are
+    seeded by whole-file line index, as in the real run (also under --shard).
+    With --force_answer every run is budgeted a forcing pass over its full
+    sequence plus the suffix (the worst case: unanswered and a cache hit).
+    """
+
+    prompts = []
+    shared_tokens = 0
+
+    for i, sample in data.indexed():
+
+        choices = [sample[f"OPTION-{k}"] for k in LETTERS]
+        orders = (
+            option_orders(args.permutations, random.Random(run_seed(args.seed, i)))
+            if args.permutations else [tuple(range(len(LETTERS)))]
+        )
+
+        sample_prompts = [
+            format_chat(*build_mc_prompt(
+                sample["STORY"],
+                sample["QUESTION"],
+                [choices[k] for k in order],
+                cot=args.cot,
+            )) + (READOUT_SUFFIX if args.permutations else "")
+            for order in orders
+        ]
+
+        # Orders of a sample run their shared prefix once (see score_prompts)
+        if args.permutations:
+            ids = [tokenizer(p).input_ids for p in sample_prompts]
+            n_prefix = min(common_prefix_len(ids), min(len(x) for x in ids) - 1)
+            shared_tokens += n_prefix + len(ids) * max(len(x) - n_prefix for x in ids)
+
+        prompts.extend(sample_prompts)
+
+    lengths = token_lengths(tokenizer, prompts)
+    prompt_tokens = shared_tokens if args.permutations else None
+
+    if args.force_answer and not args.permutations:
+        n_suffix = len(prepare_forcing(tokenizer)[0])
+        forcing_tokens = sum(n + args.max_new_tokens + n_suffix for n in lengths)
+        prompt_tokens = args.try_times * (sum(lengths) + forcing_tokens)
+
+    # Permutation mode reads one letter per order and generates nothing
+    return make_plan(
+        "MC",
+        len(data),
+        lengths,
+        runs_per_sample=1 if args.permutations else args.try_times,
+        max_new_tokens=0 if args.permutations else args.max_new_tokens,
+        prompt_tokens=prompt_tokens,
+        meta={"model": args.model, "cot": args.cot, "force_answer": args.force_answer, "output": args.output},
+    )
+
 
 # ============================================================
 # Main
 # ============================================================
 
-def main(args):
+def main(args, model=None, tokenizer=None):
+    """Run MC probing; `model` / `tokenizer` may be passed in preloaded (e.g. by a sweep)."""
 
     # ---------- Reproducibility ----------
     random.seed(args.seed)
     torch.manual_seed(args.seed)
 
+    # ---------- Dry run: tokenizer only ----------
+    if args.dry_run:
+        return dry_run(args, plan_run(args, load_tokenizer(args.model), open_data(args)))
+
     # ---------- Load model ----------
-    print("Loading model:", args.model)
+    if model is None:
+        print("Loading model:", args.model)
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
 
-    tokenizer = AutoTokenizer.from_pretrained(args.model)
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model,
+            torch_dtype=torch.float16,
+            device_map="auto",
+        ).eval()
 
     if tokenizer.pad_token_id is None:
         tokenizer.pad_token = tokenizer.eos_token
 
+    check_continuous_args(args)
 
-    model = AutoModelForCausalLM.from_pretrained(
-        args.model,
-        torch_dtype=torch.float16,
-        device_map="auto",
-    ).eval()
+    draft = load_draft(args, model)
 
 
-    # ---------- Load data ----------
-    data = load_data(args.data)
+    # ---------- Load data (streamed) ----------
+    data = open_data(args)
 
-    print(f"Loaded {len(data)} samples.")
+    print(f"Streaming {data.describe()}.")
 
 
     # ---------- Output ----------
@@ -68,122 +400,341 @@ def main(args):
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
 
-    # ---------- Inference ----------
-    with out_path.open("w", encoding="utf-8") as fout:
+    # ---------- Generation cache ----------
+    cache = open_cache(args, model)
 
-        for i, sample in enumerate(tqdm(data)):
 
-            story = sample["STORY"]
-            question = sample["QUESTION"]
+    # ---------- Answer forcing (two-stage CoT) ----------
+    forcing = prepare_forcing(tokenizer) if args.force_answer else None
 
-            choices = [
-                sample["OPTION-A"],
-                sample["OPTION-B"],
-                sample["OPTION-C"],
-                sample["OPTION-D"],
-            ]
 
-            gold = sample["ANSWER"]
+    # ---------- Static KV cache + compiled decode (sized per prompt) ----------
+    setup_static_decode(args, model)
 
-            # ---------- META ----------
-            ability = sample.get("ABILITY", "UNKNOWN")
-            index = sample.get("INDEX", "UNKNOWN")
 
+    # ---------- Running accuracy / parse rate (runs and votes) ----------
+    online = OnlineMetrics(args, "MC", ["run", "vote"])
+    vote_rng = random.Random(args.seed)
 
-            # ---------- Build prompt ----------
-            system, user = build_mc_prompt(
-                story,
-                question,
-                choices,
-                cot=args.cot,
-            )
 
-            prompt = format_chat(system, user)
+    # ---------- Inference ----------
+    records = []
+    prof = start_profiler(args, out_path)
+    start = time.perf_counter()
+
+
+    # ---------- Stage 1: prompt + tokenization (background thread) ----------
+    def prepare(item):
+
+        i, sample = item
 
+        choices = [
+            sample["OPTION-A"],
+            sample["OPTION-B"],
+            sample["OPTION-C"],
+            sample["OPTION-D"],
+        ]
 
-            # ---------- Tokenize ----------
+        system, user = build_mc_prompt(
+            sample["STORY"],
+            sample["QUESTION"],
+            choices,
+            cot=args.cot,
+        )
+
+        with record_function("tokenize"):
             inputs = tokenizer(
-                prompt,
+                format_chat(system, user),
                 return_tensors="pt",
-            ).to(model.device)
+            )
 
+        static_kwargs = static_generate_kwargs(
+            args, model, inputs.input_ids.shape[1], args.max_new_tokens,
+            reserve=len(forcing[0]) + 1 if forcing is not None else 0,
+        )
 
-            max_new = args.max_new_tokens
+        return {
+            "idx": i,
+            "sample": sample,
+            "choices": choices,
+            "system": system,
+            "user": user,
+            "inputs": inputs,
+            "static_kwargs": static_kwargs,
+        }
 
 
-            # ---------- Multiple runs ----------
-            for run_id in range(args.try_times):
+    # ---------- Stage 2: multiple runs on the model ----------
+    def infer(job):
 
-                with torch.no_grad():
+        reset_peak_memory()
+        sample_start = now()
 
-                    outputs = model.generate(
-                        **inputs,
-                        max_new_tokens=max_new,
-                        do_sample=True,
-                        top_p=args.top_p,
-                        pad_token_id=tokenizer.eos_token_id,
-                    )
+        i = job["idx"]
 
+        job["outputs"], run_stats, job["forced"], job["scores"] = sample_runs(
+            model,
+            tokenizer,
+            job["inputs"].to(model.device),
+            try_times=args.try_times,
+            max_new_tokens=args.max_new_tokens,
+            top_p=args.top_p,
+            seeds=[run_seed(args.seed, i, r) for r in range(args.try_times)],
+            cache=cache,
+            draft=draft,
+            greedy=args.greedy,
+            generate_kwargs=job["static_kwargs"],
+            forcing=forcing,
+        )
+
+        # ---------- Telemetry ----------
+        records.append(
+            sample_record(i, now() - sample_start, merge_stats(run_stats))
+        )
+
+        step_profiler(prof)
+
+        if cache is not None:
+            cache.commit()
+
+        return job
 
-                text = tokenizer.decode(
-                    outputs[0],
-                    skip_special_tokens=True,
-                )
 
+    # ---------- Stage 3: decode + save (background thread) ----------
+    def write(job):
 
-                # Keep assistant part only
-                if "<|assistant|>" in text:
-                    text = text.split("<|assistant|>")[-1].strip()
+        sample = job["sample"]
+        choices = job["choices"]
 
+        # ---------- Answer map ----------
+        answer_map = {
+            "A": choices[0],
+            "B": choices[1],
+            "C": choices[2],
+            "D": choices[3],
+        }
 
-                # ---------- Answer map ----------
-                answer_map = {
-                    "A": choices[0],
-                    "B": choices[1],
-                    "C": choices[2],
-                    "D": choices[3],
-                }
+        letters = []
 
+        for run_id, (output_ids, forced, scores) in enumerate(zip(job["outputs"], job["forced"], job["scores"])):
 
-                # ---------- Save ----------
-                result = {
+            text = decode_run(tokenizer, output_ids)
 
-                    "idx": i,
-                    "run_id": run_id,
+            # ---------- Save ----------
+            result = {
 
-                    "output": text,
-                    "answer": gold,
-                    "map": answer_map,
+                "idx": job["idx"],
+                "run_id": run_id,
 
-                    # ===== META =====
-                    "ABILITY": ability,
-                    "INDEX": index,
+                "output": text,
+                "answer": sample["ANSWER"],
+                "map": answer_map,
 
-                    # ===== Repro =====
-                    "prompt": {
-                        "system": system,
-                        "user": user,
-                    },
+                # ===== META =====
+                "ABILITY": sample.get("ABILITY", "UNKNOWN"),
+                "INDEX": sample.get("INDEX", "UNKNOWN"),
 
-                    # optional
-                    "data": sample,
-                }
+                # ===== Repro =====
+                "prompt": {
+                    "system": job["system"],
+                    "user": job["user"],
+                },
 
+                # optional
+                "data": sample,
+            }
 
+            # ===== Run scores (weighted voting) =====
+            result.update(scores)
+
+            # ===== Answer forcing =====
+            if forcing is not None:
+                result.update({
+                    "truncated": forced["truncated"],
+                    "forced": forced["forced"],
+                    "forced_answer": forced.get("forced_answer"),
+                    "letter_probs": forced.get("letter_probs"),
+                    "letter_mass": forced.get("letter_mass"),
+                })
+
+
+            with record_function("json write"):
                 fout.write(
                     json.dumps(result, ensure_ascii=False) + "\n"
                 )
 
+            # ---------- Online metrics ----------
+            letter = extract_run_answer(result)
+            letter = letter if letter in answer_map else None
+
+            online.add("run", result["ABILITY"], letter, letter == sample["ANSWER"])
+
+            if letter is not None:
+                letters.append(letter)
+
+        vote = majority_vote(letters, vote_rng)
+
+        online.add("vote", sample.get("ABILITY", "UNKNOWN"), vote, vote == sample["ANSWER"])
+        online.sample_done()
+
+
+    # ---------- Continuous batching: runs of all samples share the decode batch ----------
+    batcher = None
+
+    if args.slots:
+        batcher = ContinuousBatcher(
+            model,
+            args.slots,
+            {
+                "max_new_tokens": args.max_new_tokens,
+                **decoding_kwargs(args.greedy, args.top_p),
+                "pad_token_id": tokenizer.eos_token_id,
+                "output_logits": True,
+            },
+            cache=cache,
+        )
+
+    def on_run(job, run_id, output_ids, run_stats, past_key_values):
+
+        job.setdefault("outputs", [None] * args.try_times)
+        job.setdefault("forced", [None] * args.try_times)
+        job.setdefault("run_stats", [None] * args.try_times)
+        job.setdefault("scores", [None] * args.try_times)
+
+        prompt_len = job["inputs"]["input_ids"].shape[1]
+
+        job["outputs"][run_id] = output_ids
+        job["forced"][run_id] = force_run(
+            model, tokenizer, output_ids, prompt_len, args.max_new_tokens,
+            model.generation_config.eos_token_id or tokenizer.eos_token_id,
+            forcing, past_key_values, run_stats,
+        )
+        job["scores"][run_id] = score_run(model, tokenizer, output_ids, prompt_len, run_stats, job["forced"][run_id])
+        job["run_stats"][run_id] = run_stats
+
+    def on_done(job):
+
+        records.append(
+            sample_record(job["idx"], now() - job["start"], merge_stats(job["run_stats"]))
+        )
+
+        step_profiler(prof)
+
+        if cache is not None:
+            cache.commit()
+
+
+    # An early abort still finishes the sidecars below, then is re-raised
+    aborted = None
+
+    with open_output(out_path) as fout:
+
+        try:
+            if args.permutations:
+                bias_rows = run_permutations(args, model, tokenizer, data, fout, records, prof)
+            elif batcher is not None:
+                run_continuous(
+                    batcher,
+                    map(prepare, data.indexed()),
+                    args.try_times,
+                    lambda job, run_id: run_seed(args.seed, job["idx"], run_id),
+                    on_run,
+                    on_done,
+                    write,
+                    total=len(data),
+                    status=online.postfix,
+                )
+            else:
+                run_pipeline(
+                    data.indexed(), prepare, infer, write,
+                    depth=args.pipeline_depth, total=len(data), status=online.postfix,
+                )
+        except EarlyAbort as e:
+            aborted = e
+
+    if not args.permutations:
+        online.write()
+
+
+    stop_profiler(prof)
+
+    if cache is not None:
+        cache.close()
+
 
-    print("Done.")
+    wall_s = time.perf_counter() - start
+
+    summary = summarize(
+        records,
+        wall_s,
+        meta={
+            "model": args.model,
+            "draft_model": args.draft_model,
+            "greedy": args.greedy,
+            "cot": args.cot,
+            "try_times": args.try_times,
+            "static_cache": args.static_cache,
+            "force_answer": args.force_answer,
+            "permutations": args.permutations,
+            "slots": args.slots,
+        },
+    )
+
+    if batcher is not None:
+        summary["continuous"] = batcher.summary()
+
+    if args.static_cache:
+        summary["warmup"] = warmup_summary(records, wall_s)
+
+    if draft is not None:
+        update_draft_summary(summary, records, model, draft, args.speedup_baseline)
+
+    tel_path = args.telemetry or telemetry_path(out_path)
+    write_telemetry(tel_path, records, summary)
+
+    print_summary(summary)
+
+    if draft is not None:
+        print_draft_summary(summary)
+
+    if args.static_cache:
+        print_warmup(summary["warmup"])
+
+    if batcher is not None:
+        print_occupancy(summary["continuous"])
+
+    if not args.permutations:
+        print_online(online.summary())
+
+    # ---------- Position bias ----------
+    if args.permutations:
+        bias = position_bias(bias_rows)
+        bias_path = position_bias_path(out_path)
+
+        with open(bias_path, "w", encoding="utf-8") as f:
+            json.dump(bias, f, indent=2)
+
+        print_position_bias(bias)
+
+    print(f"Aborted early: {aborted}" if aborted is not None else "Done.")
     print("Saved to:", out_path)
+    print("Telemetry saved to:", tel_path)
+
+    if not args.permutations:
+        print("Online metrics saved to:", online.path)
+
+    if args.permutations:
+        print("Position bias saved to:", bias_path)
+
+    if aborted is not None:
+        raise aborted
 
 
 # ============================================================
 # Entry
 # ============================================================
 
-if __name__ == "__main__":
+def build_parser():
 
     parser = argparse.ArgumentParser(
         description="Run MC-Probing with stochastic sampling + majority voting"
@@ -224,6 +775,53 @@ if __name__ == "__main__":
         help="Max new tokens to generate in each run",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--telemetry",
+        default=None,
+        help="Per-sample timing JSON (default: <output stem>.telemetry.json)",
+    )
+
+    parser.add_argument(
+        "--force_answer",
+        action="store_true",
+        help="Two-stage CoT: when a run ends without a [[X]] answer (e.g. cut off by "
+             "--max_new_tokens), read the answer letter after 'Therefore the answer is [[' "
+             "in one extra forward pass on its KV cache",
+    )
+
+    parser.add_argument(
+        "--permutations",
+        type=int,
+        default=0,
+        help="Position-bias mode: read the answer letter directly under N option orders per "
+             "sample (original order + N-1 random ones; 24 = all) instead of sampling; "
+             "orders share one prefix pass and run as one batch",
+    )
+
+    parser.add_argument(
+        "--no_shared_prefix",
+        action="store_true",
+        help="With --permutations, run every order in its own full forward pass (reference path)",
+    )
+
+    add_data_args(parser)
+    add_profile_args(parser)
+    add_cache_args(parser)
+    add_pipeline_args(parser)
+    add_draft_args(parser)
+    add_static_args(parser)
+    add_continuous_args(parser)
+    add_online_args(parser)
+    add_dry_run_args(parser)
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
 
-    main(args)
\ No newline at end of file
+    try:
+        main(args)
+    except EarlyAbort:
+        sys.exit(1)
@@ -1,3 +1,9 @@
+# Whole matrix (resumable, one model load per model, then eval + summary):
+#   python src/sweep.py --config sweep.json
+#
+# FR runs are unseeded, so repeating an FR command gives an independent sample.
+# Seeded runs (--seed N; MC always) can be replayed with --cache .cache/generations.sqlite.
+
 # lm-probing
 python src/run_lm_model.py \
   --model mistralai/Mistral-7B-Instruct-v0.2 \
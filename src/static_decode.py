@@ -0,0 +1,132 @@
+# src/static_decode.py
+
+import math
+
+import torch
+from transformers import CompileConfig, StaticCache
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+CACHE_BUCKET = 128
+
+# Devices generate() compiles the decode step on; elsewhere (CPU) compile_decode_step() does
+COMPILE_DEVICES = ["cuda", "xpu", "neuron", "tpu"]
+
+
+def add_static_args(parser):
+    parser.add_argument("--static_cache", action="store_true", help="Preallocated static KV cache + compiled decode step")
+    parser.add_argument("--compile_mode", default=None, help="torch.compile mode (default: reduce-overhead on CUDA, default elsewhere)")
+    parser.add_argument(
+        "--cache_bucket",
+        type=int,
+        default=CACHE_BUCKET,
+        help="Smallest static cache length; longer prompts get the next doubling of it, so few shapes are compiled",
+    )
+
+
+# ============================================================
+# Static Cache + Compiled Decode
+# ============================================================
+
+def bucket(n, size):
+    """Smallest size * 2**k (k >= 0) that holds n."""
+    return size * 2 ** max(math.ceil(math.log2(n / size)), 0)
+
+
+def static_cache_len(args, model, prompt_len, max_new_tokens, reserve=0):
+    """
+    Static cache length for one prompt: prompt + max_new_tokens + `reserve`
+    (tokens fed after generate(), e.g. answer forcing), rounded up to a
+    --cache_bucket doubling and capped at the model's context length.
+    """
+    needed = prompt_len + max_new_tokens + reserve
+    context = model.config.max_position_embeddings
+
+    if needed > context:
+        raise ValueError(
+            f"Prompt of {prompt_len} tokens + {max_new_tokens} new + {reserve} reserved "
+            f"exceeds the model's context length {context}"
+        )
+
+    return min(bucket(needed, args.cache_bucket), context)
+
+
+def compile_mode(args, model):
+    return args.compile_mode or ("reduce-overhead" if model.device.type == "cuda" else "default")
+
+
+def compile_decode_step(model, mode):
+    """
+    Route the single-token forwards over a static cache through
+    torch.compile(dynamic=False), as generate() does on accelerators; prefill
+    and every other forward (dynamic caches, answer forcing) stay eager.
+    Installed on the model once per compile mode.
+    """
+    if getattr(model.forward, "compile_mode", None) == mode:
+        return
+
+    eager = getattr(model.forward, "eager", model.forward)
+    compiled = torch.compile(eager, mode=mode, dynamic=False)
+
+    def forward(*args, **kwargs):
+
+        input_ids = kwargs.get("input_ids")
+
+        if isinstance(kwargs.get("past_key_values"), StaticCache) and input_ids is not None and input_ids.shape[1] == 1:
+            return compiled(*args, **kwargs)
+
+        return eager(*args, **kwargs)
+
+    forward.eager = eager
+    forward.compile_mode = mode
+    model.forward = forward
+
+
+def setup_static_decode(args, model):
+    """
+    Check the --static_cache options and prepare the compiled decode step:
+    generate() compiles it on COMPILE_DEVICES, compile_decode_step() on CPU.
+    No-op without --static_cache.
+    """
+    if not args.static_cache:
+        return
+
+    if getattr(args, "draft_model", None):
+        raise ValueError("--static_cache cannot be combined with --draft_model")
+
+    mode = compile_mode(args, model)
+
+    if model.device.type not in COMPILE_DEVICES:
+        compile_decode_step(model, mode)
+
+    print(
+        f"Static cache: sized per prompt (prompt + new tokens, rounded up to {args.cache_bucket} x 2^k), "
+        f"compile mode: {mode} on {model.device.type}"
+    )
+
+
+def static_generate_kwargs(args, model, prompt_len, max_new_tokens, reserve=0):
+    """
+    generate() arguments for a static KV cache and a compiled decode step
+    for one prompt, or {} without --static_cache.
+
+    The cache is sized per prompt (see static_cache_len), so no pass over
+    the data is needed first; the doubling buckets keep the number of
+    decode-step shapes, and so of compilations, logarithmic in the longest
+    prompt. Prefill runs eagerly, so prompt lengths do not recompile.
+    """
+    if not args.static_cache:
+        return {}
+
+    kwargs = {
+        "cache_implementation": "static",
+        "max_cache_len": static_cache_len(args, model, prompt_len, max_new_tokens, reserve),
+    }
+
+    if model.device.type in COMPILE_DEVICES:
+        kwargs["compile_config"] = CompileConfig(mode=compile_mode(args, model), dynamic=False)
+
+    return kwargs
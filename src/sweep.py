@@ -0,0 +1,461 @@
+# src/sweep.py
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from dry_run import format_duration
+from online_metrics import EarlyAbort
+
+
+# ============================================================
+# Config
+# ============================================================
+
+SRC = Path(__file__).resolve().parent
+
+SWEEP_CONFIG = "sweep.json"
+DONE_DIR = ".cache/sweep"
+
+RUNNERS = {
+    "lm": "run_lm_model",
+    "mc": "run_mc_model",
+    "fr": "run_fr_model",
+}
+
+# LM scores options under a fixed prompt: no CoT variant, no sampling seed
+COT_METHODS = {"mc", "fr"}
+SEEDED_METHODS = {"mc", "fr"}
+
+DEFAULT_RUNS = {"lm": 1, "mc": 1, "fr": 5}
+
+
+def load_config(path):
+    """
+    Sweep config (JSON):
+
+        models:   {alias: model name or path}
+        datasets: {alias: jsonl path}
+        methods:  ["lm", "mc", "fr"]
+        cot:      [false, true]
+        runs:     {method: runs}       (default lm 1, mc 1, fr 5; run r uses seed + r - 1)
+        seed:     base seed            (default 42)
+        args:     {method: {flag: value}}  extra runner flags, true = bare flag
+        abort:    {flag: value}    early-abort flags for every job, e.g.
+                                   {"abort_parse_rate": 0.5, "abort_after": 50}
+        root:     output root          (default "."; one sub-directory per dataset if several)
+        workers:  model groups run in parallel (default 1)
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    for alias in config["models"]:
+        if "_" in alias:
+            raise ValueError(f"Model alias {alias!r} must not contain '_' (file names are split on it)")
+
+    unknown = set(config.get("methods", RUNNERS)) - set(RUNNERS)
+
+    if unknown:
+        raise ValueError(f"Unknown methods: {sorted(unknown)}")
+
+    return config
+
+
+def to_argv(options):
+    """{flag: value} -> ["--flag", "value", ...]; True is a bare flag, False / None are left out."""
+
+    argv = []
+
+    for flag, value in options.items():
+
+        if value is None or value is False:
+            continue
+
+        argv.append(f"--{flag}")
+
+        if value is True:
+            continue
+
+        if isinstance(value, (list, tuple)):
+            argv.extend(str(v) for v in value)
+        else:
+            argv.append(str(value))
+
+    return argv
+
+
+def job_name(method, cot, model, run, n_runs):
+    """File stem in the repo's naming scheme, e.g. mc_cot_mistral, fr_mistral_03."""
+
+    parts = [method] + (["cot"] if cot else []) + [model]
+
+    if n_runs > 1:
+        parts.append(f"{run:02d}")
+
+    return "_".join(parts)
+
+
+def expand_jobs(config):
+    """Expand the method x cot x run x model x dataset matrix into jobs."""
+
+    root = Path(config.get("root", "."))
+    datasets = config["datasets"]
+    seed = config.get("seed", 42)
+    runs = {**DEFAULT_RUNS, **config.get("runs", {})}
+
+    jobs = []
+
+    for model, model_path in config["models"].items():
+        for dataset, data in datasets.items():
+
+            dataset_root = root / dataset if len(datasets) > 1 else root
+
+            for method in config.get("methods", list(RUNNERS)):
+                for cot in config.get("cot", [False, True]):
+
+                    if cot and method not in COT_METHODS:
+                        continue
+
+                    n_runs = runs[method]
+
+                    for run in range(1, n_runs + 1):
+
+                        name = job_name(method, cot, model, run, n_runs)
+                        output = dataset_root / "results" / f"{name}.jsonl"
+
+                        options = {
+                            "model": model_path,
+                            "data": data,
+                            "output": str(output),
+                            "cot": cot and method in COT_METHODS,
+                            "seed": seed + run - 1 if method in SEEDED_METHODS else None,
+                            **config.get("abort", {}),
+                            **config.get("args", {}).get(method, {}),
+                        }
+
+                        jobs.append({
+                            "name": name,
+                            "method": method,
+                            "model": model,
+                            "model_path": model_path,
+                            "dataset": dataset,
+                            "root": str(dataset_root),
+                            "output": str(output),
+                            "argv": to_argv(options),
+                        })
+
+    return jobs
+
+
+def group_by_model(jobs):
+    """{model path: jobs}, so each model's weights are loaded once."""
+
+    groups = {}
+
+    for job in jobs:
+        groups.setdefault(job["model_path"], []).append(job)
+
+    return groups
+
+
+# ============================================================
+# Resume
+# ============================================================
+
+def file_hash(path):
+
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def job_key(job):
+    """Runner flags + dataset content: a completed job is redone only if either changed."""
+
+    data = job["argv"][job["argv"].index("--data") + 1]
+
+    return hashlib.sha256(
+        json.dumps([job["argv"], file_hash(data)]).encode("utf-8")
+    ).hexdigest()
+
+
+def done_path(job):
+    return Path(job["root"]) / DONE_DIR / f"{job['name']}.json"
+
+
+def is_done(job):
+    """True if the output exists and a marker records the same job key."""
+
+    marker = done_path(job)
+
+    if not Path(job["output"]).exists() or not marker.exists():
+        return False
+
+    with open(marker, encoding="utf-8") as f:
+        return json.load(f)["key"] == job_key(job)
+
+
+def mark_done(job, seconds, aborted=None):
+    """Record a finished job; an early-aborted one is done too (rerun it with --force)."""
+
+    marker = done_path(job)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"key": job_key(job), "argv": job["argv"], "seconds": seconds, "aborted": aborted}, f, indent=2)
+
+
+# ============================================================
+# Execution
+# ============================================================
+
+def load_model(model_path, dtype=torch.float16):
+
+    print("Loading model:", model_path)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        torch_dtype=dtype,
+        device_map="auto",
+    ).eval()
+
+    return model, tokenizer
+
+
+def run_group(model_path, jobs):
+    """
+    Run all jobs of one model in-process on a single copy of its weights.
+    A failing job is reported and skipped; its marker is not written, so the
+    next sweep retries it. A job stopped by an early-abort rule is marked
+    done, so it is not retried. Returns [(name, status, seconds)].
+    """
+    model, tokenizer = load_model(model_path)
+    statuses = []
+
+    for job in jobs:
+
+        print(f"\n>>> {job['dataset']}/{job['name']}")
+
+        runner = importlib.import_module(RUNNERS[job["method"]])
+        start = time.perf_counter()
+
+        try:
+            runner.main(runner.build_parser().parse_args(job["argv"]), model=model, tokenizer=tokenizer)
+        except EarlyAbort as e:
+            # The runner has already reported it and written its sidecars
+            seconds = time.perf_counter() - start
+            mark_done(job, seconds, aborted=str(e))
+            statuses.append((f"{job['dataset']}/{job['name']}", "aborted", seconds))
+            continue
+        except Exception:
+            traceback.print_exc()
+            statuses.append((f"{job['dataset']}/{job['name']}", "failed", time.perf_counter() - start))
+            continue
+
+        seconds = time.perf_counter() - start
+        mark_done(job, seconds)
+        statuses.append((f"{job['dataset']}/{job['name']}", "done", seconds))
+
+    del model
+
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    return statuses
+
+
+def run_groups(groups, workers=1):
+    """Model groups one after another, or on `workers` processes (e.g. one per GPU-sized model)."""
+
+    if workers <= 1 or len(groups) <= 1:
+        return [s for path, jobs in groups.items() for s in run_group(path, jobs)]
+
+    # spawn: CUDA cannot be re-initialized in forked children
+    with ProcessPoolExecutor(max_workers=min(workers, len(groups)), mp_context=get_context("spawn")) as pool:
+        results = pool.map(run_group, list(groups), list(groups.values()))
+        return [s for statuses in results for s in statuses]
+
+
+# ============================================================
+# Dry Run
+# ============================================================
+
+def dry_run_jobs(jobs, rate_profile=None):
+    """Each runner's --dry_run plan (tokenizers only), as one table with totals."""
+
+    extra = ["--dry_run"] + (["--rate_profile", rate_profile] if rate_profile else [])
+    plans = []
+
+    for job in jobs:
+
+        runner = importlib.import_module(RUNNERS[job["method"]])
+
+        with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
+            plans.append(runner.main(runner.build_parser().parse_args(job["argv"] + extra)))
+
+    print("=" * 92)
+    print("Sweep Dry Run")
+    print("=" * 92)
+    print(f"{'Job':36s} {'Samples':>8s} {'Prompt tok':>12s} {'Decode max':>12s} {'Decode exp':>12s} {'Time':>9s}")
+
+    totals = {"prompt_tokens": 0, "decode_budget": 0, "decode_tokens": 0, "wall_s": 0.0}
+    missing = 0
+
+    for job, plan in zip(jobs, plans):
+
+        est = plan.get("estimate")
+
+        if est is None:
+            missing += 1
+
+        totals["prompt_tokens"] += plan["prompt_tokens"]
+        totals["decode_budget"] += plan["decode_budget"]
+        totals["decode_tokens"] += est["decode_tokens"] if est else plan["decode_budget"]
+        totals["wall_s"] += est["wall_s"] if est else 0.0
+
+        print(
+            f"{job['dataset'] + '/' + job['name']:36s} {plan['samples']:8d} {plan['prompt_tokens']:12d} "
+            f"{plan['decode_budget']:12d} {est['decode_tokens'] if est else plan['decode_budget']:12.0f} "
+            f"{format_duration(est['wall_s']) if est else '-':>9s}"
+        )
+
+    print("-" * 92)
+    print(
+        f"{'Total':36s} {'':8s} {totals['prompt_tokens']:12d} {totals['decode_budget']:12d} "
+        f"{totals['decode_tokens']:12.0f} {format_duration(totals['wall_s']):>9s}"
+    )
+
+    if missing:
+        print(f"{missing} job(s) without a rate profile are not in the time total (pass --rate_profile)")
+
+    print("=" * 92)
+
+    return plans
+
+
+# ============================================================
+# Evaluation
+# ============================================================
+
+def evaluate(root, workers=None):
+    """Incremental evaluation + summary build (logs/, metrics/, summary_final.csv) under `root`."""
+
+    cmd = [
+        sys.executable, str(SRC / "parse_all_logs.py"),
+        "--incremental",
+        "--results_dir", "results",
+        "--metrics_dir", "metrics",
+        "--logs_dir", "logs",
+    ]
+
+    if workers:
+        cmd += ["--workers", str(workers)]
+
+    print(f"\n>>> Evaluating {root}")
+
+    subprocess.run(cmd, cwd=root, check=True)
+
+
+# ============================================================
+# Main
+# ============================================================
+
+def main(args):
+
+    config = load_config(args.config)
+    jobs = expand_jobs(config)
+
+    if args.only:
+        jobs = [j for j in jobs if any(k in f"{j['dataset']}/{j['name']}" for k in args.only)]
+
+    pending = [j for j in jobs if args.force or not is_done(j)]
+
+    print(f"Jobs: {len(jobs)} total, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+
+    for job in jobs:
+        state = "run " if job in pending else "skip"
+        print(f"  [{state}] {job['dataset']}/{job['name']}  ({job['model_path']})")
+
+    if args.list:
+        return
+
+    if args.dry_run:
+        dry_run_jobs(pending, args.rate_profile)
+        return
+
+    statuses = []
+
+    if pending:
+        workers = args.workers or config.get("workers", 1)
+        statuses = run_groups(group_by_model(pending), workers)
+
+    failed = [name for name, status, _ in statuses if status == "failed"]
+    aborted = [name for name, status, _ in statuses if status == "aborted"]
+
+    if not args.no_eval:
+        for root in sorted({j["root"] for j in jobs}):
+            evaluate(root, args.eval_workers)
+
+    print("\n" + "=" * 60)
+    print("Sweep")
+    print("=" * 60)
+
+    for name, status, seconds in statuses:
+        print(f"{name:40s} {status:8s} {seconds:10.1f}s")
+
+    print(
+        f"Ran {len(statuses)} jobs, {len(failed)} failed, {len(aborted)} aborted early, "
+        f"{len(jobs) - len(pending)} skipped"
+    )
+    print("=" * 60)
+
+    if failed:
+        sys.exit(1)
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        description="Run the probing matrix from a sweep config, then evaluate and build the summary"
+    )
+
+    parser.add_argument("--config", default=SWEEP_CONFIG, help="Sweep config JSON")
+    parser.add_argument("--workers", type=int, default=None, help="Model groups run in parallel (default: config 'workers' or 1)")
+    parser.add_argument("--eval_workers", type=int, default=None, help="Processes for the evaluators")
+    parser.add_argument("--only", nargs="+", default=None, help="Only jobs whose dataset/name contains one of these strings")
+    parser.add_argument("--force", action="store_true", help="Rerun jobs that are already done")
+    parser.add_argument("--list", action="store_true", help="Print the job plan and exit")
+    parser.add_argument("--no_eval", action="store_true", help="Skip evaluation and the summary build")
+    parser.add_argument("--dry_run", action="store_true", help="Token counts and estimated time of the pending jobs, without loading weights")
+    parser.add_argument("--rate_profile", default=None, help="Telemetry / rate JSON for every job's estimate (default: each job's own earlier telemetry)")
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = build_parser().parse_args()
+
+    main(args)
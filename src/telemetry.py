@@ -0,0 +1,226 @@
+# src/telemetry.py
+
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList
+
+
+# ============================================================
+# Clock & Memory
+# ============================================================
+
+def sync():
+    """Wait for queued CUDA work so wall-clock timings are accurate."""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def now():
+    sync()
+    return time.perf_counter()
+
+
+def reset_peak_memory():
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+
+def peak_memory_mb():
+    """Peak device memory on CUDA (since the last reset), else the process's peak RSS."""
+
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 2 ** 20
+
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+# ============================================================
+# Generation Timing
+# ============================================================
+
+class PrefillTimer(LogitsProcessor):
+    """
+    Timestamps the first logits-processor call of a generate() call.
+
+    generate() calls logits processors once per step, the first time right
+    after the prompt forward pass, so that timestamp splits prefill from decode.
+    Scores are returned unchanged.
+    """
+
+    def __init__(self):
+        self.first = None
+
+    def __call__(self, input_ids, scores):
+        if self.first is None:
+            self.first = now()
+        return scores
+
+
+def timed_generate(model, inputs, **kwargs):
+    """
+    model.generate() plus its timing.
+
+    Returns:
+        outputs: generate() output (ids, or a dict with return_dict_in_generate)
+        stats:   {prefill_s, decode_s, prompt_tokens, generated_tokens}
+    """
+    timer = PrefillTimer()
+
+    start = now()
+    outputs = model.generate(
+        **inputs,
+        logits_processor=LogitsProcessorList([timer]),
+        **kwargs,
+    )
+    end = now()
+
+    first = timer.first or end
+    prompt_tokens = inputs["input_ids"].shape[1]
+    sequences = getattr(outputs, "sequences", outputs)
+
+    stats = {
+        "prefill_s": first - start,
+        "decode_s": end - first,
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": sequences.shape[1] - prompt_tokens,
+    }
+
+    return outputs, stats
+
+
+def merge_stats(stats):
+    """Sum the stats of several generate() calls (e.g. the MC runs of one sample)."""
+    keys = [
+        "prefill_s", "decode_s", "prompt_tokens", "generated_tokens", "cached",
+        "verify_steps", "draft_proposed", "draft_accepted", "force_s",
+    ]
+    return {k: sum(s.get(k, 0) for s in stats) for k in keys}
+
+
+# ============================================================
+# Records
+# ============================================================
+
+def sample_record(idx, latency_s, stats):
+    """One per-sample telemetry row; call after the sample's last model call."""
+
+    tokens = stats["prompt_tokens"] + stats["generated_tokens"]
+
+    return {
+        "idx": idx,
+        "latency_s": latency_s,
+        **stats,
+        "tokens_per_sec": tokens / latency_s if latency_s else 0.0,
+        "decode_tokens_per_sec": (
+            stats["generated_tokens"] / stats["decode_s"] if stats["decode_s"] else 0.0
+        ),
+        "peak_mem_mb": peak_memory_mb(),
+    }
+
+
+def percentiles(values, qs=(50, 95, 99)):
+    values = np.asarray(values, dtype=np.float64)
+
+    if len(values) == 0:
+        return {f"p{q}": 0.0 for q in qs}
+
+    return {f"p{q}": float(np.percentile(values, q)) for q in qs}
+
+
+def summarize(records, wall_s, meta=None):
+    """Latency percentiles and total throughput over all samples of one run."""
+
+    prompt_tokens = sum(r["prompt_tokens"] for r in records)
+    generated_tokens = sum(r["generated_tokens"] for r in records)
+
+    return {
+        **(meta or {}),
+        "samples": len(records),
+        "wall_s": wall_s,
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": generated_tokens,
+        "samples_per_sec": len(records) / wall_s if wall_s else 0.0,
+        "tokens_per_sec": (prompt_tokens + generated_tokens) / wall_s if wall_s else 0.0,
+        "generated_tokens_per_sec": generated_tokens / wall_s if wall_s else 0.0,
+        "latency_s": percentiles([r["latency_s"] for r in records]),
+        "prefill_s": percentiles([r["prefill_s"] for r in records]),
+        "decode_s": percentiles([r["decode_s"] for r in records]),
+        "peak_mem_mb": max((r["peak_mem_mb"] for r in records), default=0.0),
+        "cache_hits": sum(r.get("cached", 0) for r in records),
+    }
+
+
+def warmup_summary(records, wall_s):
+    """First sample (incl. one-off costs such as compilation) vs the steady state after it."""
+
+    if not records:
+        return {}
+
+    first = records[0]
+
+    return {
+        "first_sample_s": first["latency_s"],
+        "steady": summarize(records[1:], max(wall_s - first["latency_s"], 0.0)),
+    }
+
+
+def telemetry_path(output):
+    """Sidecar next to the results file: results/x.jsonl -> results/x.telemetry.json."""
+    output = Path(output)
+    return output.with_name(f"{output.stem}.telemetry.json")
+
+
+def write_telemetry(path, records, summary):
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "samples": records}, f, ensure_ascii=False, indent=2)
+
+
+def print_summary(summary):
+
+    print("=" * 60)
+    print("Telemetry")
+    print("=" * 60)
+
+    print(
+        f"Samples: {summary['samples']}  Wall: {summary['wall_s']:.2f}s  "
+        f"Peak memory: {summary['peak_mem_mb']:.1f} MB  "
+        f"Cache hits: {summary['cache_hits']}"
+    )
+    print(
+        f"Throughput: {summary['samples_per_sec']:.3f} samples/s  "
+        f"{summary['tokens_per_sec']:.1f} tokens/s  "
+        f"({summary['generated_tokens_per_sec']:.1f} generated tokens/s)"
+    )
+
+    print(f"\n{'Latency (s)':12s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+
+    for key, label in [("latency_s", "Total"), ("prefill_s", "Prefill"), ("decode_s", "Decode")]:
+        p = summary[key]
+        print(f"{label:12s} {p['p50']:9.4f} {p['p95']:9.4f} {p['p99']:9.4f}")
+
+    print("=" * 60)
+
+
+def print_warmup(summary):
+
+    steady = summary["steady"]
+
+    print(f"First sample (incl. compile): {summary['first_sample_s']:.2f}s")
+    print(
+        f"Steady state: {steady['samples_per_sec']:.3f} samples/s  "
+        f"{steady['generated_tokens_per_sec']:.1f} generated tokens/s  "
+        f"p50 latency {steady['latency_s']['p50']:.4f}s"
+    )
@@ -0,0 +1,206 @@
+# src/tiny_model.py
+
+import argparse
+import json
+import random
+from pathlib import Path
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from fr import build_fr_prompt
+from lm import build_lm_prompt
+from mc import FORCE_ANSWER_SUFFIX, build_mc_prompt
+
+
+# ============================================================
+# Synthetic Data (shaped like Index4_5_Location.jsonl)
+# ============================================================
+
+NAMES = ["Xiaogang", "Xiaoming", "Xiaohong", "Xiaoli", "Xiaohua", "Xiaojun"]
+ROOMS = ["bedroom", "kitchen", "garden", "office", "classroom", "garage"]
+CONTAINERS = ["handbag", "briefcase", "backpack", "suitcase", "drawer", "basket", "box", "cupboard"]
+OBJECTS = ["cabbage", "apple", "key", "ball", "book", "watch", "scarf", "cookie"]
+
+ABILITY_FIRST = "Belief: Location false beliefs"
+ABILITY_SECOND = "Belief: Location false beliefs Belief: Second-order beliefs"
+
+LETTERS = ["A", "B", "C", "D"]
+
+# Chat markers used by run_mc_model.format_chat; kept as plain (non-special) tokens
+CHAT_TOKENS = [
+    "<|begin_of_text|>",
+    "<|end_of_text|>",
+    "<|system|>",
+    "<|user|>",
+    "<|assistant|>",
+]
+
+
+def synthetic_data(n, seed=0):
+    """First-/second-order location false belief items, alternating INDEX 4 / 5."""
+
+    rng = random.Random(seed)
+    data = []
+
+    for i in range(n):
+
+        a, b = rng.sample(NAMES, 2)
+        room = rng.choice(ROOMS)
+        c1, c2, c3, c4 = rng.sample(CONTAINERS, 4)
+        obj = rng.choice(OBJECTS)
+
+        story = (
+            f"{a} and {b} are wandering in the {room}, they see a {c1}, a {c2}, and a {c3}, "
+            f"they find {obj} in the {c1}, {b} leaves the {room}, {a} moves the {obj} to the {c3}."
+        )
+
+        second = i % 2 == 1
+
+        if second:
+            question = f"After {b} returns to the {room}, where does {a} think {b} will look for the {obj}?"
+        else:
+            question = f"After {b} returns to the {room}, where does {b} look for the {obj}?"
+
+        options = [c1, c2, c3, c4]
+        rng.shuffle(options)
+
+        data.append({
+            "EXP_IDX": i + 1,
+            "ABILITY": ABILITY_SECOND if second else ABILITY_FIRST,
+            "INDEX": 5 if second else 4,
+            "ANSWER": LETTERS[options.index(c1)],
+            "STORY": story,
+            "QUESTION": question,
+            **{f"OPTION-{k}": o.capitalize() for k, o in zip(LETTERS, options)},
+        })
+
+    return data
+
+
+def corpus(data):
+    """Every prompt the runners can build from `data`, used to fit the tokenizer vocabulary."""
+
+    # Imported here: run_mc_model pulls in the full runner
+    from run_mc_model import format_chat
+
+    texts = [" ".join(LETTERS), "[[A]] [[B]] [[C]] [[D]] [A] [B] [C] [D]", FORCE_ANSWER_SUFFIX]
+
+    for d in data:
+
+        choices = [d[f"OPTION-{k}"] for k in LETTERS]
+
+        texts.append(build_lm_prompt(d["STORY"], d["QUESTION"]))
+        texts.extend(choices)
+
+        for cot in (False, True):
+            texts.append(format_chat(*build_mc_prompt(d["STORY"], d["QUESTION"], choices, cot=cot)))
+            texts.append(build_fr_prompt(d["STORY"], d["QUESTION"], cot=cot))
+
+    return texts
+
+
+# ============================================================
+# Tokenizer & Model
+# ============================================================
+
+def build_tokenizer(texts):
+    """Word-level tokenizer fitted on `texts`; prepends BOS like the Llama/Mistral tokenizers."""
+
+    specials = ["<unk>", "<s>", "</s>", "<pad>"]
+    vocab = {tok: i for i, tok in enumerate(specials)}
+
+    pre = pre_tokenizers.Whitespace()
+
+    for text in texts:
+        for word, _ in pre.pre_tokenize_str(text):
+            vocab.setdefault(word, len(vocab))
+
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre
+    tok.post_processor = processors.TemplateProcessing(
+        single="<s> $A",
+        special_tokens=[("<s>", vocab["<s>"])],
+    )
+    tok.decoder = decoders.WordPiece(prefix="##")
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        pad_token="<pad>",
+    )
+    tokenizer.add_tokens(CHAT_TOKENS)
+
+    return tokenizer
+
+
+def build_model(tokenizer, hidden_size=64, num_layers=2, num_heads=4, seed=0):
+    """Randomly initialised Llama-architecture causal LM."""
+
+    torch.manual_seed(seed)
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=num_heads,
+        num_key_value_heads=num_heads,
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+
+    return LlamaForCausalLM(config).eval()
+
+
+def build_tiny(n_samples=20, seed=0):
+    """Synthetic data, tokenizer, main model and a smaller draft model sharing the tokenizer."""
+
+    data = synthetic_data(n_samples, seed=seed)
+    tokenizer = build_tokenizer(corpus(data))
+
+    model = build_model(tokenizer, seed=seed)
+    draft = build_model(tokenizer, hidden_size=32, num_layers=1, num_heads=2, seed=seed + 1)
+
+    return data, tokenizer, model, draft
+
+
+def save_tiny(out_dir, n_samples=20, seed=0):
+    """Write <out_dir>/main, <out_dir>/draft and <out_dir>/data.jsonl for running the CLIs locally."""
+
+    out_dir = Path(out_dir)
+    data, tokenizer, model, draft = build_tiny(n_samples, seed)
+
+    for name, m in [("main", model), ("draft", draft)]:
+        m.save_pretrained(out_dir / name)
+        tokenizer.save_pretrained(out_dir / name)
+
+    with (out_dir / "data.jsonl").open("w", encoding="utf-8") as f:
+        for d in data:
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+
+    return out_dir
+
+
+# ============================================================
+# Entry
+# ============================================================
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Build a tiny random causal LM + tokenizer + synthetic data (no network)"
+    )
+
+    parser.add_argument("--out_dir", required=True)
+    parser.add_argument("--n_samples", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    print("Saved to:", save_tiny(args.out_dir, args.n_samples, args.seed))